@@ -0,0 +1,166 @@
+"""
+Concurrent-connection throughput of config.asgi against config.wsgi.
+
+Seeds a scratch database, logs a user in, then drives the read-heavy pages
+(marketplace, auction list, item detail, purchase history) through each
+application in-process: WSGI from a thread pool sized like a worker pool,
+ASGI from a single event loop with the same number of in-flight requests.
+
+Usage: python benchmarks/asgi_vs_wsgi.py [--concurrency 32] [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def setup_database(path, items):
+    """Point the default database at path, migrate and seed it."""
+    settings.DATABASES['default']['NAME'] = path
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from django.utils import timezone
+    from items.models import Auction, Collection, Item, Purchase
+
+    call_command('migrate', verbosity=0)
+    seller = User.objects.create_user(username='seller', password='bench-pass')
+    buyer = User.objects.create_user(username='buyer', password='bench-pass')
+    collection = Collection.objects.create(owner=seller, name='Bench collection')
+    Item.objects.bulk_create(
+        Item(collection=collection, name=f'Item {i}', value=i, is_for_sale=True, sale_price=i + 1)
+        for i in range(items)
+    )
+    first = Item.objects.first()
+    for item in Item.objects.all()[:20]:
+        Auction.objects.create(
+            item=item, seller=seller, starting_price=1, current_price=1,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+        Purchase.objects.create(item=item, buyer=buyer, price_paid=1, status='completed')
+
+    client = Client()
+    client.login(username='buyer', password='bench-pass')
+    paths = ['/marketplace/', '/auctions/', f'/items/{first.pk}/', '/purchases/']
+    return paths, f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+
+def wsgi_request(application, path, cookie):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_COOKIE': cookie,
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    status = []
+    start = time.perf_counter()
+    response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    b''.join(response)
+    response.close()
+    return int(status[0].split()[0]), time.perf_counter() - start
+
+
+async def asgi_request(application, path, cookie):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 12345),
+    }
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return status[0], time.perf_counter() - start
+
+
+def run_wsgi(paths, cookie, concurrency, total):
+    from config.wsgi import application
+    targets = itertools.islice(itertools.cycle(paths), total)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda path: wsgi_request(application, path, cookie), targets))
+        return results, time.perf_counter() - start
+
+
+def run_asgi(paths, cookie, concurrency, total):
+    from config.asgi import application
+    targets = list(itertools.islice(itertools.cycle(paths), total))
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(path):
+            async with semaphore:
+                return await asgi_request(application, path, cookie)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(path) for path in targets))
+        return results, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def report(name, results, elapsed):
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status >= 400)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f'{name:<6}{len(results) / elapsed:>10.0f}{errors:>8}'
+        f'{statistics.median(latencies) * 1000:>10.1f}{p95 * 1000:>10.1f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, cookie = setup_database(os.path.join(tmp, 'bench.sqlite3'), args.items)
+        print(f'{args.requests} requests, {args.concurrency} concurrent, {args.items} items')
+        print(f"{'app':<6}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}")
+        report('wsgi', *run_wsgi(paths, cookie, args.concurrency, args.requests))
+        report('asgi', *run_asgi(paths, cookie, args.concurrency, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Cold-start cost of a config.wsgi worker.
+
+Starts fresh interpreters that import config.wsgi and serve two requests,
+with and without running config.warmup first, and reports the median time
+spent importing the application, warming up, and on the first and second
+request.
+One extra run records -X importtime to list the slowest startup imports.
+
+Import-time regressions are tracked against a baseline file: --save
+writes the current numbers and the set of modules loaded by startup and
+the first request, --baseline compares against it and exits with status 1
+when import time or first-request latency grew by more than --tolerance,
+listing any modules that are newly loaded.
+
+Usage: python benchmarks/cold_start.py [--runs 5] [--save FILE | --baseline FILE]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+from benchmarks.asgi_vs_wsgi import setup_database  # noqa: E402
+
+
+# Runs in the child interpreter; prints one JSON line of timings.
+CHILD = r'''
+import io, json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.environ['BENCH_ROOT'])
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = os.environ['BENCH_DB']
+settings_loaded = time.perf_counter()
+
+settings.WARMUP_ON_START = False
+from config.wsgi import application
+imported = time.perf_counter()
+if os.environ['BENCH_WARMUP'] == 'True':
+    from config.warmup import warm_up
+    warm_up()
+warmed = time.perf_counter()
+
+def request(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+        'HTTP_COOKIE': os.environ['BENCH_COOKIE'], 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    }
+    status = []
+    start = time.perf_counter()
+    response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+    b''.join(response)
+    response.close()
+    assert status[0].startswith('200'), status
+    return time.perf_counter() - start
+
+first = request(os.environ['BENCH_PATH'])
+modules = sorted(sys.modules)
+second = request(os.environ['BENCH_PATH'])
+print(json.dumps({
+    'settings': settings_loaded - started,
+    'import': imported - settings_loaded,
+    'warmup': warmed - imported,
+    'first': first,
+    'second': second,
+    'modules': modules,
+}))
+'''
+
+
+def run_child(env, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    result = subprocess.run(command + ['-c', CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, limit):
+    """Parse -X importtime output into the modules with the most self time."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(own), int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def median_of(runs, key):
+    return statistics.median(run[key] for run in runs)
+
+
+def compare(current, baseline, tolerance):
+    """Print regressions against baseline; return True if any."""
+    regressed = False
+    for key in ('import', 'first'):
+        before, after = baseline[key], current[key]
+        if after > before * (1 + tolerance):
+            print(f'REGRESSION {key}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms')
+            regressed = True
+    new_modules = sorted(set(current['modules']) - set(baseline['modules']))
+    if new_modules:
+        top_level = sorted({name.split('.')[0] for name in new_modules})
+        print(f"{len(new_modules)} modules newly loaded before the first response: {', '.join(top_level)}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/marketplace/')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a new baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'bench.sqlite3')
+        _, cookie = setup_database(db, items=200)
+        env = dict(os.environ, BENCH_ROOT=ROOT, BENCH_DB=db, BENCH_COOKIE=cookie, BENCH_PATH=args.path)
+
+        print(f'{args.runs} cold starts per mode, first request {args.path}')
+        print(f"{'warm-up':<9}{'settings':>10}{'import':>10}{'warm-up':>10}{'first':>10}{'second':>10}  (ms)")
+        results = {}
+        for warmup in ('False', 'True'):
+            runs = [run_child(dict(env, BENCH_WARMUP=warmup))[0] for _ in range(args.runs)]
+            results[warmup] = runs
+            print(
+                f"{'on' if warmup == 'True' else 'off':<9}"
+                + ''.join(f'{median_of(runs, key) * 1000:>10.1f}'
+                          for key in ('settings', 'import', 'warmup', 'first', 'second'))
+            )
+
+        _, stderr = run_child(dict(env, BENCH_WARMUP='False'), importtime=True)
+        print('\nslowest imports (self / cumulative ms):')
+        for own, cumulative, name in slowest_imports(stderr, args.top):
+            print(f'{own / 1000:>8.1f}{cumulative / 1000:>10.1f}  {name}')
+
+    cold = results['False']
+    current = {
+        'import': median_of(cold, 'import'),
+        'first': median_of(cold, 'first'),
+        'modules': cold[0]['modules'],
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=1)
+        print(f'\nbaseline written to {args.save}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+        print('no import-time regression')
+
+
+if __name__ == '__main__':
+    main()
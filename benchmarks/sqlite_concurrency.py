@@ -0,0 +1,124 @@
+"""
+Concurrency benchmark for the SQLite production profile.
+
+Runs reader and writer processes against a scratch database, once with
+SQLite's defaults and once with the production PRAGMAs and BEGIN IMMEDIATE
+transactions, and reports throughput and "database is locked" errors.
+
+Usage: python benchmarks/sqlite_concurrency.py [--readers 4] [--writers 4] [--seconds 5]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.sqlite.base import DEFAULT_PRAGMAS  # noqa: E402
+
+
+PROFILES = {
+    'default': {'pragmas': {}, 'begin': 'BEGIN'},
+    'production': {'pragmas': DEFAULT_PRAGMAS, 'begin': 'BEGIN IMMEDIATE'},
+}
+
+
+def connect(path, profile):
+    conn = sqlite3.connect(path, timeout=1.0, isolation_level=None)
+    for name, value in PROFILES[profile]['pragmas'].items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def setup(path, profile, rows=2000):
+    conn = connect(path, profile)
+    conn.execute('CREATE TABLE bid (id INTEGER PRIMARY KEY, auction_id INTEGER, amount REAL)')
+    conn.execute('CREATE INDEX bid_auction ON bid (auction_id)')
+    conn.executemany(
+        'INSERT INTO bid (auction_id, amount) VALUES (?, ?)',
+        ((i % 50, float(i)) for i in range(rows)),
+    )
+    conn.close()
+
+
+def reader(path, profile, deadline, results):
+    conn = connect(path, profile)
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            conn.execute('SELECT MAX(amount), COUNT(*) FROM bid WHERE auction_id = ?', (ops % 50,)).fetchone()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(('read', ops, errors))
+
+
+def writer(path, profile, deadline, results):
+    conn = connect(path, profile)
+    begin = PROFILES[profile]['begin']
+    ops = errors = 0
+    while time.time() < deadline:
+        try:
+            conn.execute(begin)
+            # Read-then-write, like placing a bid on the current price.
+            auction_id = ops % 50
+            (amount,) = conn.execute('SELECT MAX(amount) FROM bid WHERE auction_id = ?', (auction_id,)).fetchone()
+            conn.execute('INSERT INTO bid (auction_id, amount) VALUES (?, ?)', (auction_id, (amount or 0) + 1))
+            conn.execute('COMMIT')
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+    results.put(('write', ops, errors))
+
+
+def run(profile, readers, writers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        setup(path, profile)
+        results = multiprocessing.Queue()
+        deadline = time.time() + seconds
+        procs = [
+            multiprocessing.Process(target=reader, args=(path, profile, deadline, results))
+            for _ in range(readers)
+        ] + [
+            multiprocessing.Process(target=writer, args=(path, profile, deadline, results))
+            for _ in range(writers)
+        ]
+        for proc in procs:
+            proc.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in procs:
+            kind, ops, errors = results.get()
+            totals[kind][0] += ops
+            totals[kind][1] += errors
+        for proc in procs:
+            proc.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile')
+    print(f"{'profile':<12}{'reads/s':>12}{'read errs':>12}{'writes/s':>12}{'write errs':>12}")
+    for profile in PROFILES:
+        totals = run(profile, args.readers, args.writers, args.seconds)
+        print(
+            f"{profile:<12}"
+            f"{totals['read'][0] / args.seconds:>12.0f}{totals['read'][1]:>12}"
+            f"{totals['write'][0] / args.seconds:>12.0f}{totals['write'][1]:>12}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""
+ASGI config for collections project.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+from config.warmup import warm_up_if_enabled
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+application = get_asgi_application()
+
+warm_up_if_enabled()
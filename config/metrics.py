@@ -0,0 +1,339 @@
+"""
+Application metrics in Prometheus text format.
+
+MetricsMiddleware counts responses and observes latency per URL name in
+fixed-bucket histograms, with the number of database queries each route
+ran. Cache hits and misses and marketplace events (bids, offers,
+purchases) are counted too. Updates are a dict lookup under a lock.
+
+Each process keeps its own registry and, when METRICS_DIR is set, writes
+a snapshot to METRICS_DIR/<pid>-<start time>.json every
+METRICS_FLUSH_INTERVAL seconds; /metrics sums the snapshots of all worker
+processes, including ones that have exited. Clear the directory when the
+server (re)starts.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+# Upper bounds in seconds; the same in every process so snapshots add up.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, label names)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP responses by route, method and status.', ('route', 'method', 'status')),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling requests by route.', ('route',)),
+    'db_queries_total': ('counter', 'Database queries run while handling requests, by route.', ('route',)),
+    'cache_requests_total': ('counter', 'Cache lookups by result (hit or miss).', ('result',)),
+    'marketplace_bids_total': ('counter', 'Bids placed.', ()),
+    'marketplace_offers_total': ('counter', 'Offers made.', ()),
+    'marketplace_purchases_total': ('counter', 'Completed purchases.', ()),
+    'marketplace_purchase_value_total': ('counter', 'Amount paid in completed purchases.', ()),
+}
+
+_queries = contextvars.ContextVar('metrics_queries', default=None)
+_install_lock = threading.Lock()
+_installed = False
+
+
+class Registry:
+    """Counters and histograms of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self._pid = None
+        self._started = None
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        """Record value in the histogram: per-bucket counts, then sum and count."""
+        key = (name, tuple(labels))
+        index = bisect_left(LATENCY_BUCKETS, value)
+        with self._lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(entry)] for (name, labels), entry in self.histograms.items()],
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def file_name(self):
+        """
+        Name of this process's snapshot file.
+
+        The pid alone could be reused by a later worker, which would then
+        overwrite the totals of the one that exited, so the process start
+        time is part of the name.
+        """
+        pid = os.getpid()
+        if self._pid != pid:  # First call, or in a worker forked since.
+            self._pid, self._started = pid, time.time_ns() // 1000
+        return f'{pid}-{self._started}.json'
+
+    def flush(self, directory=None):
+        """Write this process's snapshot to directory/<file_name()>."""
+        directory = directory or getattr(settings, 'METRICS_DIR', None)
+        self.last_flush = time.monotonic()
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.file_name())
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+    def flush_due(self):
+        return time.monotonic() - self.last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+    def maybe_flush(self):
+        if self.flush_due():
+            self.flush()
+
+
+registry = Registry()
+
+
+def collect(directory=None):
+    """Sum the snapshots of all processes; this one's is taken live."""
+    directory = directory or getattr(settings, 'METRICS_DIR', None)
+    snapshots = [registry.snapshot()]
+    own = registry.file_name()
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.json') and name != own:
+                try:
+                    with open(os.path.join(directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Being replaced or truncated; it is counted next scrape.
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, entry in snapshot['histograms']:
+            key = (name, tuple(labels))
+            total = histograms.setdefault(key, [0] * len(entry))
+            for i, value in enumerate(entry):
+                total[i] += value
+    return counters, histograms
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(counters, histograms):
+    """Format metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(label_names, labels)} {value}')
+            continue
+        for (metric, labels), entry in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), entry):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(label_names, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(label_names, labels)} {entry[-2]}')
+            lines.append(f'{name}_count{format_labels(label_names, labels)} {entry[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def count_query(execute, sql, params, many, context):
+    holder = _queries.get()
+    if holder is not None:
+        holder[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _watch_connection(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def _count_cache(get):
+    missing = object()
+
+    def counted_get(self, key, default=None, version=None):
+        value = get(self, key, missing, version)
+        if value is missing:
+            registry.inc('cache_requests_total', ('miss',))
+            return default
+        registry.inc('cache_requests_total', ('hit',))
+        return value
+    counted_get.metrics_counted = True
+    return counted_get
+
+
+def _on_commit_inc(*names_and_amounts):
+    def record():
+        for name, amount in names_and_amounts:
+            registry.inc(name, amount=amount)
+    transaction.on_commit(record)
+
+
+def _bid_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _on_commit_inc(('marketplace_bids_total', 1))
+
+
+def _offer_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        _on_commit_inc(('marketplace_offers_total', 1))
+
+
+def _purchase_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.status == 'completed':
+        _on_commit_inc(
+            ('marketplace_purchases_total', 1),
+            ('marketplace_purchase_value_total', float(instance.price_paid)),
+        )
+
+
+def install():
+    """Hook query, cache and marketplace counting. Safe to call more than once."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        connection_created.connect(_watch_connection, dispatch_uid='metrics_watch_connection')
+        for connection in connections.all(initialized_only=True):
+            _watch_connection(connection)
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if not getattr(backend.get, 'metrics_counted', False):
+                backend.get = _count_cache(backend.get)
+        post_save.connect(_bid_saved, sender=apps.get_model('items', 'Bid'), dispatch_uid='metrics_bid')
+        post_save.connect(_offer_saved, sender=apps.get_model('items', 'Offer'), dispatch_uid='metrics_offer')
+        post_save.connect(
+            _purchase_saved, sender=apps.get_model('items', 'Purchase'), dispatch_uid='metrics_purchase'
+        )
+        atexit.register(registry.flush)
+        _installed = True
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unmatched>'
+    if match.namespace:
+        return match.namespace  # admin: one series, not one per model page
+    return match.url_name or match.view_name
+
+
+def record_request(request, response, elapsed, queries):
+    route = route_of(request)
+    registry.inc('http_requests_total', (route, request.method, response.status_code))
+    registry.observe('http_request_duration_seconds', (route,), elapsed)
+    if queries:
+        registry.inc('db_queries_total', (route,), queries)
+
+
+class MetricsMiddleware:
+    """
+    Count requests, queries and latency per route when METRICS_ENABLED is on.
+
+    Works in sync and async stacks. Queries run by sync code called from
+    an async view are counted too, as sync_to_async copies the context.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if getattr(settings, 'METRICS_ENABLED', True):
+            install()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+        holder = [0]
+        token = _queries.set(holder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        record_request(request, response, time.perf_counter() - start, holder[0])
+        registry.maybe_flush()
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+        holder = [0]
+        token = _queries.set(holder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        record_request(request, response, time.perf_counter() - start, holder[0])
+        if registry.flush_due():
+            # Writes the snapshot file: keep it off the event loop.
+            await sync_to_async(registry.flush)()
+        return response
+
+
+def metrics_view(request):
+    """Expose the metrics of all processes to allowed addresses or token holders."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    allowed = (
+        request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+        or token and request.META.get('HTTP_AUTHORIZATION') == f'Bearer {token}'
+    )
+    if not allowed:
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(render(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
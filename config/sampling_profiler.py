@@ -0,0 +1,307 @@
+"""
+Sampling profiler for live requests.
+
+A staff user profiles one request by sending "X-Profile: 1" or adding
+?_profile=1. While it runs, a background thread records the request
+thread's stack every SAMPLING_PROFILER['interval'] seconds, and every
+SQL query is timed. Two files are written to SAMPLING_PROFILER['dir']:
+
+    requests/<id>.collapsed   one "frame;frame;frame count" line per stack,
+                              the input of flamegraph.pl or speedscope
+    requests/<id>.json        the request, its duration and SQL timeline
+
+The profile id is returned in an X-Profile-Id header. With 'sample_rate'
+set to N, one request in N per process is also profiled into fleet/,
+where the oldest profiles are removed past 'max_files' or 'max_bytes'.
+Profiles are listed and downloaded by staff at /_profiling/samples/.
+
+Under ASGI the request has no thread of its own to sample: the event
+loop runs many requests at once. Async requests therefore only get their
+.json, with the queries timed on the thread their database calls run in.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import FileResponse, Http404, JsonResponse
+
+
+KINDS = ('requests', 'fleet')
+
+_counter_lock = threading.Lock()
+_counter = 0
+
+
+def options():
+    return {
+        'dir': os.path.join(settings.BASE_DIR, 'var', 'profiles'),
+        'interval': 0.005,
+        'sample_rate': 0,
+        'max_files': 500,
+        'max_bytes': 50 * 1024 * 1024,
+        'max_queries': 2000,
+        **getattr(settings, 'SAMPLING_PROFILER', {}),
+    }
+
+
+def frame_label(code):
+    filename = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """Count the stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root  # Frames at and below the root are left out.
+        self.stacks = {}
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and frame is not self.root:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = frame_label(code)
+            stack.append(label)
+            frame = frame.f_back
+        if stack:
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+class QueryTimeline:
+    """Start offset and duration of each SQL query, relative to the request."""
+
+    def __init__(self, started, limit):
+        self.started = started
+        self.limit = limit
+        self.queries = []
+        self.dropped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < self.limit:
+                self.queries.append({
+                    'alias': context['connection'].alias,
+                    'start_ms': round((start - self.started) * 1000, 3),
+                    'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+                    'sql': sql,
+                    'many': many,
+                })
+            else:
+                self.dropped += 1
+
+
+def asks_for_profile(request):
+    return request.META.get('HTTP_X_PROFILE') == '1' or request.GET.get('_profile') == '1'
+
+
+def watch_queries(timeline):
+    """Time the queries of this thread's connections until the returned stack is closed."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(timeline))
+    return stack
+
+
+def requested_by_staff(request):
+    if not asks_for_profile(request):
+        return False
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def sampled(rate):
+    """Return True for one call in rate (never when rate is 0)."""
+    global _counter
+    if rate <= 0:
+        return False
+    with _counter_lock:
+        _counter += 1
+        return _counter % rate == 0
+
+
+def profile_id():
+    return f'{time.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:8]}'
+
+
+def save_profile(directory, name, sampler, timeline, meta):
+    """Write the profile files; sampler is None for async requests, which get no .collapsed."""
+    os.makedirs(directory, exist_ok=True)
+    if sampler is not None:
+        with open(os.path.join(directory, f'{name}.collapsed'), 'w') as f:
+            f.write(sampler.collapsed())
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump({
+            **meta,
+            'samples': sampler.samples if sampler is not None else 0,
+            'interval_ms': sampler.interval * 1000 if sampler is not None else None,
+            'queries': timeline.queries,
+            'dropped_queries': timeline.dropped,
+        }, f, indent=1)
+
+
+def prune(directory, max_files, max_bytes):
+    """Remove the oldest profiles until at most max_files and max_bytes remain."""
+    profiles = {}
+    for entry in os.scandir(directory):
+        name = entry.name.rsplit('.', 1)[0]
+        files, size = profiles.setdefault(name, ([], [0]))
+        files.append(entry.path)
+        size[0] += entry.stat().st_size
+    names = sorted(profiles)  # Ids start with a timestamp.
+    total = sum(size[0] for _, size in profiles.values())
+    while names and (len(names) > max_files or total > max_bytes):
+        files, size = profiles[names.pop(0)]
+        for path in files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size[0]
+
+
+class SamplingProfilerMiddleware:
+    """Profile requests asked for by staff, and one in 'sample_rate' of all requests."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = options()
+        if requested_by_staff(request):
+            kind = 'requests'
+        elif sampled(config['sample_rate']):
+            kind = 'fleet'
+        else:
+            return self.get_response(request)
+        started = time.perf_counter()
+        sampler = StackSampler(threading.get_ident(), config['interval'], root=sys._getframe())
+        timeline = QueryTimeline(started, config['max_queries'])
+        with watch_queries(timeline):
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+        elapsed = time.perf_counter() - started
+        return self.save(request, response, config, kind, elapsed, sampler, timeline)
+
+    async def __acall__(self, request):
+        config = options()
+        # request.user loads from the session (a sync DB call); only do it when asked.
+        if asks_for_profile(request) and await sync_to_async(requested_by_staff)(request):
+            kind = 'requests'
+        elif sampled(config['sample_rate']):
+            kind = 'fleet'
+        else:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        timeline = QueryTimeline(started, config['max_queries'])
+        # Connections are per thread: wrap those of the thread sync_to_async runs queries in.
+        stack = await sync_to_async(watch_queries)(timeline)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        elapsed = time.perf_counter() - started
+        return await sync_to_async(self.save)(request, response, config, kind, elapsed, None, timeline)
+
+    def save(self, request, response, config, kind, elapsed, sampler, timeline):
+        name = profile_id()
+        directory = os.path.join(config['dir'], kind)
+        save_profile(directory, name, sampler, timeline, {
+            'id': name,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+        })
+        if kind == 'fleet':
+            prune(directory, config['max_files'], config['max_bytes'])
+        else:
+            response['X-Profile-Id'] = name
+        return response
+
+
+@staff_member_required
+def sampled_profiles(request):
+    """List stored profiles, newest first, without their SQL timelines."""
+    root = options()['dir']
+    profiles = []
+    for kind in KINDS:
+        directory = os.path.join(root, kind)
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta['kind'] = kind
+            meta['query_count'] = len(meta.pop('queries', ()))
+            profiles.append(meta)
+    profiles.sort(key=lambda meta: meta['id'], reverse=True)
+    return JsonResponse({'profiles': profiles})
+
+
+@staff_member_required
+def sampled_profile_file(request, kind, name, extension):
+    """Download one stored profile file."""
+    if kind not in KINDS:
+        raise Http404
+    path = os.path.join(options()['dir'], kind, f'{name}.{extension}')
+    if not os.path.isfile(path):
+        raise Http404
+    content_type = 'application/json' if extension == 'json' else 'text/plain; charset=utf-8'
+    return FileResponse(open(path, 'rb'), content_type=content_type, filename=f'{name}.{extension}')
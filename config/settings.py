@@ -29,10 +29,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.staticfiles.StaticFilesMiddleware',
+    'config.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'config.template_profiler.TemplateProfilerMiddleware',
+    'config.sampling_profiler.SamplingProfilerMiddleware',
+    'config.traffic.TrafficCaptureMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +60,54 @@ TEMPLATES = [
     },
 ]
 
+# Production template profile: compiled templates are kept in memory by the
+# cached loader instead of being re-read and re-parsed on every render.
+TEMPLATE_PROFILE = os.getenv('TEMPLATE_PROFILE', 'default')
+
+if TEMPLATE_PROFILE == 'production':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Per-request timing of templates, blocks, includes and {% url %} tags; the
+# slowest nodes are reported to staff (see config/template_profiler.py).
+TEMPLATE_PROFILING = os.getenv('TEMPLATE_PROFILING', 'False') == 'True'
+TEMPLATE_PROFILING_TOP = 5
+
+# Sampling profiler (see config/sampling_profiler.py): staff profile a
+# request with "X-Profile: 1" or ?_profile=1; with sample_rate N, one
+# request in N per process is also profiled into a directory capped at
+# max_files profiles and max_bytes.
+SAMPLING_PROFILER = {
+    'dir': os.getenv('SAMPLING_PROFILER_DIR', str(BASE_DIR / 'var' / 'profiles')),
+    'interval': 0.005,
+    'sample_rate': int(os.getenv('SAMPLING_PROFILER_SAMPLE_RATE', '0')),
+    'max_files': 500,
+    'max_bytes': 50 * 1024 * 1024,
+    'max_queries': 2000,
+}
+
+# Traffic capture (see config/traffic.py): sanitized request metadata is
+# appended to rotating JSONL files in dir, one per process, for
+# python manage.py replay_traffic.
+TRAFFIC_CAPTURE = {
+    'enabled': os.getenv('TRAFFIC_CAPTURE', 'False') == 'True',
+    'dir': os.getenv('TRAFFIC_CAPTURE_DIR', str(BASE_DIR / 'var' / 'traffic')),
+    'max_bytes': 10 * 1024 * 1024,
+    'backup_count': 5,
+}
+
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Resolve URLs and compile templates when a worker loads the application,
+# before it serves traffic; persistent DB connections are opened after the
+# fork by the gunicorn post_fork hook (see config/warmup.py).
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'True') == 'True'
 
 DATABASES = {
     'default': {
@@ -64,6 +116,35 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile: WAL journaling, tuned PRAGMAs on every connection
+# and BEGIN IMMEDIATE write transactions (see config/sqlite/base.py).
+DB_PROFILE = os.getenv('DB_PROFILE', 'default')
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'config.sqlite',
+        # Keep connections (and their page cache) across requests.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a connection waits on a locked database before raising.
+            'timeout': float(os.getenv('SQLITE_TIMEOUT', '20')),
+            'pragmas': {
+                'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-64000')),
+                'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', '268435456')),
+            },
+        },
+    })
+
+# Bounded exponential backoff for write paths hitting "database is locked"
+# (see items/db.py).
+DB_WRITE_RETRY = {
+    'attempts': 5,
+    'base_delay': 0.05,
+    'max_delay': 1.0,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -91,6 +172,22 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Production static profile: collectstatic writes content-hashed names plus
+# gzip/brotli variants, and StaticFilesMiddleware serves them from the app
+# with far-future cache headers (see config/staticfiles.py).
+STATIC_PROFILE = os.getenv('STATIC_PROFILE', 'default')
+STATIC_SERVE = os.getenv('STATIC_SERVE', str(STATIC_PROFILE == 'production')) == 'True'
+
+if STATIC_PROFILE == 'production':
+    STORAGES = {
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        },
+        'staticfiles': {
+            'BACKEND': 'config.staticfiles.CompressedManifestStaticFilesStorage',
+        },
+    }
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -99,3 +196,86 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Cache shared by all worker processes (rate limits, facet counts): Redis
+# when REDIS_URL is set, otherwise files under CACHE_DIR. A per-process
+# in-memory cache would multiply every rate limit by the number of workers.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / 'var' / 'cache')),
+        }
+    }
+
+# Requests per client (logged-in user, or address when anonymous) allowed
+# on write endpoints, as 'count/period' with period s, m, h or d, optionally
+# prefixed by a multiple ('100/15m'). Checked before the view runs (see
+# items/ratelimit.py).
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMITS = {
+    'bid': '20/m',
+    'item_post': '10/m',
+    'add_to_cart': '60/m',
+}
+
+# Seconds before marketplace price analytics are reloaded (see items/analytics.py).
+MARKET_ANALYTICS_TTL = int(os.getenv('MARKET_ANALYTICS_TTL', '300'))
+
+# Seconds marketplace facet counts are cached per search (see items/facets.py).
+MARKETPLACE_FACET_TTL = int(os.getenv('MARKETPLACE_FACET_TTL', '30'))
+
+# Deleted collections are hidden at once and purged in chunks of this many
+# rows per transaction, pausing between chunks (see items/cleanup.py).
+COLLECTION_PURGE_IN_BACKGROUND = True
+COLLECTION_PURGE_CHUNK_SIZE = 500
+COLLECTION_PURGE_PAUSE = 0.05
+
+# Outbox worker (python manage.py run_outbox): events claimed per batch,
+# attempts before giving up, retry backoff bounds and claim lease in
+# seconds (see items/outbox.py).
+OUTBOX = {
+    'batch_size': 100,
+    'max_attempts': 10,
+    'base_delay': 1.0,
+    'max_delay': 600.0,
+    'lease': 300,
+}
+
+# "Similar items" shown on item pages: neighbours kept per item, minimum
+# cosine similarity and where build_similar_items saves the TF-IDF index
+# used for incremental updates (see items/similarity.py).
+SIMILAR_ITEMS = {
+    'k': 8,
+    'min_score': 0.1,
+    'index_path': os.getenv('SIMILAR_ITEMS_INDEX', str(BASE_DIR / 'var' / 'similar_items.npz')),
+}
+
+# Collection zip exports (see items/archive.py): collections with up to
+# stream_max_items items and stream_max_bytes of images are streamed to
+# the browser; larger ones are built in dir by the outbox worker. A request
+# still pending after pending_timeout seconds can be made again.
+COLLECTION_ARCHIVE = {
+    'dir': os.getenv('COLLECTION_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'archives')),
+    'stream_max_items': 2000,
+    'stream_max_bytes': 200 * 1024 * 1024,
+    'pending_timeout': 3600,
+}
+
+# Prometheus metrics at /metrics (see config/metrics.py). With several
+# worker processes set METRICS_DIR to a directory they share, emptied on
+# deploy; /metrics is served to METRICS_ALLOWED_IPS or to requests
+# carrying "Authorization: Bearer <METRICS_TOKEN>". No address is allowed
+# by default: behind a proxy on the same host every client is 127.0.0.1.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
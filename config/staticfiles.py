@@ -0,0 +1,200 @@
+"""
+Fingerprinted, precompressed static files.
+
+CompressedManifestStaticFilesStorage extends collectstatic to write gzip
+and brotli variants next to every hashed file, and StaticFilesMiddleware
+serves STATIC_ROOT directly from the Django process with encoding
+negotiation and far-future caching of hashed names, so small deployments
+need no separate web server.
+"""
+
+import gzip
+import json
+import mimetypes
+import os
+import posixpath
+from urllib.parse import unquote, urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip variants are still written
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.txt', '.json', '.xml', '.html', '.md'}
+MIN_COMPRESS_SIZE = 256
+# Variants are only kept when they save at least this fraction of the size.
+MIN_COMPRESS_RATIO = 0.95
+
+# Encodings we can serve, best first, with the suffix of their variant.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+
+def compress_file(path):
+    """Write .gz and .br variants of a file; return the paths written."""
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data) * MIN_COMPRESS_RATIO:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also precompresses every collected file."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        # Later passes may rewrite a file, so compress once at the end.
+        processed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                processed_names.add(name)
+                if hashed_name:
+                    processed_names.add(hashed_name)
+        if dry_run:
+            return
+        for name in sorted(processed_names):
+            if self.exists(name):
+                compress_file(self.path(name))
+
+
+def parse_accept_encoding(header):
+    """Return the set of encodings the client accepts (q > 0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """
+    Serve files from STATIC_ROOT before the rest of the stack.
+
+    Enabled with STATIC_SERVE. Names listed in the manifest as hashed are
+    cached for a year as immutable; anything else gets a short max-age.
+    Place it right after SecurityMiddleware. Works in sync and async
+    stacks, so ASGI requests stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._immutable_names = None
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.static_response(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        path = self.static_path(request)
+        if path is not None:
+            # stat(), open() and the manifest read block: keep them off the event loop.
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request, path)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def static_path(self, request):
+        """Return the path below STATIC_URL of a request to serve, or None to pass it on."""
+        if getattr(settings, 'STATIC_SERVE', False) and request.method in ('GET', 'HEAD'):
+            prefix = urlparse(settings.STATIC_URL).path
+            if request.path.startswith(prefix):
+                return request.path[len(prefix):]
+        return None
+
+    def static_response(self, request):
+        """Return the response for a file under STATIC_URL, or None to pass the request on."""
+        path = self.static_path(request)
+        return None if path is None else self.serve(request, path)
+
+    def immutable_names(self):
+        """Hashed names from the collectstatic manifest, loaded once."""
+        if self._immutable_names is None:
+            try:
+                with open(os.path.join(settings.STATIC_ROOT, 'staticfiles.json')) as f:
+                    self._immutable_names = set(json.load(f).get('paths', {}).values())
+            except (OSError, ValueError):
+                self._immutable_names = set()
+        return self._immutable_names
+
+    def serve(self, request, path):
+        name = posixpath.normpath(unquote(path)).lstrip('/')
+        if not name or name.startswith('..'):
+            return None
+        try:
+            full_path = safe_join(str(settings.STATIC_ROOT), name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(full_path):
+            return None
+
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding, variant = None, full_path
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(full_path + suffix):
+                encoding, variant = coding, full_path + suffix
+                break
+
+        stat = os.stat(variant)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        if name in self.immutable_names():
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = DEFAULT_CACHE_CONTROL
+
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(full_path)
+            response = FileResponse(open(variant, 'rb'), content_type=content_type or 'application/octet-stream')
+            # FileResponse names the download after the open file; assets are not downloads.
+            response.headers.pop('Content-Disposition', None)
+            response['Content-Length'] = stat.st_size
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Vary'] = 'Accept-Encoding'
+        return response
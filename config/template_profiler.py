@@ -0,0 +1,213 @@
+"""
+Template rendering profiler.
+
+When TEMPLATE_PROFILING is on, every request records how long each
+template, {% include %}, {% block %} and {% url %} took to render, both
+inclusive and exclusive of nested nodes. The slowest nodes of a request
+are sent in a Server-Timing header to staff users, and per-process totals
+are exposed as JSON to staff at /_profiling/templates/.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.template import base, defaulttags, loader_tags
+
+
+_current = contextvars.ContextVar('template_profile', default=None)
+_install_lock = threading.Lock()
+_installed = False
+
+
+class RenderProfile:
+    """Timings of the nodes rendered during one request."""
+
+    def __init__(self):
+        self.timings = {}
+        self._children = []
+
+    @contextmanager
+    def measure(self, kind, name):
+        start = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            entry = self.timings.setdefault((kind, name), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += elapsed - nested
+
+    def slowest(self, limit):
+        """Return the nodes with the most exclusive time, slowest first."""
+        rows = [
+            {'kind': kind, 'name': name, 'count': count, 'total_ms': total * 1000, 'self_ms': own * 1000}
+            for (kind, name), (count, total, own) in self.timings.items()
+        ]
+        return sorted(rows, key=lambda row: row['self_ms'], reverse=True)[:limit]
+
+
+class ProfileRegistry:
+    """Per-process totals across all profiled requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.timings = {}
+
+    def add(self, profile):
+        with self.lock:
+            self.requests += 1
+            for key, (count, total, own) in profile.timings.items():
+                entry = self.timings.setdefault(key, [0, 0.0, 0.0, 0.0])
+                entry[0] += count
+                entry[1] += total
+                entry[2] += own
+                entry[3] = max(entry[3], own)
+
+    def report(self, limit):
+        with self.lock:
+            rows = [
+                {
+                    'kind': kind,
+                    'name': name,
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'self_ms': round(own * 1000, 3),
+                    'max_self_ms': round(worst * 1000, 3),
+                }
+                for (kind, name), (count, total, own, worst) in self.timings.items()
+            ]
+            requests = self.requests
+        rows.sort(key=lambda row: row['self_ms'], reverse=True)
+        return {'requests': requests, 'nodes': rows[:limit]}
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.timings = {}
+
+
+registry = ProfileRegistry()
+
+
+def _timed(kind, name_of, render):
+    def wrapper(self, context):
+        profile = _current.get()
+        if profile is None:
+            return render(self, context)
+        with profile.measure(kind, name_of(self)):
+            return render(self, context)
+    wrapper.__wrapped__ = render
+    return wrapper
+
+
+def _template_name(template):
+    return (template.origin and template.origin.template_name) or template.name or '<string>'
+
+
+def _include_name(node):
+    template = node.template
+    return str(getattr(template, 'var', template))
+
+
+def install():
+    """Wrap the timed node types. Safe to call more than once."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        base.Template._render = _timed('template', _template_name, base.Template._render)
+        loader_tags.BlockNode.render = _timed('block', lambda node: node.name, loader_tags.BlockNode.render)
+        loader_tags.IncludeNode.render = _timed('include', _include_name, loader_tags.IncludeNode.render)
+        defaulttags.URLNode.render = _timed(
+            'url', lambda node: str(node.view_name.var), defaulttags.URLNode.render
+        )
+        _installed = True
+
+
+def shows_timings(request):
+    """Return True when the response may carry the Server-Timing header."""
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or (user is not None and user.is_staff)
+
+
+def server_timing(profile):
+    return ', '.join(
+        f'{row["kind"]};desc="{row["name"]}";dur={row["self_ms"]:.2f}'
+        for row in profile.slowest(getattr(settings, 'TEMPLATE_PROFILING_TOP', 5))
+    )
+
+
+class TemplateProfilerMiddleware:
+    """
+    Profile template rendering of each request when TEMPLATE_PROFILING is on.
+
+    Works in sync and async stacks: templates rendered in sync_to_async
+    threads are timed too, as the profile travels in the copied context.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not getattr(settings, 'TEMPLATE_PROFILING', False):
+            return self.get_response(request)
+        install()
+        profile = RenderProfile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        if profile.timings:
+            registry.add(profile)
+            if shows_timings(request):
+                response['Server-Timing'] = server_timing(profile)
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'TEMPLATE_PROFILING', False):
+            return await self.get_response(request)
+        install()
+        profile = RenderProfile()
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        if profile.timings:
+            registry.add(profile)
+            # The user is loaded lazily, with a query.
+            if await sync_to_async(shows_timings)(request):
+                response['Server-Timing'] = server_timing(profile)
+        return response
+
+
+@staff_member_required
+def template_profile_report(request):
+    """Return the slowest template nodes of this process as JSON."""
+    if request.GET.get('reset') == '1':
+        registry.reset()
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        limit = 50
+    return JsonResponse(registry.report(limit))
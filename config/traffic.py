@@ -0,0 +1,277 @@
+"""
+Traffic capture and replay.
+
+When TRAFFIC_CAPTURE['enabled'] is on, TrafficCaptureMiddleware appends
+one JSON line per request to TRAFFIC_CAPTURE['dir']/traffic-<pid>.jsonl:
+route, method, path, query and form parameters, user id, status and
+duration. Values of parameters whose names look secret (passwords,
+tokens, CSRF, ...) are replaced by REDACTED, long values are cut and
+uploaded files are only named. Files rotate at 'max_bytes', keeping
+'backup_count' old ones.
+
+The replay_traffic command sends a captured log to a running instance
+seeded with the same data, from a pool of threads or processes, and
+reports throughput, error rate and latency percentiles per route.
+"""
+
+import glob
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from logging.handlers import RotatingFileHandler
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+
+REDACTED = '[redacted]'
+SENSITIVE = re.compile(r'pass|token|secret|csrf|auth|session|key|card|iban|email', re.IGNORECASE)
+MAX_VALUE_LENGTH = 256
+
+_handlers_lock = threading.Lock()
+_handlers = {}
+
+
+def options():
+    return {
+        'enabled': False,
+        'dir': os.path.join(settings.BASE_DIR, 'var', 'traffic'),
+        'max_bytes': 10 * 1024 * 1024,
+        'backup_count': 5,
+        'exclude': ('/static/', '/media/', '/admin/', '/metrics', '/_profiling/'),
+        **getattr(settings, 'TRAFFIC_CAPTURE', {}),
+    }
+
+
+def sanitize_value(name, value):
+    if SENSITIVE.search(name):
+        return REDACTED
+    if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+        return value[:MAX_VALUE_LENGTH]
+    return value
+
+
+def sanitize(params):
+    """Return {name: [values]} of a QueryDict with secret values redacted."""
+    return {name: [sanitize_value(name, value) for value in values] for name, values in params.lists()}
+
+
+def sanitize_json(data):
+    if isinstance(data, dict):
+        return {name: REDACTED if SENSITIVE.search(name) else sanitize_json(value) for name, value in data.items()}
+    if isinstance(data, list):
+        return [sanitize_json(value) for value in data]
+    if isinstance(data, str) and len(data) > MAX_VALUE_LENGTH:
+        return data[:MAX_VALUE_LENGTH]
+    return data
+
+
+def capture_handler(directory, max_bytes, backup_count):
+    """Return the rotating file handler of this process for directory."""
+    key = (directory, os.getpid())
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is None:
+            os.makedirs(directory, exist_ok=True)
+            handler = _handlers[key] = RotatingFileHandler(
+                os.path.join(directory, f'traffic-{os.getpid()}.jsonl'),
+                maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True,
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+        return handler
+
+
+def describe(request, response, started, elapsed):
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    entry = {
+        'ts': round(started, 6),
+        'route': match.view_name if match else None,
+        'method': request.method,
+        'path': request.path,
+        'query': sanitize(request.GET),
+        'user_id': user.pk if user is not None and user.is_authenticated else None,
+        'status': response.status_code,
+        'duration_ms': round(elapsed * 1000, 3),
+    }
+    if request.method not in ('GET', 'HEAD'):
+        if request.content_type == 'application/json':
+            try:
+                entry['json'] = sanitize_json(json.loads(request.body or b'null'))
+            except ValueError:
+                pass
+        else:
+            entry['form'] = sanitize(request.POST)
+            if request.FILES:
+                entry['files'] = sorted(request.FILES)
+    return entry
+
+
+def write_entry(config, request, response, started, elapsed):
+    try:
+        line = json.dumps(describe(request, response, started, elapsed), separators=(',', ':'))
+    except Exception:
+        return  # Never fail a request over its log line.
+    handler = capture_handler(config['dir'], config['max_bytes'], config['backup_count'])
+    handler.handle(logging.makeLogRecord({'msg': line, 'levelno': logging.INFO}))
+
+
+class TrafficCaptureMiddleware:
+    """Record sanitized request metadata when TRAFFIC_CAPTURE['enabled'] is on."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = options()
+        if not config['enabled'] or request.path.startswith(tuple(config['exclude'])):
+            return self.get_response(request)
+        started = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        write_entry(config, request, response, started, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        config = options()
+        if not config['enabled'] or request.path.startswith(tuple(config['exclude'])):
+            return await self.get_response(request)
+        started = time.time()
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        # request.user may load from the session and the line goes to a file: both block.
+        await sync_to_async(write_entry)(config, request, response, started, time.perf_counter() - start)
+        return response
+
+
+def load_entries(paths, limit=None):
+    """Read captured entries from files or directories, oldest first."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, 'traffic-*.jsonl*')))
+        else:
+            files.append(path)
+    entries = []
+    for name in sorted(files):
+        with open(name, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # A line cut short by a crash.
+    entries.sort(key=lambda entry: entry['ts'])
+    return entries[:limit] if limit else entries
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def replay_params(params):
+    """Pairs of a captured {name: [values]} without the redacted values."""
+    return [(name, value) for name, values in params.items() for value in values if value != REDACTED]
+
+
+def send(base_url, entry, cookies=None, csrf_token='', timeout=30):
+    """Replay one entry; return (route, status, seconds, error)."""
+    url = base_url.rstrip('/') + entry['path']
+    query = replay_params(entry.get('query', {}))
+    if query:
+        url += '?' + urlencode(query)
+    headers = {}
+    data = None
+    if 'json' in entry:
+        data = json.dumps(entry['json']).encode()
+        headers['Content-Type'] = 'application/json'
+    elif entry['method'] not in ('GET', 'HEAD'):
+        data = urlencode(replay_params(entry.get('form', {}))).encode()
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    cookies = dict(cookies or {})
+    if csrf_token:
+        cookies[settings.CSRF_COOKIE_NAME] = csrf_token
+        headers['X-CSRFToken'] = csrf_token
+    if cookies:
+        headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in cookies.items())
+    request = urllib.request.Request(url, data=data, headers=headers, method=entry['method'])
+    start = time.perf_counter()
+    try:
+        with _opener.open(request, timeout=timeout) as response:
+            response.read()
+            status, error = response.status, None
+    except urllib.error.HTTPError as e:
+        status, error = e.code, None
+    except OSError as e:
+        status, error = None, str(e)
+    return entry['route'], status, time.perf_counter() - start, error
+
+
+def replay(entries, base_url, executor, sessions=None, csrf_token='', speed=0, timeout=30):
+    """
+    Send entries through executor; return (results, wall seconds).
+
+    With speed > 0, requests keep the spacing they were captured with,
+    compressed by that factor; with 0 they are sent as fast as the pool
+    takes them. sessions maps captured user ids to session cookies.
+    """
+    sessions = sessions or {}
+    futures = []
+    first = entries[0]['ts'] if entries else 0
+    started = time.perf_counter()
+    for entry in entries:
+        if speed > 0:
+            delay = (entry['ts'] - first) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        futures.append(executor.submit(
+            send, base_url, entry, sessions.get(entry.get('user_id')), csrf_token, timeout,
+        ))
+    results = [future.result() for future in futures]
+    return results, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(results, seconds):
+    """Per-route (and 'ALL') counts, rates and latency percentiles in ms."""
+    groups = {}
+    for route, status, elapsed, error in results:
+        groups.setdefault(route or '<unmatched>', []).append((status, elapsed))
+    groups['ALL'] = [(status, elapsed) for _, status, elapsed, _ in results]
+    report = {}
+    for route, rows in groups.items():
+        latencies = sorted(elapsed * 1000 for _, elapsed in rows)
+        errors = sum(1 for status, _ in rows if status is None or status >= 500)
+        report[route] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / seconds, 2) if seconds else 0.0,
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+            'client_errors': sum(1 for status, _ in rows if status is not None and 400 <= status < 500),
+            'p50_ms': round(percentile(latencies, 0.5), 2) if rows else 0.0,
+            'p95_ms': round(percentile(latencies, 0.95), 2) if rows else 0.0,
+            'p99_ms': round(percentile(latencies, 0.99), 2) if rows else 0.0,
+            'max_ms': round(latencies[-1], 2) if rows else 0.0,
+        }
+    return report
@@ -1,14 +1,26 @@
 """URL configuration for collections project."""
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from config.metrics import metrics_view
+from config.sampling_profiler import sampled_profile_file, sampled_profiles
+from config.template_profiler import template_profile_report
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('items.urls')),
     path('users/', include('users.urls')),
+    path('_profiling/templates/', template_profile_report, name='template_profile_report'),
+    path('_profiling/samples/', sampled_profiles, name='sampled_profiles'),
+    re_path(
+        r'^_profiling/samples/(?P<kind>requests|fleet)/(?P<name>[\w-]+)\.(?P<extension>collapsed|json)$',
+        sampled_profile_file,
+        name='sampled_profile_file',
+    ),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,156 @@
+"""
+Worker warm-up.
+
+Runs the work a fresh worker would otherwise do on its first requests:
+importing every URLconf and view module, compiling the project's
+templates into the cached loader, loading translation catalogs and
+opening persistent database connections. config.wsgi and config.asgi
+run the IMPORT_STEPS when WARMUP_ON_START is set, before the server
+hands the worker any traffic.
+
+Connections are not opened at import: with gunicorn --preload the
+application is imported once in the master and forked, and a forked
+worker must not share its parent's database connections. Opening them
+is left to post_fork, a gunicorn server hook:
+
+    # gunicorn.conf.py
+    from config.warmup import post_fork
+"""
+
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+from django.utils import translation
+
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_urls():
+    """Import every URLconf and view module and build the reverse lookup tables."""
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return len(resolver.reverse_dict)
+
+
+def _loader_dirs(loader):
+    if hasattr(loader, 'loaders'):  # cached loader
+        for inner in loader.loaders:
+            yield from _loader_dirs(inner)
+    elif hasattr(loader, 'get_dirs'):
+        yield from loader.get_dirs()
+
+
+def project_templates(engine):
+    """Yield the names of templates under BASE_DIR that engine can load."""
+    base_dir = os.path.realpath(settings.BASE_DIR)
+    seen = set()
+    for loader in engine.engine.template_loaders:
+        for directory in _loader_dirs(loader):
+            directory = os.path.realpath(directory)
+            if not directory.startswith(base_dir + os.sep) or not os.path.isdir(directory):
+                continue
+            for root, _, files in os.walk(directory):
+                for filename in sorted(files):
+                    if not filename.endswith(('.html', '.txt')):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                    if name not in seen:
+                        seen.add(name)
+                        yield name
+
+
+def compile_templates():
+    """
+    Compile the project's templates; return how many compiled.
+
+    Only useful with the cached loader (the default since Django 4.1),
+    which keeps the compiled templates for the life of the process.
+    """
+    compiled = 0
+    for engine in engines.all():
+        if not hasattr(engine, 'engine'):
+            continue
+        for name in project_templates(engine):
+            try:
+                engine.get_template(name)
+            except Exception:
+                logger.warning('Warm-up could not compile template %s', name, exc_info=True)
+            else:
+                compiled += 1
+    return compiled
+
+
+def load_translations():
+    """Load the catalogs of the default language."""
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('')
+    return settings.LANGUAGE_CODE
+
+
+def open_connections():
+    """
+    Open every persistent database connection; return how many.
+
+    Connections with CONN_MAX_AGE = 0 would be closed again at the start
+    of the first request, so they are left alone.
+    """
+    opened = 0
+    for connection in connections.all():
+        if connection.settings_dict.get('CONN_MAX_AGE'):
+            connection.ensure_connection()
+            opened += 1
+    return opened
+
+
+WARMUP_STEPS = [
+    ('urls', resolve_urls),
+    ('templates', compile_templates),
+    ('translations', load_translations),
+    ('connections', open_connections),
+]
+
+# Steps safe to run before the server forks its workers.
+IMPORT_STEPS = ('urls', 'templates', 'translations')
+
+
+def warm_up(steps=None):
+    """
+    Run the warm-up steps; return {step: (result, seconds)}.
+
+    A failing step is logged and skipped so a worker still starts.
+    """
+    results = {}
+    for name, step in WARMUP_STEPS:
+        if steps is not None and name not in steps:
+            continue
+        start = time.perf_counter()
+        try:
+            result = step()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            result = None
+        results[name] = (result, time.perf_counter() - start)
+    logger.info(
+        'Worker warmed up: %s',
+        ', '.join(f'{name}={result} ({seconds * 1000:.0f} ms)' for name, (result, seconds) in results.items()),
+    )
+    return results
+
+
+def warm_up_if_enabled():
+    """Run the import-time warm-up steps when WARMUP_ON_START is set."""
+    if getattr(settings, 'WARMUP_ON_START', False):
+        return warm_up(steps=IMPORT_STEPS)
+    return None
+
+
+def post_fork(server, worker):
+    """Gunicorn hook: open the persistent connections of a freshly forked worker."""
+    if getattr(settings, 'WARMUP_ON_START', False):
+        warm_up(steps=['connections'])
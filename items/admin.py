@@ -3,7 +3,14 @@ Admin configuration for items app.
 """
 
 from django.contrib import admin
-from .models import Collection, Item, Purchase, Auction, Bid, Cart, Offer
+from django.urls import reverse
+from django.utils.html import format_html_join
+from .duplicates import duplicate_pairs, find_duplicates
+from .history import decode
+from .models import (
+    Collection, Item, ItemChange, Purchase, Auction, Bid, ProxyBid, Cart, Offer,
+    CollectionArchive, CollectionValueSnapshot, CollectionValueRollup, OutboxEvent, UserLedger, UserLedgerMonth,
+)
 
 
 @admin.register(Collection)
@@ -23,13 +30,54 @@ class CollectionAdmin(admin.ModelAdmin):
     get_total_value.short_description = 'Total Value'
 
 
+class ProbableDuplicateFilter(admin.SimpleListFilter):
+    """Items whose image is a near-duplicate of another item's."""
+    title = 'probable duplicate image'
+    parameter_name = 'duplicate_image'
+    
+    def lookups(self, request, model_admin):
+        return (('yes', 'Yes'),)
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            ids = {item_id for pair in duplicate_pairs() for item_id in pair[:2]}
+            return queryset.filter(pk__in=ids)
+        return queryset
+
+
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
     """Admin interface for Item model."""
     list_display = ('name', 'collection', 'value', 'condition', 'is_for_sale', 'sale_price', 'created_at')
-    list_filter = ('condition', 'created_at', 'collection', 'is_for_sale')
+    list_filter = ('condition', 'created_at', 'collection', 'is_for_sale', ProbableDuplicateFilter)
     search_fields = ('name', 'description', 'collection__name')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'image_hash', 'probable_duplicates')
+    
+    def probable_duplicates(self, obj):
+        matches = find_duplicates(obj.image_hash, exclude=obj.pk)
+        names = Item.objects.in_bulk([item_id for item_id, _ in matches])
+        return format_html_join(
+            ', ', '<a href="{}">{}</a> ({} bits)',
+            (
+                (reverse('admin:items_item_change', args=[item_id]), names[item_id], bits)
+                for item_id, bits in matches if item_id in names
+            ),
+        ) or '-'
+    probable_duplicates.short_description = 'Probable duplicates'
+
+
+@admin.register(ItemChange)
+class ItemChangeAdmin(admin.ModelAdmin):
+    """Admin interface for ItemChange model."""
+    list_display = ('item', 'changed_at', 'is_snapshot', 'decoded')
+    list_filter = ('is_snapshot', 'changed_at')
+    search_fields = ('item__name',)
+    readonly_fields = ('item', 'changed_at', 'is_snapshot', 'decoded')
+    exclude = ('fields', 'data')
+    
+    def decoded(self, obj):
+        return ', '.join(f'{field}={value}' for field, value in decode(obj.fields, bytes(obj.data)).items())
+    decoded.short_description = 'Changes'
 
 
 @admin.register(Purchase)
@@ -41,13 +89,32 @@ class PurchaseAdmin(admin.ModelAdmin):
     readonly_fields = ('purchase_date',)
 
 
+@admin.register(UserLedger)
+class UserLedgerAdmin(admin.ModelAdmin):
+    """Admin interface for UserLedger model."""
+    list_display = ('user', 'spent', 'purchase_count', 'earned', 'sale_count')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'spent', 'purchase_count', 'earned', 'sale_count')
+
+
+@admin.register(UserLedgerMonth)
+class UserLedgerMonthAdmin(admin.ModelAdmin):
+    """Admin interface for UserLedgerMonth model."""
+    list_display = ('user', 'month', 'spent', 'purchase_count', 'earned', 'sale_count')
+    list_filter = ('month',)
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'month', 'spent', 'purchase_count', 'earned', 'sale_count')
+
+
 @admin.register(Auction)
 class AuctionAdmin(admin.ModelAdmin):
     """Admin interface for Auction model."""
-    list_display = ('item', 'seller', 'starting_price', 'current_price', 'highest_bidder', 'status', 'end_date')
+    list_display = (
+        'item', 'seller', 'starting_price', 'current_price', 'highest_bidder', 'bid_count', 'status', 'end_date',
+    )
     list_filter = ('status', 'start_date', 'end_date')
     search_fields = ('item__name', 'seller__username')
-    readonly_fields = ('start_date',)
+    readonly_fields = ('start_date', 'bid_count', 'unique_bidder_count', 'last_bid_at')
 
 
 @admin.register(Bid)
@@ -59,6 +126,14 @@ class BidAdmin(admin.ModelAdmin):
     readonly_fields = ('bid_date',)
 
 
+@admin.register(ProxyBid)
+class ProxyBidAdmin(admin.ModelAdmin):
+    """Admin interface for ProxyBid model."""
+    list_display = ('bidder', 'auction', 'max_amount', 'placed_at')
+    search_fields = ('bidder__username', 'auction__item__name')
+    readonly_fields = ('placed_at',)
+
+
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     """Admin interface for Cart model."""
@@ -79,7 +154,40 @@ class CartAdmin(admin.ModelAdmin):
 @admin.register(Offer)
 class OfferAdmin(admin.ModelAdmin):
     """Admin interface for Offer model."""
-    list_display = ('buyer', 'item', 'amount', 'status', 'created_at')
+    list_display = ('buyer', 'seller', 'item', 'amount', 'status', 'created_at', 'seen_at')
     list_filter = ('status', 'created_at', 'item')
-    search_fields = ('buyer__username', 'item__name', 'message')
-    readonly_fields = ('created_at', 'updated_at')
+    search_fields = ('buyer__username', 'seller__username', 'item__name', 'message')
+    readonly_fields = ('seller', 'created_at', 'updated_at', 'seen_at')
+
+
+@admin.register(CollectionValueSnapshot)
+class CollectionValueSnapshotAdmin(admin.ModelAdmin):
+    """Admin interface for CollectionValueSnapshot model."""
+    list_display = ('collection', 'date', 'total_value', 'item_count')
+    list_filter = ('date',)
+    search_fields = ('collection__name',)
+
+
+@admin.register(CollectionValueRollup)
+class CollectionValueRollupAdmin(admin.ModelAdmin):
+    """Admin interface for CollectionValueRollup model."""
+    list_display = ('collection', 'period', 'period_start', 'open_value', 'close_value', 'min_value', 'max_value')
+    list_filter = ('period', 'period_start')
+    search_fields = ('collection__name',)
+
+
+@admin.register(CollectionArchive)
+class CollectionArchiveAdmin(admin.ModelAdmin):
+    """Admin interface for CollectionArchive model."""
+    list_display = ('collection', 'requested_by', 'status', 'size', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('collection__name', 'requested_by__username')
+    readonly_fields = ('file_name', 'size', 'created_at', 'finished_at')
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    """Admin interface for OutboxEvent model."""
+    list_display = ('id', 'topic', 'status', 'attempts', 'available_at', 'created_at', 'processed_at')
+    list_filter = ('status', 'topic')
+    readonly_fields = ('created_at', 'processed_at', 'claim_token', 'last_error')
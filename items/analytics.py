@@ -0,0 +1,202 @@
+"""
+Marketplace price analytics.
+Loads listing and sale prices into NumPy arrays in one query and computes
+per-condition and per-keyword distributions with vectorized operations.
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Value
+
+from .models import Item, Purchase
+
+
+CONDITIONS = [value for value, label in Item._meta.get_field('condition').choices]
+CONDITION_CODES = {condition: code for code, condition in enumerate(CONDITIONS)}
+PERCENTILES = [10, 25, 50, 75, 90]
+WORD_RE = re.compile(r'[^\W_]{3,}')
+
+LISTING = 0
+SALE = 1
+
+
+def keywords(text):
+    """Return the distinct lowercase keywords of a piece of text."""
+    return set(WORD_RE.findall((text or '').lower()))
+
+
+def summarize(prices, bins=10):
+    """Return count, percentiles and a histogram for an array of prices."""
+    if not prices.size:
+        return None
+    p10, p25, p50, p75, p90 = np.percentile(prices, PERCENTILES)
+    counts, edges = np.histogram(prices, bins=min(bins, prices.size))
+    return {
+        'count': int(prices.size),
+        'min': round(float(prices.min()), 2),
+        'max': round(float(prices.max()), 2),
+        'mean': round(float(prices.mean()), 2),
+        'median': round(float(p50), 2),
+        'p10': round(float(p10), 2),
+        'p25': round(float(p25), 2),
+        'p75': round(float(p75), 2),
+        'p90': round(float(p90), 2),
+        'histogram': {
+            'counts': counts.tolist(),
+            'edges': np.round(edges, 2).tolist(),
+        },
+    }
+
+
+class PriceColumns:
+    """Prices with their condition codes and a keyword index, as arrays."""
+
+    def __init__(self, prices, conditions, names):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.conditions = np.asarray(conditions, dtype=np.int8)
+        postings = defaultdict(list)
+        for row, name in enumerate(names):
+            for word in keywords(name):
+                postings[word].append(row)
+        self.keyword_rows = {word: np.asarray(rows, dtype=np.int64) for word, rows in postings.items()}
+
+    def __len__(self):
+        return self.prices.size
+
+    def select(self, condition=None, keyword=None):
+        """Return the prices matching a condition and/or a keyword."""
+        if keyword is not None:
+            rows = self.keyword_rows.get(keyword)
+            if rows is None:
+                return self.prices[:0]
+            prices, conditions = self.prices[rows], self.conditions[rows]
+        else:
+            prices, conditions = self.prices, self.conditions
+        if condition is not None:
+            prices = prices[conditions == CONDITION_CODES.get(condition, -1)]
+        return prices
+
+    def by_condition(self):
+        """Summarize every condition from a single sort of the prices."""
+        order = np.lexsort((self.prices, self.conditions))
+        codes = self.conditions[order]
+        prices = self.prices[order]
+        bounds = np.searchsorted(codes, np.arange(len(CONDITIONS) + 1))
+        return {
+            condition: summarize(prices[bounds[code]:bounds[code + 1]])
+            for code, condition in enumerate(CONDITIONS)
+        }
+
+
+class MarketSnapshot:
+    """Price columns for current listings and completed sales."""
+
+    def __init__(self, rows):
+        columns = {LISTING: ([], [], []), SALE: ([], [], [])}
+        for kind, condition, price, name in rows:
+            prices, conditions, names = columns[kind]
+            prices.append(price)
+            conditions.append(CONDITION_CODES.get(condition, -1))
+            names.append(name)
+        self.listings = PriceColumns(*columns[LISTING])
+        self.sales = PriceColumns(*columns[SALE])
+        self.loaded_at = time.monotonic()
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Fetch every listing and completed sale price in one query."""
+        listings = Item.objects.filter(is_for_sale=True, sale_price__isnull=False).annotate(
+            kind=Value(LISTING)
+        ).values_list('kind', 'condition', 'sale_price', 'name').order_by()
+        sales = Purchase.objects.filter(status='completed').annotate(
+            kind=Value(SALE)
+        ).values_list('kind', 'item__condition', 'price_paid', 'item__name').order_by()
+        return cls(listings.union(sales, all=True))
+
+    def memoize(self, key, compute):
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def conditions(self):
+        """Per-condition distributions for listings and sales."""
+        return self.memoize('conditions', lambda: {
+            'listings': self.listings.by_condition(),
+            'sales': self.sales.by_condition(),
+        })
+
+    def keyword_range(self, keyword, condition=None):
+        """Listing and sale distributions for a keyword."""
+        return self.memoize(('keyword', keyword, condition), lambda: {
+            'keyword': keyword,
+            'listings': summarize(self.listings.select(condition, keyword)),
+            'sales': summarize(self.sales.select(condition, keyword)),
+        })
+
+    def best_keyword(self, text):
+        """Return the keyword of text with the most listings and sales."""
+        def matches(word):
+            return (
+                len(self.listings.keyword_rows.get(word, ()))
+                + len(self.sales.keyword_rows.get(word, ()))
+            )
+        candidates = [word for word in keywords(text) if matches(word) > 1]
+        return max(sorted(candidates), key=matches, default=None)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Return the process-wide snapshot, reloading it once it expires."""
+    global _snapshot
+    ttl = getattr(settings, 'MARKET_ANALYTICS_TTL', 300)
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() - snapshot.loaded_at > ttl:
+        with _snapshot_lock:
+            if _snapshot is snapshot:
+                _snapshot = MarketSnapshot.load()
+            snapshot = _snapshot
+    return snapshot
+
+
+def clear_snapshot():
+    """Drop the cached snapshot so the next call reloads it."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+def market_range(condition=None, text=''):
+    """
+    Market context for pricing an item.
+
+    Returns per-condition distributions plus, when the text has a keyword
+    seen in other listings or sales, the distribution for that keyword.
+    """
+    snapshot = get_snapshot()
+    by_condition = snapshot.conditions()
+    keyword = snapshot.best_keyword(text)
+    return {
+        'condition': condition,
+        'listings': by_condition['listings'].get(condition) if condition else None,
+        'sales': by_condition['sales'].get(condition) if condition else None,
+        'by_condition': [
+            {
+                'condition': name,
+                'listings': by_condition['listings'][name],
+                'sales': by_condition['sales'][name],
+            }
+            for name in CONDITIONS
+        ],
+        'keyword': snapshot.keyword_range(keyword, condition) if keyword else None,
+    }
@@ -10,3 +10,8 @@ class ItemsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'items'
     verbose_name = 'Collections Management'
+    
+    def ready(self):
+        """Import signals and outbox handlers when app is ready."""
+        import items.signals
+        import items.handlers
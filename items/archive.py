@@ -0,0 +1,251 @@
+"""
+Collection archive export.
+
+A collection is exported as a zip holding every item image under
+images/ plus manifest.csv and manifest.json describing the collection
+and its items. The zip is produced as a stream of chunks: images are
+read from disk through mmap a chunk at a time and items are iterated
+from the database, so memory stays constant however large the
+collection. Small collections are streamed straight into the response;
+larger ones are written to COLLECTION_ARCHIVE['dir'] by an outbox
+handler and downloaded from there once ready; the file is written
+outside any transaction, so a large export never holds the database
+write lock. An archive that fails to
+build, or is still pending after 'pending_timeout' seconds, is marked
+failed so the owner can request it again.
+"""
+
+import csv
+import io
+import json
+import logging
+import mmap
+import os
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CollectionArchive, Item
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+MANIFEST_FIELDS = (
+    'id', 'name', 'description', 'value', 'acquisition_date', 'condition',
+    'is_for_sale', 'sale_price', 'created_at', 'updated_at', 'image',
+)
+
+
+def options():
+    return {
+        'dir': os.path.join(settings.BASE_DIR, 'var', 'archives'),
+        'stream_max_items': 2000,
+        'stream_max_bytes': 200 * 1024 * 1024,
+        'pending_timeout': 3600,
+        **getattr(settings, 'COLLECTION_ARCHIVE', {}),
+    }
+
+
+class ChunkSink:
+    """Write-only file that ZipFile writes into and the generator drains."""
+
+    def __init__(self):
+        self.chunks = []
+        self.pending = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.pending = 0
+        return data
+
+
+def file_chunks(name, chunk_size=None):
+    """Yield a stored file's bytes in chunks, through mmap when it is on local disk."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        with default_storage.open(name, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+        return
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, size, chunk_size):
+                yield mapped[offset:offset + chunk_size]
+
+
+def image_entry_name(item_id, image):
+    return f'images/{item_id}-{os.path.basename(image)}'
+
+
+def collection_items(collection):
+    return Item.objects.filter(collection=collection).order_by('pk')
+
+
+def manifest_row(item, missing):
+    image = item.image.name if item.image and item.pk not in missing else ''
+    row = {field: getattr(item, field) for field in MANIFEST_FIELDS if field != 'image'}
+    row['image'] = image_entry_name(item.pk, image) if image else ''
+    return row
+
+
+def csv_chunks(collection, missing):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS)
+    writer.writeheader()
+    for item in collection_items(collection).iterator(chunk_size=500):
+        writer.writerow(manifest_row(item, missing))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def json_chunks(collection, missing):
+    header = {
+        'id': collection.pk,
+        'name': collection.name,
+        'description': collection.description,
+        'owner': collection.owner.username,
+        'exported_at': timezone.now(),
+    }
+    yield (json.dumps({'collection': header}, cls=DjangoJSONEncoder)[:-1] + ', "items": [').encode()
+    separator = ''
+    for item in collection_items(collection).iterator(chunk_size=500):
+        yield (separator + json.dumps(manifest_row(item, missing), cls=DjangoJSONEncoder)).encode()
+        separator = ', '
+    yield b']}'
+
+
+def archive_chunks(collection):
+    """Yield the bytes of a zip export of collection, a chunk at a time."""
+    sink = ChunkSink()
+    missing = set()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        images = collection_items(collection).exclude(image='').exclude(image=None)
+        for item_id, image, updated_at in images.values_list('pk', 'image', 'updated_at').iterator(chunk_size=500):
+            if not default_storage.exists(image):
+                missing.add(item_id)
+                continue
+            info = zipfile.ZipInfo(image_entry_name(item_id, image), timezone.localtime(updated_at).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED  # Images are compressed already.
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in file_chunks(image):
+                    entry.write(chunk)
+                    if sink.pending >= CHUNK_SIZE:
+                        yield sink.drain()
+            yield sink.drain()
+        now = timezone.localtime().timetuple()[:6]
+        for name, chunks in (
+            ('manifest.csv', csv_chunks(collection, missing)),
+            ('manifest.json', json_chunks(collection, missing)),
+        ):
+            info = zipfile.ZipInfo(name, now)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if sink.pending >= CHUNK_SIZE:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def should_stream(collection):
+    """Return True when the collection is small enough to export within the request."""
+    config = options()
+    items = collection_items(collection)
+    if items.count() > config['stream_max_items']:
+        return False
+    total = 0
+    for image in items.exclude(image='').exclude(image=None).values_list('image', flat=True).iterator():
+        try:
+            total += default_storage.size(image)
+        except OSError:
+            continue
+        if total > config['stream_max_bytes']:
+            return False
+    return True
+
+
+def archive_path(archive):
+    return os.path.join(options()['dir'], archive.file_name)
+
+
+def pending_archive(collection):
+    """Return the collection's archive being built, after failing those pending too long."""
+    stale_before = timezone.now() - timedelta(seconds=options()['pending_timeout'])
+    collection.archives.filter(status=CollectionArchive.STATUS_PENDING, created_at__lt=stale_before).update(
+        status=CollectionArchive.STATUS_FAILED, finished_at=timezone.now(),
+    )
+    return collection.archives.filter(status=CollectionArchive.STATUS_PENDING).first()
+
+
+def build_archive(archive):
+    """
+    Write a requested archive to disk and mark it ready, replacing older ones.
+
+    On error the partial file is removed and the archive marked failed;
+    returns whether it was built.
+    """
+    directory = options()['dir']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'collection-{archive.collection_id}-{archive.pk}.zip')
+    temporary = f'{path}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            for chunk in archive_chunks(archive.collection):
+                f.write(chunk)
+        os.replace(temporary, path)
+    except Exception:
+        logger.exception('Archive %s of collection %s could not be built', archive.pk, archive.collection_id)
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        archive.status = CollectionArchive.STATUS_FAILED
+        archive.finished_at = timezone.now()
+        archive.save(update_fields=['status', 'finished_at'])
+        return False
+    archive.file_name = os.path.basename(path)
+    archive.size = os.path.getsize(path)
+    archive.status = CollectionArchive.STATUS_READY
+    archive.finished_at = timezone.now()
+    older_archives = CollectionArchive.objects.filter(collection_id=archive.collection_id).exclude(
+        pk=archive.pk,
+    ).exclude(status=CollectionArchive.STATUS_PENDING)
+    with transaction.atomic():
+        archive.save(update_fields=['file_name', 'size', 'status', 'finished_at'])
+        for older in older_archives:
+            older.delete()
+    return True
+
+
+def remove_archive_file(archive):
+    if archive.file_name:
+        try:
+            os.remove(archive_path(archive))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,42 @@
+"""
+Helpers for async views in the items application.
+Keeps session, auth and template work off the event loop.
+"""
+
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.shortcuts import render
+
+
+def async_login_required(view):
+    """Async equivalent of login_required."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user is lazy and loads from the session (a sync DB call);
+        # evaluate it in a worker thread so later accesses are free.
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    """Async equivalent of get_object_or_404 for a queryset."""
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def arender(request, template_name, context=None):
+    """
+    Render a template in a worker thread.
+
+    Context processors (messages, auth) still touch the session, so
+    rendering is not safe on the event loop itself.
+    """
+    return await sync_to_async(render)(request, template_name, context)
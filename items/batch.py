@@ -0,0 +1,135 @@
+"""
+Batch item operations within a collection.
+Each operation runs as a single INSERT, UPDATE or DELETE and can be
+previewed to get the number of affected items without writing anything.
+Changes of tracked fields are added to the item history in one more
+INSERT, and item.text_changed events for the items whose similarity
+inputs changed in another.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .forms import ItemForm
+from .history import TRACKED_FIELDS, changed_rows, record_changes, tracked_values
+from .models import Item
+from .outbox import publish_many
+from .valuation import record_value_change, tracking_paused
+
+
+BULK_EDITABLE_FIELDS = ('condition', 'is_for_sale', 'sale_price')
+MAX_BATCH_SIZE = 1000
+
+
+class BatchError(ValueError):
+    """Raised when a batch request is invalid."""
+
+
+def selected_items(collection, item_ids):
+    """Return the collection's items among item_ids ('all' for every item)."""
+    items = Item.objects.filter(collection=collection)
+    if item_ids == 'all':
+        return items
+    if not isinstance(item_ids, list) or not item_ids:
+        raise BatchError('item_ids must be a non-empty list or "all".')
+    try:
+        item_ids = [int(pk) for pk in item_ids]
+    except (TypeError, ValueError):
+        raise BatchError('item_ids must be integers.')
+    return items.filter(pk__in=item_ids)
+
+
+def batch_delete(collection, item_ids, preview=False):
+    """Delete the selected items; return how many."""
+    items = selected_items(collection, item_ids)
+    totals = items.aggregate(count=Count('pk'), value=Sum('value'))
+    if preview or not totals['count']:
+        return totals['count']
+    with tracking_paused():
+        items.delete()
+    record_value_change(collection.pk, -(totals['value'] or 0), -totals['count'])
+    return totals['count']
+
+
+def clean_fields(fields):
+    """Validate bulk-editable field values with the model's form fields."""
+    if not isinstance(fields, dict) or not fields:
+        raise BatchError('fields must be a non-empty object.')
+    unknown = set(fields) - set(BULK_EDITABLE_FIELDS)
+    if unknown:
+        raise BatchError(f"Fields cannot be bulk edited: {', '.join(sorted(unknown))}.")
+    cleaned = {}
+    for name, value in fields.items():
+        form_field = Item._meta.get_field(name).formfield()
+        try:
+            cleaned[name] = form_field.clean(value)
+        except ValidationError as exc:
+            raise BatchError(f"{name}: {' '.join(exc.messages)}")
+    return cleaned
+
+
+def batch_update(collection, item_ids, fields, preview=False):
+    """Set the same field values on the selected items; return how many."""
+    cleaned = clean_fields(fields)
+    items = selected_items(collection, item_ids)
+    if preview:
+        return items.count()
+    tracked = [name for name in cleaned if name in TRACKED_FIELDS]
+    before = tracked_values(items, tracked) if tracked else {}
+    # Listing or delisting is the only bulk edit that changes similarity inputs.
+    relisted = []
+    if 'is_for_sale' in cleaned:
+        relisted = list(items.exclude(is_for_sale=cleaned['is_for_sale']).values_list('pk', flat=True))
+    count = items.update(updated_at=timezone.now(), **cleaned)
+    after = {name: cleaned[name] for name in tracked}
+    record_changes(changed_rows(before, dict.fromkeys(before, after)))
+    publish_many('item.text_changed', ({'item_id': pk} for pk in relisted))
+    return count
+
+
+def batch_reprice(collection, item_ids, percent, preview=False):
+    """Change the sale price of the selected items by a percentage."""
+    try:
+        factor = 1 + Decimal(str(percent)) / 100
+    except (InvalidOperation, ValueError):
+        raise BatchError('percent must be a number.')
+    if factor <= 0:
+        raise BatchError('percent must be greater than -100.')
+    items = selected_items(collection, item_ids).filter(sale_price__isnull=False)
+    if preview:
+        return items.count()
+    before = tracked_values(items, ['sale_price'])
+    count = items.update(sale_price=Round(F('sale_price') * factor, 2), updated_at=timezone.now())
+    record_changes(changed_rows(before, tracked_values(Item.objects.filter(pk__in=before), ['sale_price'])))
+    return count
+
+
+def batch_create(collection, rows, preview=False):
+    """Validate and insert new items; return how many."""
+    if not isinstance(rows, list) or not rows:
+        raise BatchError('items must be a non-empty list.')
+    if len(rows) > MAX_BATCH_SIZE:
+        raise BatchError(f'At most {MAX_BATCH_SIZE} items can be created at once.')
+    new_items = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise BatchError(f'items[{index}] must be an object.')
+        form = ItemForm(data={'condition': 'good', 'value': '0', **row})
+        if not form.is_valid():
+            errors = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in form.errors.items())
+            raise BatchError(f'items[{index}]: {errors}')
+        form.instance.collection = collection
+        new_items.append(form.instance)
+    if preview:
+        return len(new_items)
+    Item.objects.bulk_create(new_items)
+    record_changes(
+        (item.pk, {name: getattr(item, name) for name in TRACKED_FIELDS}) for item in new_items
+    )
+    record_value_change(collection.pk, sum(item.value or 0 for item in new_items), len(new_items))
+    publish_many('item.text_changed', ({'item_id': item.pk} for item in new_items if item.is_for_sale))
+    return len(new_items)
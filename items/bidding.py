@@ -0,0 +1,148 @@
+"""
+Bid placement for the items application.
+Placing a bid updates the auction's price, leader and bid statistics in
+the same transaction as the Bid insert, so the counts shown on auction
+pages never need to be recomputed from the bid history.
+
+Proxy bids hold a bidder's maximum. After every change the two highest
+maximums are read through the ranking index (one O(log n) seek however
+many proxies an auction has) and the contest between them is settled at
+once: at most the runner-up's final bid and the leader's winning bid are
+recorded, never the increments in between.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Auction, Bid, ProxyBid
+from .outbox import publish
+
+
+# Amount by which a proxy outbids the price it has to beat.
+BID_INCREMENT = Decimal('1.00')
+
+
+class BidError(ValueError):
+    """Raised when a bid cannot be placed."""
+
+
+def parse_amount(value):
+    """Return value as a positive Decimal with two places, or raise BidError."""
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        raise BidError('Enter a valid bid amount.')
+    if not amount.is_finite() or amount <= 0:
+        raise BidError('Enter a valid bid amount.')
+    return amount
+
+
+def record_bid(auction, bidder_id, amount, now=None):
+    """
+    Insert a bid and update the auction in one step; return the Bid or None.
+
+    The auction row is only updated while it is live and the amount beats
+    its current price, checked in the UPDATE itself, so concurrent bids
+    cannot both win. Must run inside a transaction.
+    """
+    now = now or timezone.now()
+    first_bid = not Bid.objects.filter(auction=auction, bidder_id=bidder_id).exists()
+    updated = Auction.objects.filter(
+        pk=auction.pk, status='active', end_date__gt=now, current_price__lt=amount,
+    ).update(
+        current_price=amount,
+        highest_bidder_id=bidder_id,
+        bid_count=F('bid_count') + 1,
+        unique_bidder_count=F('unique_bidder_count') + int(first_bid),
+        last_bid_at=now,
+    )
+    if not updated:
+        return None
+    bid = Bid.objects.create(auction=auction, bidder_id=bidder_id, amount=amount)
+    publish('bid.placed', auction_id=auction.pk, bid_id=bid.pk, bidder_id=bidder_id, amount=amount)
+    return bid
+
+
+def resolve_proxies(auction):
+    """
+    Let the highest proxies bid against the current price; return new Bids.
+
+    The proxy with the highest maximum (earliest on ties) ends up leading
+    at the lowest price that beats everyone else: one increment above the
+    runner-up's maximum or the current price, capped at its own maximum.
+    """
+    state = Auction.objects.filter(pk=auction.pk).values('current_price', 'highest_bidder_id').get()
+    price, leader_id = state['current_price'], state['highest_bidder_id']
+    top = list(
+        ProxyBid.objects.filter(auction=auction)
+        .order_by('-max_amount', 'placed_at', 'id')
+        .values('bidder_id', 'max_amount')[:2]
+    )
+    if not top:
+        return []
+    best = top[0]
+    runner_up = top[1] if len(top) > 1 else None
+
+    bids = []
+    floor = price
+    if runner_up and runner_up['max_amount'] > price:
+        floor = runner_up['max_amount']
+        if runner_up['max_amount'] < best['max_amount']:
+            bids.append(record_bid(auction, runner_up['bidder_id'], runner_up['max_amount']))
+    elif best['bidder_id'] == leader_id:
+        return []
+
+    target = min(best['max_amount'], floor + BID_INCREMENT)
+    if target > floor or (target == floor and floor > price):
+        bids.append(record_bid(auction, best['bidder_id'], target))
+    return [bid for bid in bids if bid is not None]
+
+
+def check_can_bid(auction, bidder):
+    if bidder.pk == auction.seller_id:
+        raise BidError('You cannot bid on your own auction.')
+    if not auction.is_active():
+        raise BidError('This auction has ended.')
+
+
+@transaction.atomic
+def place_bid(auction, bidder, amount):
+    """
+    Place a bid of amount on auction; return the new Bid.
+
+    Proxies of other bidders respond in the same transaction, so the bid
+    may already be outbid when this returns. Raises BidError if the bid
+    is refused.
+    """
+    amount = parse_amount(amount)
+    check_can_bid(auction, bidder)
+    bid = record_bid(auction, bidder.pk, amount)
+    if bid is None:
+        if not Auction.objects.live().filter(pk=auction.pk).exists():
+            raise BidError('This auction has ended.')
+        raise BidError('Your bid must be higher than the current price.')
+    resolve_proxies(auction)
+    return bid
+
+
+@transaction.atomic
+def set_proxy_bid(auction, bidder, max_amount):
+    """
+    Register or change bidder's maximum on auction; return the Bids placed.
+
+    A maximum can be lowered but never below the current price.
+    """
+    max_amount = parse_amount(max_amount)
+    check_can_bid(auction, bidder)
+    current_price = Auction.objects.filter(pk=auction.pk).values_list('current_price', flat=True).get()
+    if max_amount <= current_price:
+        raise BidError('Your maximum must be higher than the current price.')
+    updated = ProxyBid.objects.filter(auction=auction, bidder=bidder).exclude(max_amount=max_amount).update(
+        max_amount=max_amount, placed_at=timezone.now(),
+    )
+    if not updated:
+        ProxyBid.objects.get_or_create(auction=auction, bidder=bidder, defaults={'max_amount': max_amount})
+    return resolve_proxies(auction)
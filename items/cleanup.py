@@ -0,0 +1,185 @@
+"""
+Collection deletion and media cleanup.
+Deleting a collection hides it at once and purges its rows in short,
+bounded transactions afterwards; orphaned media files are found by
+streaming the media tree against the referenced file names.
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Auction, Bid, Collection, CollectionArchive, CollectionValueRollup, CollectionValueSnapshot, ImageHashKey, Item,
+    ItemChange, Offer, ProxyBid, Purchase, SimilarItem,
+)
+from .valuation import tracking_paused
+
+
+logger = logging.getLogger(__name__)
+
+# Models removed before the collection row itself, leaves first, with the
+# lookup tying each to the collection.
+PURGE_ORDER = [
+    (Bid, 'auction__item__collection_id'),
+    (ProxyBid, 'auction__item__collection_id'),
+    (Offer, 'item__collection_id'),
+    (Purchase, 'item__collection_id'),
+    (Auction, 'item__collection_id'),
+    (ImageHashKey, 'item__collection_id'),
+    (ItemChange, 'item__collection_id'),
+    (SimilarItem, 'item__collection_id'),
+    (SimilarItem, 'similar__collection_id'),
+    (CollectionArchive, 'collection_id'),
+    (CollectionValueSnapshot, 'collection_id'),
+    (CollectionValueRollup, 'collection_id'),
+    (Item, 'collection_id'),
+]
+
+
+@transaction.atomic
+def soft_delete_collection(collection):
+    """
+    Hide a collection and its listings immediately, then schedule a purge.
+
+    Only a few small UPDATEs run in the request; the cascade happens later
+    in purge_collection.
+    """
+    now = timezone.now()
+    Collection.all_objects.filter(pk=collection.pk).update(deleted_at=now)
+    Item.objects.filter(collection=collection, is_for_sale=True).update(is_for_sale=False, updated_at=now)
+    Auction.objects.filter(item__collection=collection, status='active').update(status='cancelled')
+    collection.deleted_at = now
+    if getattr(settings, 'COLLECTION_PURGE_IN_BACKGROUND', True):
+        transaction.on_commit(lambda: start_background_purge(collection.pk))
+
+
+def start_background_purge(collection_id):
+    """Purge a deleted collection from a daemon thread."""
+    def run():
+        try:
+            purge_collection(collection_id)
+        except Exception:
+            logger.exception('Purge of collection %s failed; purge_collections will retry it.', collection_id)
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name=f'purge-collection-{collection_id}', daemon=True).start()
+
+
+def purge_collection(collection_id, chunk_size=None, pause=None):
+    """
+    Delete a soft-deleted collection and everything under it in chunks.
+
+    Each chunk is its own transaction, so the write lock is held for at
+    most chunk_size rows at a time and other writers get in between.
+    Returns the number of rows deleted, or None if the collection is not
+    pending deletion.
+    """
+    chunk_size = chunk_size or getattr(settings, 'COLLECTION_PURGE_CHUNK_SIZE', 500)
+    pause = getattr(settings, 'COLLECTION_PURGE_PAUSE', 0.05) if pause is None else pause
+    if not Collection.all_objects.filter(pk=collection_id, deleted_at__isnull=False).exists():
+        return None
+
+    deleted = 0
+    for model, lookup in PURGE_ORDER:
+        while True:
+            with transaction.atomic(), tracking_paused():
+                pks = list(
+                    model.objects.filter(**{lookup: collection_id})
+                    .order_by()
+                    .values_list('pk', flat=True)[:chunk_size]
+                )
+                if not pks:
+                    break
+                model.objects.filter(pk__in=pks).delete()
+                deleted += len(pks)
+            if pause:
+                time.sleep(pause)
+
+    with transaction.atomic():
+        count, _ = Collection.all_objects.filter(pk=collection_id, deleted_at__isnull=False).delete()
+    return deleted + count
+
+
+def purge_deleted_collections(chunk_size=None, pause=None):
+    """Purge every collection pending deletion; return how many."""
+    pending = Collection.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+    purged = 0
+    for collection_id in pending.values_list('pk', flat=True):
+        if purge_collection(collection_id, chunk_size, pause) is not None:
+            purged += 1
+    return purged
+
+
+def iter_media_files(root, subdirs=None):
+    """
+    Yield (relative path, absolute path) for files under root, sorted.
+
+    Relative paths use '/' and come out in plain string order, matching
+    ORDER BY on the stored file names: directories sort as 'name/' so
+    their contents interleave correctly with sibling files. Only one
+    directory listing is held in memory at a time.
+    """
+    def walk(directory, prefix):
+        try:
+            with os.scandir(directory) as entries:
+                listing = [(entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry.path)
+                           for entry in entries]
+        except FileNotFoundError:
+            return
+        for name, path in sorted(listing):
+            if name.endswith('/'):
+                yield from walk(path, prefix + name)
+            else:
+                yield prefix + name, path
+
+    if subdirs is None:
+        yield from walk(root, '')
+        return
+    for subdir in sorted(subdir.strip('/') + '/' for subdir in subdirs):
+        yield from walk(os.path.join(root, subdir), subdir)
+
+
+def iter_referenced_files():
+    """Yield every file name stored in an image field, sorted, from the DB."""
+    from users.models import UserProfile
+
+    sources = [
+        Item.objects.exclude(image='').exclude(image__isnull=True)
+        .order_by('image').values_list('image', flat=True).distinct(),
+        UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        .order_by('avatar').values_list('avatar', flat=True).distinct(),
+    ]
+    return heapq.merge(*(source.iterator(chunk_size=2000) for source in sources))
+
+
+def find_orphan_media(root=None, min_age=3600, subdirs=('items', 'avatars')):
+    """
+    Yield (relative path, absolute path) of media files nothing refers to.
+
+    Merge-joins the sorted file walk with the sorted referenced names, so
+    memory stays constant however many files there are. Files younger
+    than min_age seconds are skipped to avoid racing in-flight uploads.
+    """
+    root = str(root or settings.MEDIA_ROOT)
+    cutoff = time.time() - min_age
+    referenced = iter_referenced_files()
+    current = next(referenced, None)
+    for name, path in iter_media_files(root, subdirs):
+        while current is not None and current < name:
+            current = next(referenced, None)
+        if current == name:
+            continue
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        yield name, path
@@ -0,0 +1,90 @@
+"""
+Database helpers for the items application.
+Retries write transactions that fail because SQLite is locked.
+"""
+
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from .history import batched_changes
+
+
+def is_locked_error(exc):
+    """Return True if the exception is SQLite's "database is locked"."""
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def backoff_delays(attempts, base_delay, max_delay):
+    """Yield the sleep before each retry: exponential, capped, with jitter."""
+    for attempt in range(attempts - 1):
+        delay = min(max_delay, base_delay * (2 ** attempt))
+        yield delay / 2 + random.uniform(0, delay / 2)
+
+
+def retry_on_locked(func=None, *, attempts=None, base_delay=None, max_delay=None, using=DEFAULT_DB_ALIAS):
+    """
+    Run func in a transaction, retrying with backoff while the DB is locked.
+
+    Only the outermost transaction is retried: inside an existing atomic
+    block a retry would replay work the caller cannot roll back, so the
+    error is raised as usual.
+    """
+    config = getattr(settings, 'DB_WRITE_RETRY', {})
+    attempts = attempts or config.get('attempts', 5)
+    base_delay = base_delay if base_delay is not None else config.get('base_delay', 0.05)
+    max_delay = max_delay if max_delay is not None else config.get('max_delay', 1.0)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if connections[using].in_atomic_block:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+
+            delays = backoff_delays(attempts, base_delay, max_delay)
+            while True:
+                try:
+                    with transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+                except OperationalError as exc:
+                    delay = next(delays, None)
+                    if delay is None or not is_locked_error(exc):
+                        raise
+                    time.sleep(delay)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def atomic_view(view=None, *, methods=None):
+    """
+    Run a view as one retried write transaction.
+
+    Item history rows recorded by the view are inserted together at the
+    end of the transaction. With methods set, only those HTTP methods get
+    a transaction; other requests (typically read-only GETs) run as-is.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def batched(*args, **kwargs):
+            with batched_changes():
+                return view(*args, **kwargs)
+        retried = retry_on_locked(batched)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return view(request, *args, **kwargs)
+            return retried(request, *args, **kwargs)
+        return wrapper
+
+    if view is not None:
+        return decorator(view)
+    return decorator
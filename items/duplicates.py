@@ -0,0 +1,139 @@
+"""
+Near-duplicate image detection for the items application.
+Item images get a 64-bit difference hash (dHash): re-encoding, resizing
+or light edits change only a few bits, so relisted photos of the same
+object end up within a small Hamming distance of each other.
+
+Hashes are indexed as a multi-index hash table: each one is split into
+MAX_DISTANCE + 1 bands stored as ImageHashKey rows. Two hashes at most
+MAX_DISTANCE bits apart must agree on at least one band (pigeonhole), so
+candidates are found with indexed equality lookups rather than by
+comparing against every image.
+"""
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count
+from PIL import Image, ImageOps
+
+from .models import ImageHashKey, Item
+
+
+HASH_BITS = 64
+MAX_DISTANCE = 4
+BANDS = MAX_DISTANCE + 1
+BAND_BITS = -(-HASH_BITS // BANDS)
+MASK = (1 << HASH_BITS) - 1
+
+
+def dhash(fileobj):
+    """Return the signed 64-bit dHash of an image file, or None if unreadable."""
+    position = fileobj.tell() if hasattr(fileobj, 'tell') else None
+    try:
+        with Image.open(fileobj) as image:
+            # Lets JPEG decode at a fraction of full size.
+            image.draft('L', (64, 64))
+            image = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.LANCZOS)
+            pixels = list(image.getdata())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        if position is not None:
+            fileobj.seek(position)
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # Stored in a signed BIGINT column.
+    return value - (1 << HASH_BITS) if value >> (HASH_BITS - 1) else value
+
+
+def hash_stored_image(name):
+    """Return the dHash of a file in default storage, or None."""
+    try:
+        with default_storage.open(name, 'rb') as fileobj:
+            return dhash(fileobj)
+    except OSError:
+        return None
+
+
+def distance(a, b):
+    """Number of bits in which two hashes differ."""
+    return bin((a ^ b) & MASK).count('1')
+
+
+def band_keys(image_hash):
+    """Return the index keys of a hash: band number and band bits packed together."""
+    value = image_hash & MASK
+    band_mask = (1 << BAND_BITS) - 1
+    return [band << BAND_BITS | (value >> (band * BAND_BITS)) & band_mask for band in range(BANDS)]
+
+
+def store_hash_keys(item_id, image_hash):
+    """Replace the index keys of an item's image hash."""
+    ImageHashKey.objects.filter(item_id=item_id).delete()
+    if image_hash is not None:
+        ImageHashKey.objects.bulk_create(ImageHashKey(item_id=item_id, key=key) for key in band_keys(image_hash))
+
+
+def find_duplicates(image_hash, max_distance=MAX_DISTANCE, exclude=None):
+    """
+    Return [(item_id, distance), ...] of images within max_distance bits, closest first.
+
+    Only distances up to MAX_DISTANCE are guaranteed to be found.
+    """
+    if image_hash is None:
+        return []
+    candidates = (
+        ImageHashKey.objects.filter(key__in=band_keys(image_hash))
+        .exclude(item_id=exclude)
+        .values_list('item_id', 'item__image_hash')
+        .distinct()
+    )
+    found = [(item_id, distance(image_hash, other)) for item_id, other in candidates]
+    return sorted((match for match in found if match[1] <= max_distance), key=lambda match: (match[1], match[0]))
+
+
+def duplicate_pairs(max_distance=MAX_DISTANCE, limit=None):
+    """
+    Return [(item_id, other_id, distance), ...] for all probable duplicates.
+
+    Only keys shared by several items are read, so the cost follows the
+    number of collisions rather than the number of images.
+    """
+    shared = ImageHashKey.objects.values('key').annotate(items=Count('id')).filter(items__gt=1).values('key')
+    buckets = {}
+    for key, item_id, image_hash in (
+        ImageHashKey.objects.filter(key__in=shared).order_by('key', 'item_id')
+        .values_list('key', 'item_id', 'item__image_hash')
+    ):
+        buckets.setdefault(key, []).append((item_id, image_hash))
+
+    pairs = {}
+    for members in buckets.values():
+        for i, (item_id, image_hash) in enumerate(members):
+            for other_id, other_hash in members[i + 1:]:
+                if (item_id, other_id) not in pairs:
+                    bits = distance(image_hash, other_hash)
+                    if bits <= max_distance:
+                        pairs[item_id, other_id] = bits
+    result = sorted(((a, b, bits) for (a, b), bits in pairs.items()), key=lambda pair: (pair[2], pair[0], pair[1]))
+    return result[:limit] if limit else result
+
+
+def backfill_hashes(items, pool=None):
+    """
+    Hash the stored images of items (id, image name) and index them; return the count hashed.
+
+    Hashing runs in pool when given, since decoding images is CPU-bound.
+    """
+    items = list(items)
+    names = [name for _, name in items]
+    hashes = pool.map(hash_stored_image, names) if pool is not None else map(hash_stored_image, names)
+    hashed = 0
+    with transaction.atomic():
+        for (item_id, _), image_hash in zip(items, hashes):
+            Item.objects.filter(pk=item_id).update(image_hash=image_hash)
+            store_hash_keys(item_id, image_hash)
+            hashed += image_hash is not None
+    return hashed
@@ -0,0 +1,152 @@
+"""
+Marketplace search filters and facet counts.
+All facet counts for a search come from one grouped query and are cached
+per normalized search string.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, CharField, Count, Exists, OuterRef, Q, Value, When
+
+from .models import Item, Offer
+
+
+CONDITIONS = Item._meta.get_field('condition').choices
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-25', 'Under $25', None, 25),
+    ('25-100', '$25 - $100', 25, 100),
+    ('100-500', '$100 - $500', 100, 500),
+    ('500+', '$500 and up', 500, None),
+]
+
+ACTIVE_OFFER_STATUSES = ['pending', 'accepted']
+
+
+def normalize_query(search_query):
+    """Lowercase and collapse whitespace so equivalent searches share a key."""
+    return ' '.join((search_query or '').lower().split())
+
+
+def search_filter(search_query):
+    """Return the Q object matching the marketplace search box."""
+    return (
+        Q(name__icontains=search_query) |
+        Q(description__icontains=search_query) |
+        Q(collection__name__icontains=search_query)
+    )
+
+
+def price_range(bucket):
+    """Return the Q object for a price bucket key, or None if unknown."""
+    for key, label, low, high in PRICE_BUCKETS:
+        if key == bucket:
+            q = Q(sale_price__isnull=False)
+            if low is not None:
+                q &= Q(sale_price__gte=low)
+            if high is not None:
+                q &= Q(sale_price__lt=high)
+            return q
+    return None
+
+
+def has_image_condition():
+    return ~Q(image='') & Q(image__isnull=False)
+
+
+def has_offers_subquery():
+    return Exists(Offer.objects.filter(item=OuterRef('pk'), status__in=ACTIVE_OFFER_STATUSES))
+
+
+def apply_filters(queryset, params):
+    """Apply the condition, price, image and offer filters from a GET dict."""
+    if params.get('condition'):
+        queryset = queryset.filter(condition=params['condition'])
+    price = price_range(params.get('price'))
+    if price is not None:
+        queryset = queryset.filter(price)
+    if params.get('has_image') == '1':
+        queryset = queryset.filter(has_image_condition())
+    if params.get('has_offers') == '1':
+        queryset = queryset.filter(has_offers_subquery())
+    return queryset
+
+
+def price_bucket_expression():
+    whens = []
+    for key, label, low, high in PRICE_BUCKETS:
+        q = Q()
+        if low is not None:
+            q &= Q(sale_price__gte=low)
+        if high is not None:
+            q &= Q(sale_price__lt=high)
+        whens.append(When(q, then=Value(key)))
+    return Case(*whens, default=Value(''), output_field=CharField())
+
+
+def compute_facets(search_query):
+    """Count listings per facet value with a single GROUP BY query."""
+    listings = Item.objects.filter(is_for_sale=True)
+    if search_query:
+        listings = listings.filter(search_filter(search_query))
+    rows = listings.annotate(
+        price_bucket=price_bucket_expression(),
+        image_present=Case(When(has_image_condition(), then=Value(True)), default=Value(False), output_field=BooleanField()),
+        offers_present=has_offers_subquery(),
+    ).values('condition', 'price_bucket', 'image_present', 'offers_present').annotate(
+        count=Count('pk')
+    ).order_by()
+
+    conditions = dict.fromkeys((value for value, label in CONDITIONS), 0)
+    prices = dict.fromkeys((key for key, label, low, high in PRICE_BUCKETS), 0)
+    total = with_image = with_offers = 0
+    for row in rows:
+        total += row['count']
+        if row['condition'] in conditions:
+            conditions[row['condition']] += row['count']
+        if row['price_bucket'] in prices:
+            prices[row['price_bucket']] += row['count']
+        if row['image_present']:
+            with_image += row['count']
+        if row['offers_present']:
+            with_offers += row['count']
+
+    return {
+        'total': total,
+        'condition': [
+            {'value': value, 'label': label, 'count': conditions[value]}
+            for value, label in CONDITIONS
+        ],
+        'price': [
+            {'value': key, 'label': label, 'count': prices[key]}
+            for key, label, low, high in PRICE_BUCKETS
+        ],
+        'has_image': with_image,
+        'has_offers': with_offers,
+    }
+
+
+FACET_GENERATION_KEY = 'marketplace:facets:generation'
+
+
+def invalidate_facets():
+    """Make every cached facet count stale by moving to a new key generation."""
+    try:
+        cache.incr(FACET_GENERATION_KEY)
+    except ValueError:
+        cache.set(FACET_GENERATION_KEY, 1, None)
+
+
+def facet_counts(search_query):
+    """Return facet counts for a search, cached per normalized query."""
+    normalized = normalize_query(search_query)
+    generation = cache.get(FACET_GENERATION_KEY, 0)
+    key = f'marketplace:facets:{generation}:' + hashlib.md5(normalized.encode()).hexdigest()
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(normalized)
+        cache.set(key, facets, getattr(settings, 'MARKETPLACE_FACET_TTL', 30))
+    return facets
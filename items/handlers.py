@@ -0,0 +1,34 @@
+"""
+Outbox event handlers for the items application.
+Registered when the app is ready; run by the run_outbox command after the
+publishing transaction has committed.
+"""
+
+from .archive import build_archive
+from .facets import invalidate_facets
+from .models import CollectionArchive
+from .outbox import handler
+
+
+@handler('purchase.completed', 'offer.accepted', 'auction.ended')
+def refresh_marketplace_facets(payload):
+    """Listings changed hands, so cached facet counts are out of date."""
+    invalidate_facets()
+
+
+@handler('item.text_changed')
+def refresh_similar_items(payload):
+    """Recompute the changed item's neighbours from the saved text index."""
+    # Imported here so web processes never load numpy/scipy.
+    from .similarity import update_item_similarity
+    update_item_similarity(payload['item_id'])
+
+
+@handler('collection.archive_requested', atomic=False)
+def build_collection_archive(payload):
+    """Write a requested collection export to disk for download, outside any transaction."""
+    archive = CollectionArchive.objects.select_related('collection__owner').filter(
+        pk=payload['archive_id'], status=CollectionArchive.STATUS_PENDING,
+    ).first()
+    if archive is not None:
+        build_archive(archive)
@@ -0,0 +1,260 @@
+"""
+Item change history.
+Each save of an item appends one ItemChange row holding only the tracked
+fields that changed, packed as a bit mask plus varint-encoded values
+(prices in cents), so a price change costs a few bytes. Rows written in
+one transaction are inserted together when it finishes (see
+batched_changes), history reads use the (item, changed_at, id) index,
+and compact_history folds old rows into one snapshot per item and month.
+"""
+
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .ledger import month_of
+from .models import Item, ItemChange
+from .valuation import to_decimal
+
+
+# Bit i of ItemChange.fields is TRACKED_FIELDS[i]; only append to this.
+TRACKED_FIELDS = ('value', 'sale_price', 'condition', 'is_for_sale')
+CONDITIONS = tuple(choice for choice, _ in Item._meta.get_field('condition').choices)
+
+_state = threading.local()
+
+
+def write_varint(number, out):
+    number = number * 2 if number >= 0 else -number * 2 - 1  # zigzag
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def read_varint(data, offset):
+    number = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (number >> 1 if number % 2 == 0 else -(number >> 1) - 1), offset
+
+
+def normalize(field, value):
+    if field in ('value', 'sale_price'):
+        return None if value is None else to_decimal(value)
+    if field == 'is_for_sale':
+        return bool(value)
+    return value
+
+
+def encode(values):
+    """Pack {field: value} of tracked fields into (mask, bytes)."""
+    mask = 0
+    out = bytearray()
+    for bit, field in enumerate(TRACKED_FIELDS):
+        if field not in values:
+            continue
+        mask |= 1 << bit
+        value = normalize(field, values[field])
+        if field == 'value':
+            write_varint(int(value * 100), out)
+        elif field == 'sale_price':
+            # 0 stands for no price, so prices are stored shifted by one.
+            write_varint(0 if value is None else int(value * 100) + (1 if value >= 0 else 0), out)
+        elif field == 'condition':
+            out.append(CONDITIONS.index(value) if value in CONDITIONS else 0xff)
+        else:
+            out.append(value)
+    return mask, bytes(out)
+
+
+def decode(mask, data):
+    """Unpack (mask, bytes) into {field: value}."""
+    values = {}
+    offset = 0
+    for bit, field in enumerate(TRACKED_FIELDS):
+        if not mask & 1 << bit:
+            continue
+        if field == 'value':
+            cents, offset = read_varint(data, offset)
+            values[field] = Decimal(cents).scaleb(-2)
+        elif field == 'sale_price':
+            cents, offset = read_varint(data, offset)
+            values[field] = None if cents == 0 else Decimal(cents - (1 if cents > 0 else 0)).scaleb(-2)
+        elif field == 'condition':
+            index = data[offset]
+            offset += 1
+            values[field] = CONDITIONS[index] if index < len(CONDITIONS) else None
+        else:
+            values[field] = bool(data[offset])
+            offset += 1
+    return values
+
+
+def changed_values(instance, loaded, created):
+    """Return the tracked fields of a saved item that differ from when it was loaded."""
+    if created:
+        return {field: normalize(field, getattr(instance, field)) for field in TRACKED_FIELDS}
+    changes = {}
+    for field in TRACKED_FIELDS:
+        if field in loaded:
+            new = normalize(field, getattr(instance, field))
+            if normalize(field, loaded[field]) != new:
+                changes[field] = new
+    return changes
+
+
+def make_change(item_id, values, changed_at=None, is_snapshot=False):
+    mask, data = encode(values)
+    change = ItemChange(item_id=item_id, fields=mask, data=data, is_snapshot=is_snapshot)
+    if changed_at is not None:
+        change.changed_at = changed_at
+    return change
+
+
+@contextmanager
+def batched_changes(using=DEFAULT_DB_ALIAS):
+    """
+    Collect the history rows recorded in this block and insert them at the end.
+
+    Use inside the transaction that saves the items. Rows recorded in a
+    nested savepoint are written at once instead, so that rolling the
+    savepoint back removes them too.
+    """
+    if getattr(_state, 'batch', None) is not None:
+        yield
+        return
+    rows = []
+    _state.batch = (rows, using, len(connections[using].savepoint_ids))
+    try:
+        yield
+    finally:
+        _state.batch = None
+    if rows:
+        ItemChange.objects.using(using).bulk_create(rows)
+
+
+def record_change(item_id, values):
+    """Append a history row, deferred to the enclosing batched_changes block if any."""
+    change = make_change(item_id, values)
+    batch = getattr(_state, 'batch', None)
+    if batch is not None:
+        rows, using, depth = batch
+        if len(connections[using].savepoint_ids) == depth:
+            rows.append(change)
+            return
+    change.save()
+
+
+def record_changes(changes):
+    """Append history rows for [(item_id, {field: value})] in one query."""
+    rows = [make_change(item_id, values) for item_id, values in changes if values]
+    if rows:
+        ItemChange.objects.bulk_create(rows)
+    return len(rows)
+
+
+def changed_rows(before, after):
+    """Pair up {item_id: {field: value}} maps read before and after a bulk update."""
+    changes = []
+    for item_id, old in before.items():
+        new = after.get(item_id, {})
+        diff = {
+            field: value for field, value in new.items()
+            if normalize(field, old.get(field)) != normalize(field, value)
+        }
+        if diff:
+            changes.append((item_id, diff))
+    return changes
+
+
+def tracked_values(items, fields):
+    """Read {item_id: {field: value}} for the given fields of a queryset."""
+    return {row.pop('id'): row for row in items.values('id', *fields)}
+
+
+def item_history(item_id, limit=None):
+    """
+    Return an item's history, or its newest limit entries, oldest first.
+
+    Each entry has changed_at, the fields that changed ('changes'), the
+    tracked values known after it ('state') and whether it is a
+    compacted snapshot. With a limit, older rows are only decoded, newest
+    first, until every tracked field's value before the window is known.
+    """
+    rows = ItemChange.objects.filter(item_id=item_id).order_by('-changed_at', '-id')
+    recent = list(rows[:limit] if limit else rows)[::-1]
+    state = {}
+    if limit and len(recent) == limit:
+        for mask, data in rows[limit:].values_list('fields', 'data').iterator():
+            for name, value in decode(mask, bytes(data)).items():
+                state.setdefault(name, value)
+            if len(state) == len(TRACKED_FIELDS):
+                break
+    entries = []
+    for change in recent:
+        changes = decode(change.fields, bytes(change.data))
+        state = {**state, **changes}
+        entries.append({
+            'changed_at': change.changed_at,
+            'changes': changes,
+            'state': state,
+            'is_snapshot': change.is_snapshot,
+        })
+    return entries
+
+
+def compact_item(item_id, before):
+    """Fold one item's rows older than before into monthly snapshots; return rows removed."""
+    changes = list(
+        ItemChange.objects.select_for_update()
+        .filter(item_id=item_id, changed_at__lt=before)
+        .order_by('changed_at', 'id')
+    )
+    months = {}
+    for change in changes:
+        months.setdefault(month_of(change.changed_at), []).append(change)
+    state = {}
+    obsolete = []
+    snapshots = []
+    for month in sorted(months):
+        group = months[month]
+        for change in group:
+            state.update(decode(change.fields, bytes(change.data)))
+        if len(group) > 1:
+            obsolete.extend(change.pk for change in group)
+            snapshots.append(make_change(item_id, state, group[-1].changed_at, is_snapshot=True))
+    if obsolete:
+        ItemChange.objects.filter(pk__in=obsolete).delete()
+        ItemChange.objects.bulk_create(snapshots)
+    return len(obsolete) - len(snapshots)
+
+
+def compact_history(before, batch_size=500):
+    """
+    Fold history rows older than before into one snapshot per item and month.
+
+    Each snapshot holds every tracked value known at the end of its month,
+    so reads still replay to the same states. Items are compacted in
+    short transactions; returns the number of rows removed.
+    """
+    removed = 0
+    last_id = 0
+    while True:
+        item_ids = list(
+            ItemChange.objects.filter(changed_at__lt=before, item_id__gt=last_id)
+            .order_by('item_id').values_list('item_id', flat=True).distinct()[:batch_size]
+        )
+        if not item_ids:
+            return removed
+        last_id = item_ids[-1]
+        with transaction.atomic():
+            for item_id in item_ids:
+                removed += compact_item(item_id, before)
@@ -0,0 +1,107 @@
+"""
+Buyer spending and seller revenue ledgers.
+Each completed purchase is added to the buyer's and the seller's running
+totals and to their bucket for the month, in the transaction creating
+the purchase, and taken back out whenever the purchase is deleted.
+Profile and dashboard stats then read one row instead of summing
+purchase history.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Purchase, UserLedger, UserLedgerMonth
+
+
+def month_of(moment):
+    """First day of the (local) month containing a datetime."""
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def add_to(model, lookup, **deltas):
+    """Increment fields of the row matching lookup, creating it if needed."""
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**increments):
+        return
+    _, created = model.objects.get_or_create(**lookup, defaults=deltas)
+    if not created:
+        # Created concurrently since the UPDATE above.
+        model.objects.filter(**lookup).update(**increments)
+
+
+def ledger_deltas(purchase):
+    """Yield (user id, {field: amount}) of the ledgers a purchase counts in."""
+    yield purchase.buyer_id, {'spent': purchase.price_paid, 'purchase_count': 1}
+    if purchase.seller_id is not None:
+        yield purchase.seller_id, {'earned': purchase.price_paid, 'sale_count': 1}
+
+
+def record_purchase(purchase):
+    """Add a completed purchase to the buyer's and seller's ledgers."""
+    month = month_of(purchase.purchase_date)
+    for user_id, deltas in ledger_deltas(purchase):
+        add_to(UserLedger, {'user_id': user_id}, **deltas)
+        add_to(UserLedgerMonth, {'user_id': user_id, 'month': month}, **deltas)
+
+
+def remove_purchase(purchase):
+    """Take a deleted purchase back out of the buyer's and seller's ledgers."""
+    if purchase.status != 'completed':
+        return
+    month = month_of(purchase.purchase_date)
+    for user_id, deltas in ledger_deltas(purchase):
+        decrements = {field: F(field) - delta for field, delta in deltas.items()}
+        UserLedger.objects.filter(user_id=user_id).update(**decrements)
+        UserLedgerMonth.objects.filter(user_id=user_id, month=month).update(**decrements)
+
+
+def ledger_for(user):
+    """Return the user's ledger, or an empty unsaved one if they never traded."""
+    return UserLedger.objects.filter(user=user).first() or UserLedger(user=user)
+
+
+def recent_months(user, count=6):
+    """The user's latest monthly buckets, newest first."""
+    return list(UserLedgerMonth.objects.filter(user=user).order_by('-month')[:count])
+
+
+@transaction.atomic
+def rebuild_ledgers():
+    """
+    Recompute every ledger from the completed purchases; return the users counted.
+
+    Sales are credited to the purchase's seller, as record_purchase does.
+    """
+    empty = {'spent': Decimal('0.00'), 'purchase_count': 0, 'earned': Decimal('0.00'), 'sale_count': 0}
+    totals = defaultdict(lambda: dict(empty))
+    months = defaultdict(lambda: dict(empty))
+    completed = Purchase.objects.filter(status='completed').annotate(month=TruncMonth('purchase_date')).order_by()
+    for user_field, amount_field, count_field in (
+        ('buyer_id', 'spent', 'purchase_count'),
+        ('seller_id', 'earned', 'sale_count'),
+    ):
+        rows = completed.values(user_field, 'month').annotate(amount=Sum('price_paid'), count=Count('id'))
+        for row in rows:
+            user_id, month = row[user_field], row['month']
+            if user_id is None:
+                continue  # The seller's account was deleted.
+            month = month.date() if hasattr(month, 'date') else month
+            for bucket in (totals[user_id], months[user_id, month]):
+                bucket[amount_field] += row['amount']
+                bucket[count_field] += row['count']
+
+    UserLedgerMonth.objects.all().delete()
+    UserLedger.objects.all().delete()
+    UserLedger.objects.bulk_create(
+        UserLedger(user_id=user_id, **values) for user_id, values in totals.items()
+    )
+    UserLedgerMonth.objects.bulk_create(
+        (UserLedgerMonth(user_id=user_id, month=month, **values) for (user_id, month), values in months.items()),
+        batch_size=1000,
+    )
+    return len(totals)
@@ -0,0 +1,50 @@
+"""
+Hash the images of existing items for duplicate detection.
+
+New uploads are hashed as they are saved; this fills in items from
+before that, or rehashes everything with --all.
+"""
+
+from django.core.management.base import BaseCommand
+
+from items.duplicates import backfill_hashes
+from items.models import Item
+from items.pool import make_pool
+
+
+class Command(BaseCommand):
+    help = 'Compute perceptual hashes of item images and index them for duplicate detection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rehash items that already have a hash.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Items hashed per transaction.')
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Hash images in a pool of this many processes (default: inline).'
+        )
+
+    def handle(self, *args, **options):
+        items = Item.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            items = items.filter(image_hash=None)
+        pool = make_pool(options['processes'])
+        seen = hashed = 0
+        last_pk = 0
+        try:
+            while True:
+                batch = list(
+                    items.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'image')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                seen += len(batch)
+                hashed += backfill_hashes(batch, pool)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{seen} item(s) read')
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Hashed {hashed} of {seen} image(s); {seen - hashed} could not be read.'
+        ))
@@ -0,0 +1,33 @@
+"""
+Recompute the "similar items" of every for-sale item.
+
+Run it periodically (e.g. nightly); edits in between are applied
+incrementally by the run_outbox worker using the index saved here.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from items.similarity import build_similar_items
+
+
+class Command(BaseCommand):
+    help = 'Build TF-IDF vectors of for-sale items and store the top neighbours of each.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=None, help='Neighbours per item (default: SIMILAR_ITEMS).')
+        parser.add_argument(
+            '--min-score', type=float, default=None,
+            help='Minimum cosine similarity of a neighbour (default: SIMILAR_ITEMS).'
+        )
+        parser.add_argument(
+            '--block-size', type=int, default=512,
+            help='Items scored at a time; bounds memory use (default: 512).'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = build_similar_items(options['k'], options['min_score'], options['block_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} neighbour(s) in {elapsed:.1f}s.'))
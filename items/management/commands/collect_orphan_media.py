@@ -0,0 +1,34 @@
+"""
+Find (and optionally delete) media files no item or profile refers to.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from items.cleanup import find_orphan_media
+
+
+class Command(BaseCommand):
+    help = 'List media files under MEDIA_ROOT/items and MEDIA_ROOT/avatars that nothing references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true', help='Delete the orphaned files.')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Ignore files modified less than this many seconds ago (default: 3600).'
+        )
+
+    def handle(self, *args, **options):
+        count = size = 0
+        for name, path in find_orphan_media(min_age=options['min_age']):
+            try:
+                size += os.path.getsize(path)
+                if options['delete']:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            count += 1
+            self.stdout.write(name)
+        verb = 'Deleted' if options['delete'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} orphaned file(s), {size} bytes.'))
@@ -0,0 +1,27 @@
+"""
+Fold old item history into monthly snapshots.
+
+Every save appends the changed fields of an item; run this periodically
+(e.g. weekly from cron) so history older than --days keeps one row per
+item and month instead of one per change.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from items.history import compact_history
+
+
+class Command(BaseCommand):
+    help = 'Compact item change history older than --days into one snapshot per item and month.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Keep every change of the last N days.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Items compacted per transaction.')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        removed = compact_history(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} history row(s) older than {before:%Y-%m-%d}.'))
@@ -0,0 +1,22 @@
+"""
+Purge collections that owners have deleted.
+
+Deletion normally finishes in a background thread right after the request;
+run this periodically to finish purges interrupted by a restart.
+"""
+
+from django.core.management.base import BaseCommand
+
+from items.cleanup import purge_deleted_collections
+
+
+class Command(BaseCommand):
+    help = 'Delete the rows of soft-deleted collections in bounded chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=None, help='Seconds to sleep between chunks.')
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_collections(options['chunk_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} collection(s).'))
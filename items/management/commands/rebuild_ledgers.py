@@ -0,0 +1,18 @@
+"""
+Recompute buyer and seller ledgers from the purchase history.
+
+Ledgers are maintained incrementally as purchases complete; run this
+after importing purchases or editing them outside the views.
+"""
+
+from django.core.management.base import BaseCommand
+
+from items.ledger import rebuild_ledgers
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the spending and revenue ledgers of every user from completed purchases.'
+
+    def handle(self, *args, **options):
+        count = rebuild_ledgers()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the ledgers of {count} user(s).'))
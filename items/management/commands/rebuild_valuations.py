@@ -0,0 +1,28 @@
+"""
+Resync collection value snapshots with the live item totals.
+
+Snapshots are maintained incrementally from item saves; run this after
+bulk imports or queryset updates that bypass model signals.
+"""
+
+from django.core.management.base import BaseCommand
+
+from items.models import Collection
+from items.valuation import rebuild_today
+
+
+class Command(BaseCommand):
+    help = "Resync today's collection value snapshots and rollups with live item totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('collection_ids', nargs='*', type=int, help='Limit to these collections.')
+
+    def handle(self, *args, **options):
+        collections = Collection.objects.order_by('pk')
+        if options['collection_ids']:
+            collections = collections.filter(pk__in=options['collection_ids'])
+        count = 0
+        for collection_id in collections.values_list('pk', flat=True).iterator():
+            rebuild_today(collection_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Resynced {count} collection(s).'))
@@ -0,0 +1,98 @@
+"""
+Replay captured traffic against a running instance.
+
+Entries recorded by config.traffic.TrafficCaptureMiddleware are sent to
+--base-url from a thread or process pool, then throughput, error rate
+and latency percentiles are reported per route. Run it on a machine
+sharing the instance's database: requests of captured users are sent
+with sessions created for those users, others anonymously. The sessions
+are deleted once the replay is over.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.crypto import get_random_string
+
+from config.traffic import load_entries, options as capture_options, replay, summarize
+from items.pool import make_pool
+
+
+def login_sessions(user_ids):
+    """Return {user id: session cookie} for the users that exist."""
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+    sessions = {}
+    for user in get_user_model().objects.filter(pk__in=[pk for pk in user_ids if pk is not None]):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        sessions[user.pk] = {settings.SESSION_COOKIE_NAME: session.session_key}
+    return sessions
+
+
+def delete_sessions(sessions):
+    """Delete the sessions made by login_sessions."""
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+    for cookies in sessions.values():
+        SessionStore().delete(cookies[settings.SESSION_COOKIE_NAME])
+
+
+class Command(BaseCommand):
+    help = 'Replay captured requests concurrently and report latency percentiles per route.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*', help='Capture files or directories (default: TRAFFIC_CAPTURE["dir"]).'
+        )
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Instance to send requests to.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once.')
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread', help='Kind of worker pool.')
+        parser.add_argument(
+            '--speed', type=float, default=0,
+            help='Keep the captured spacing, sped up this many times (default 0: as fast as possible).'
+        )
+        parser.add_argument('--limit', type=int, default=None, help='Replay only the first N entries.')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for each response.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        entries = load_entries(options['paths'] or [capture_options()['dir']], options['limit'])
+        if not entries:
+            raise CommandError('No captured requests found.')
+        sessions = login_sessions({entry.get('user_id') for entry in entries})
+        if options['pool'] == 'process':
+            executor = make_pool(options['concurrency'])
+        else:
+            executor = ThreadPoolExecutor(max_workers=options['concurrency'])
+        try:
+            results, seconds = replay(
+                entries, options['base_url'], executor, sessions=sessions,
+                csrf_token=get_random_string(32), speed=options['speed'], timeout=options['timeout'],
+            )
+        finally:
+            executor.shutdown()
+            delete_sessions(sessions)
+        report = summarize(results, seconds)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f'{"route":<32} {"requests":>8} {"rps":>8} {"errors":>7} {"4xx":>5} '
+            f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+        )
+        for route, row in sorted(report.items(), key=lambda item: (item[0] == 'ALL', -item[1]['requests'])):
+            self.stdout.write(
+                f'{route:<32} {row["requests"]:>8} {row["rps"]:>8} {row["error_rate"]:>7.1%} '
+                f'{row["client_errors"]:>5} {row["p50_ms"]:>8} {row["p95_ms"]:>8} '
+                f'{row["p99_ms"]:>8} {row["max_ms"]:>8}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {len(results)} request(s) in {seconds:.1f}s; '
+            f'{len(sessions)} user session(s) created.'
+        ))
@@ -0,0 +1,71 @@
+"""
+Process outbox events: claim a batch, run its handlers, repeat.
+
+Run one or more of these next to the web workers; they coordinate through
+the outbox table alone. While the database stays locked by other writers
+the worker backs off and tries again instead of exiting.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from items.db import is_locked_error
+from items.outbox import claim_batch, process_batch, prune_done
+
+
+class Command(BaseCommand):
+    help = 'Run the handlers of committed outbox events, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the due events and exit.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Events claimed at a time.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when no event is due (default: 1).'
+        )
+        parser.add_argument(
+            '--prune-days', type=int, default=7,
+            help='Delete processed events older than this many days (default: 7).'
+        )
+        parser.add_argument(
+            '--prune-interval', type=float, default=3600,
+            help='Seconds between two prunes of processed events (default: 3600).'
+        )
+
+    def prune(self, days):
+        pruned = prune_done(days)
+        if pruned:
+            self.stdout.write(f'Pruned {pruned} processed event(s).')
+
+    def handle(self, *args, **options):
+        total_done = total_failed = 0
+        last_prune = None
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    if last_prune is None or time.monotonic() - last_prune >= options['prune_interval']:
+                        self.prune(options['prune_days'])
+                        last_prune = time.monotonic()
+                    events = claim_batch(options['batch_size'])
+                except OperationalError as exc:
+                    if not is_locked_error(exc):
+                        raise
+                    self.stderr.write('Database is locked; retrying.')
+                    time.sleep(options['poll_interval'])
+                    continue
+                if events:
+                    done, failed = process_batch(events)
+                    total_done += done
+                    total_failed += failed
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{done} done, {failed} failed')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {total_done} event(s), {total_failed} failure(s).'))
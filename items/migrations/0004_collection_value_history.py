@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0003_offer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionValueSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='value_snapshots', to='items.collection')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CollectionValueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('open_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('close_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('min_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('max_value', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='value_rollups', to='items.collection')),
+            ],
+            options={
+                'ordering': ['period_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='collectionvaluesnapshot',
+            constraint=models.UniqueConstraint(fields=('collection', 'date'), name='unique_collection_snapshot_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='collectionvaluerollup',
+            constraint=models.UniqueConstraint(fields=('collection', 'period', 'period_start'), name='unique_collection_rollup_period'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0004_collection_value_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['is_for_sale', '-updated_at', '-id'], name='item_sale_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['is_for_sale', 'sale_price', 'id'], name='item_sale_price_idx'),
+        ),
+    ]
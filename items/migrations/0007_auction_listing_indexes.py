@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0006_collection_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['status', '-start_date', '-id'], name='auction_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['status', 'end_date', 'id'], name='auction_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['seller', '-start_date', '-id'], name='auction_seller_start_idx'),
+        ),
+    ]
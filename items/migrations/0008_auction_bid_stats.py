@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+
+
+def backfill_bid_stats(apps, schema_editor):
+    Auction = apps.get_model('items', 'Auction')
+    Bid = apps.get_model('items', 'Bid')
+    bids = Bid.objects.filter(auction=OuterRef('pk')).order_by().values('auction')
+    Auction.objects.filter(pk__in=Bid.objects.values('auction')).update(
+        bid_count=Subquery(bids.annotate(n=Count('pk')).values('n'), output_field=IntegerField()),
+        unique_bidder_count=Subquery(
+            bids.annotate(n=Count('bidder', distinct=True)).values('n'), output_field=IntegerField()
+        ),
+        last_bid_at=Subquery(bids.annotate(last=Max('bid_date')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0007_auction_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='unique_bidder_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', '-bid_date', '-id'], name='bid_auction_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', 'bidder'], name='bid_auction_bidder_idx'),
+        ),
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0010_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_items', to='items.item')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='items.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-score'], name='similar_item_score_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='similaritem',
+            constraint=models.UniqueConstraint(fields=('item', 'similar'), name='unique_similar_item'),
+        ),
+    ]
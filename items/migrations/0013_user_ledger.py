@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:29
+
+from django.conf import settings
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def backfill_ledgers(apps, schema_editor):
+    Purchase = apps.get_model('items', 'Purchase')
+    UserLedger = apps.get_model('items', 'UserLedger')
+    UserLedgerMonth = apps.get_model('items', 'UserLedgerMonth')
+    empty = {'spent': Decimal('0.00'), 'purchase_count': 0, 'earned': Decimal('0.00'), 'sale_count': 0}
+    totals = defaultdict(lambda: dict(empty))
+    months = defaultdict(lambda: dict(empty))
+    completed = Purchase.objects.filter(status='completed').annotate(month=TruncMonth('purchase_date')).order_by()
+    for user_field, amount_field, count_field in (
+        ('buyer_id', 'spent', 'purchase_count'),
+        ('item__collection__owner_id', 'earned', 'sale_count'),
+    ):
+        for row in completed.values(user_field, 'month').annotate(amount=Sum('price_paid'), count=Count('id')):
+            month = row['month'].date() if hasattr(row['month'], 'date') else row['month']
+            for bucket in (totals[row[user_field]], months[row[user_field], month]):
+                bucket[amount_field] += row['amount']
+                bucket[count_field] += row['count']
+    UserLedger.objects.bulk_create(UserLedger(user_id=user_id, **values) for user_id, values in totals.items())
+    UserLedgerMonth.objects.bulk_create(
+        UserLedgerMonth(user_id=user_id, month=month, **values) for (user_id, month), values in months.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('items', '0012_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserLedger',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserLedgerMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_months', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='userledgermonth',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='unique_user_ledger_month'),
+        ),
+        migrations.RunPython(backfill_ledgers, migrations.RunPython.noop),
+    ]
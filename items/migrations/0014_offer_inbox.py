@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def backfill_offer_sellers(apps, schema_editor):
+    Collection = apps.get_model('items', 'Collection')
+    Offer = apps.get_model('items', 'Offer')
+    OfferInbox = apps.get_model('items', 'OfferInbox')
+    Offer.objects.update(
+        seller_id=Subquery(Collection.objects.filter(items=OuterRef('item_id')).values('owner_id')[:1])
+    )
+    # Offers pending before the inbox existed count as unread.
+    unread = Offer.objects.filter(status='pending').values('seller_id').annotate(n=Count('id')).order_by()
+    OfferInbox.objects.bulk_create(OfferInbox(seller_id=row['seller_id'], unread_count=row['n']) for row in unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('items', '0013_user_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferInbox',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='offer_inbox', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='seller',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='offers_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_offer_sellers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='offer',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers_received', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['seller', 'status', '-created_at', '-id'], name='offer_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Frozen copy of the encoding in items/history.py as of this migration.
+TRACKED_FIELDS = ('value', 'sale_price', 'condition', 'is_for_sale')
+CONDITIONS = ('excellent', 'good', 'fair', 'poor')
+
+
+def write_varint(number, out):
+    number = number * 2 if number >= 0 else -number * 2 - 1  # zigzag
+    while number > 0x7f:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def encode(row):
+    """Pack every tracked field of an item row into (mask, bytes)."""
+    out = bytearray()
+    write_varint(int(row['value'] * 100), out)
+    price = row['sale_price']
+    write_varint(0 if price is None else int(price * 100) + (1 if price >= 0 else 0), out)
+    out.append(CONDITIONS.index(row['condition']) if row['condition'] in CONDITIONS else 0xff)
+    out.append(bool(row['is_for_sale']))
+    return (1 << len(TRACKED_FIELDS)) - 1, bytes(out)
+
+
+def backfill_item_history(apps, schema_editor):
+    """Start each existing item's history with a snapshot of its current values."""
+    Item = apps.get_model('items', 'Item')
+    ItemChange = apps.get_model('items', 'ItemChange')
+    changes = []
+    for row in Item.objects.values('id', 'updated_at', *TRACKED_FIELDS).iterator(chunk_size=2000):
+        fields, data = encode(row)
+        changes.append(ItemChange(
+            item_id=row['id'], changed_at=row['updated_at'], fields=fields, data=data, is_snapshot=True,
+        ))
+        if len(changes) >= 2000:
+            ItemChange.objects.bulk_create(changes)
+            changes = []
+    ItemChange.objects.bulk_create(changes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0014_offer_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fields', models.PositiveSmallIntegerField()),
+                ('data', models.BinaryField()),
+                ('is_snapshot', models.BooleanField(default=False)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='items.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'changed_at', 'id'], name='item_change_history_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_item_history, migrations.RunPython.noop),
+    ]
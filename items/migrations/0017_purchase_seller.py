@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_sellers(apps, schema_editor):
+    """Credit auction wins to the auction's seller and other purchases to the collection owner."""
+    Auction = apps.get_model('items', 'Auction')
+    Item = apps.get_model('items', 'Item')
+    Purchase = apps.get_model('items', 'Purchase')
+    auction_seller = Auction.objects.filter(
+        item_id=OuterRef('item_id'), status='sold', highest_bidder_id=OuterRef('buyer_id'),
+    ).values('seller_id')[:1]
+    owner = Item.objects.filter(pk=OuterRef('item_id')).values('collection__owner_id')[:1]
+    Purchase.objects.update(seller_id=Coalesce(Subquery(auction_seller), Subquery(owner)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('items', '0016_collection_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='seller',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_sellers, migrations.RunPython.noop),
+    ]
@@ -5,6 +5,24 @@ Represents objects and collections for economics tracking.
 
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+
+class CollectionManager(models.Manager):
+    """Manager hiding collections that are pending deletion."""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class AuctionQuerySet(models.QuerySet):
+    """Query helpers for auctions."""
+    
+    def live(self):
+        """Auctions still open for bids: active and not past their end date."""
+        return self.filter(status='active', end_date__gt=timezone.now())
 
 
 class Collection(models.Model):
@@ -16,6 +34,11 @@ class Collection(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when the owner deletes the collection; rows are purged in the background.
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    objects = CollectionManager()
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['-created_at']
@@ -53,6 +76,8 @@ class Item(models.Model):
         default='good'
     )
     image = models.ImageField(upload_to='items/', null=True, blank=True)
+    # 64-bit perceptual hash of the image (see items/duplicates.py).
+    image_hash = models.BigIntegerField(null=True, blank=True, editable=False)
     is_for_sale = models.BooleanField(default=False)  # Can be purchased
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -62,9 +87,94 @@ class Item(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
+        indexes = [
+            # Keyset pagination of marketplace listings
+            models.Index(fields=['is_for_sale', '-updated_at', '-id'], name='item_sale_updated_idx'),
+            models.Index(fields=['is_for_sale', 'sale_price', 'id'], name='item_sale_price_idx'),
+        ]
     
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded field values so saves can compute deltas."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Save, then remember the saved values once every post_save receiver has compared them."""
+        super().save(*args, **kwargs)
+        self.remember_saved_values(kwargs.get('update_fields'))
+    
+    def remember_saved_values(self, update_fields=None):
+        saved = dict(getattr(self, '_loaded_values', {}))
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if update_fields is not None and field.name not in update_fields and field.attname not in update_fields:
+                continue
+            value = getattr(self, field.attname)
+            saved[field.attname] = value.name if isinstance(value, FieldFile) else value
+        self._loaded_values = saved
+
+
+class ImageHashKey(models.Model):
+    """
+    One band of an item's image hash, for finding near-duplicate images.
+
+    Each hash is split into bands stored as separate keys, so any two
+    hashes within items.duplicates.MAX_DISTANCE bits share at least one.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='image_hash_keys')
+    key = models.IntegerField(db_index=True)
+
+
+class SimilarItem(models.Model):
+    """
+    A precomputed "similar items" neighbour of a for-sale item.
+
+    Rebuilt by the build_similar_items command and kept current for
+    edited items by items.similarity.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='similar_items')
+    similar = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'similar'], name='unique_similar_item'),
+        ]
+        indexes = [
+            models.Index(fields=['item', '-score'], name='similar_item_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.item_id} ~ {self.similar_id} ({self.score:.2f})"
+
+
+class ItemChange(models.Model):
+    """
+    Changed price, condition and sale fields of an item, compactly encoded.
+
+    Rows are only appended; items.history decodes them and folds old rows
+    into one snapshot per item and month.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='changes')
+    changed_at = models.DateTimeField(default=timezone.now)
+    fields = models.PositiveSmallIntegerField()  # Bit mask of items.history.TRACKED_FIELDS in data
+    data = models.BinaryField()
+    is_snapshot = models.BooleanField(default=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'changed_at', 'id'], name='item_change_history_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Change of item {self.item_id} at {self.changed_at}"
 
 
 class Purchase(models.Model):
@@ -73,6 +183,8 @@ class Purchase(models.Model):
     """
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='purchases')
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    # Who the sale is credited to: the collection owner, or the auction's seller.
+    seller = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     price_paid = models.DecimalField(max_digits=10, decimal_places=2)
     purchase_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
@@ -92,6 +204,43 @@ class Purchase(models.Model):
         return f"{self.buyer.username} bought {self.item.name}"
 
 
+class UserLedger(models.Model):
+    """
+    Running purchase and sale totals of a user.
+    Updated in the transaction that completes each purchase, so profile
+    and dashboard stats are a primary-key lookup.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='ledger')
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchase_count = models.PositiveIntegerField(default=0)
+    earned = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sale_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Ledger of user {self.user_id}"
+
+
+class UserLedgerMonth(models.Model):
+    """
+    A user's purchase and sale totals for one calendar month.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_months')
+    month = models.DateField()  # First day of the month
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    purchase_count = models.PositiveIntegerField(default=0)
+    earned = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sale_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['month']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_user_ledger_month'),
+        ]
+    
+    def __str__(self):
+        return f"Ledger of user {self.user_id} for {self.month:%Y-%m}"
+
+
 class Auction(models.Model):
     """
     Represents an auction for an item.
@@ -113,9 +262,21 @@ class Auction(models.Model):
         ],
         default='active'
     )
+    # Maintained by items.bidding.place_bid in the bid's transaction
+    bid_count = models.PositiveIntegerField(default=0)
+    unique_bidder_count = models.PositiveIntegerField(default=0)
+    last_bid_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = AuctionQuerySet.as_manager()
     
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Live auction listing, newest first or ending soonest first
+            models.Index(fields=['status', '-start_date', '-id'], name='auction_status_start_idx'),
+            models.Index(fields=['status', 'end_date', 'id'], name='auction_status_end_idx'),
+            models.Index(fields=['seller', '-start_date', '-id'], name='auction_seller_start_idx'),
+        ]
     
     def __str__(self):
         return f"Auction: {self.item.name} (${self.current_price})"
@@ -137,11 +298,42 @@ class Bid(models.Model):
     
     class Meta:
         ordering = ['-bid_date']
+        indexes = [
+            # Paginated bid history and the first-bid check of place_bid
+            models.Index(fields=['auction', '-bid_date', '-id'], name='bid_auction_date_idx'),
+            models.Index(fields=['auction', 'bidder'], name='bid_auction_bidder_idx'),
+        ]
     
     def __str__(self):
         return f"{self.bidder.username} bid ${self.amount} on {self.auction.item.name}"
 
 
+class ProxyBid(models.Model):
+    """
+    A bidder's standing maximum on an auction.
+
+    items.bidding bids on the bidder's behalf, up to max_amount, whenever
+    someone else takes the lead.
+    """
+    auction = models.ForeignKey(Auction, on_delete=models.CASCADE, related_name='proxy_bids')
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='proxy_bids')
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # When max_amount was last set; the earlier of two equal maximums wins.
+    placed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['auction', 'bidder'], name='unique_proxy_bid'),
+        ]
+        indexes = [
+            # Highest maximum first, earliest first on ties
+            models.Index(fields=['auction', '-max_amount', 'placed_at', 'id'], name='proxy_bid_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.bidder.username} up to ${self.max_amount} on {self.auction.item.name}"
+
+
 class Cart(models.Model):
     """
     Shopping cart for purchases.
@@ -169,10 +361,14 @@ class Offer(models.Model):
     """
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='offers')
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='offers_made')
+    # Owner of the item's collection, copied so the seller inbox is one index scan.
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='offers_received')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When the seller last saw the offer in their inbox; null while unread.
+    seen_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(
         max_length=50,
         choices=[
@@ -186,6 +382,152 @@ class Offer(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['seller', 'status', '-created_at', '-id'], name='offer_inbox_idx'),
+        ]
     
     def __str__(self):
         return f"Offer: {self.buyer.username} offered ${self.amount} for {self.item.name}"
+
+
+class OfferInbox(models.Model):
+    """
+    Number of pending offers a seller has not seen yet.
+    Maintained as offers arrive, are seen and close (see items/offers.py).
+    """
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='offer_inbox')
+    unread_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Offer inbox of user {self.seller_id}"
+
+
+class CollectionValueSnapshot(models.Model):
+    """
+    Total value of a collection at the end of a day.
+    Only written on days where an item value changes.
+    """
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='value_snapshots')
+    date = models.DateField()
+    total_value = models.DecimalField(max_digits=14, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'date'], name='unique_collection_snapshot_date'),
+        ]
+    
+    def __str__(self):
+        return f"{self.collection.name} on {self.date}: {self.total_value}"
+
+
+class CollectionValueRollup(models.Model):
+    """
+    Weekly or monthly open/close/min/max value of a collection.
+    Maintained alongside the daily snapshots.
+    """
+    PERIOD_WEEK = 'week'
+    PERIOD_MONTH = 'month'
+    
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='value_rollups')
+    period = models.CharField(
+        max_length=10,
+        choices=[
+            (PERIOD_WEEK, 'Week'),
+            (PERIOD_MONTH, 'Month'),
+        ]
+    )
+    period_start = models.DateField()
+    open_value = models.DecimalField(max_digits=14, decimal_places=2)
+    close_value = models.DecimalField(max_digits=14, decimal_places=2)
+    min_value = models.DecimalField(max_digits=14, decimal_places=2)
+    max_value = models.DecimalField(max_digits=14, decimal_places=2)
+    
+    class Meta:
+        ordering = ['period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['collection', 'period', 'period_start'],
+                name='unique_collection_rollup_period'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.collection.name} {self.period} of {self.period_start}: {self.close_value}"
+
+
+class CollectionArchive(models.Model):
+    """
+    A zip export of a collection built in the background for later download.
+
+    Small collections are streamed directly instead (see items/archive.py).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='archives')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collection_archives')
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            (STATUS_PENDING, 'Pending'),
+            (STATUS_READY, 'Ready'),
+            (STATUS_FAILED, 'Failed'),
+        ],
+        default=STATUS_PENDING
+    )
+    file_name = models.CharField(max_length=255, blank=True)  # In COLLECTION_ARCHIVE['dir']
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Archive of {self.collection.name} ({self.status})"
+
+
+class OutboxEvent(models.Model):
+    """
+    A side effect to run after a domain change has committed.
+
+    Written in the same transaction as the change (items.outbox.publish)
+    and processed by the run_outbox management command.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            (STATUS_PENDING, 'Pending'),
+            (STATUS_PROCESSING, 'Processing'),
+            (STATUS_DONE, 'Done'),
+            (STATUS_FAILED, 'Failed'),
+        ],
+        default=STATUS_PENDING
+    )
+    # Next attempt for pending events, lease expiry for processing ones
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id'], name='outbox_claim_idx'),
+            models.Index(fields=['claim_token'], name='outbox_claim_token_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} #{self.pk} ({self.status})"
@@ -0,0 +1,85 @@
+"""
+Seller offer inbox for the items application.
+Pending offers on all of a seller's items are listed newest first from
+one index on (seller, status, created_at, id), with the buyer and item
+joined in. Each seller's count of unseen pending offers is kept in
+OfferInbox and adjusted whenever an offer arrives, is seen or closes,
+so badges never count offers.
+"""
+
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .ledger import add_to
+from .models import Offer, OfferInbox
+from .pagination import keyset_page
+
+
+OFFERS_PER_PAGE = 25
+
+
+def is_unread(offer):
+    return offer.status == 'pending' and offer.seen_at is None
+
+
+def add_unread(seller_id, count):
+    """Change a seller's unread count by count (never below zero)."""
+    if count > 0:
+        add_to(OfferInbox, {'seller_id': seller_id}, unread_count=count)
+    elif count < 0:
+        OfferInbox.objects.filter(seller_id=seller_id).update(unread_count=Greatest(F('unread_count') + count, 0))
+
+
+def unread_count(seller):
+    return OfferInbox.objects.filter(seller=seller).values_list('unread_count', flat=True).first() or 0
+
+
+def make_offer(item, buyer, amount, message=''):
+    """
+    Create the buyer's pending offer on item, or update it; return (offer, created).
+
+    A changed offer is unread again so the seller notices it.
+    """
+    offer = Offer.objects.filter(item=item, buyer=buyer, status='pending').first()
+    if offer is None:
+        offer = Offer.objects.create(
+            item=item, buyer=buyer, seller_id=item.collection.owner_id, amount=amount, message=message,
+        )
+        return offer, True
+    was_seen = offer.seen_at is not None
+    offer.amount = amount
+    offer.message = message
+    offer.seen_at = None
+    offer.save()
+    if was_seen:
+        add_unread(offer.seller_id, 1)
+    return offer, False
+
+
+def close_offers(offers, status):
+    """Move the pending offers in a queryset to status; return how many."""
+    pending = offers.filter(status='pending')
+    unread = list(
+        pending.filter(seen_at=None).order_by().values('seller_id').annotate(count=Count('id'))
+        .values_list('seller_id', 'count')
+    )
+    closed = pending.update(status=status, updated_at=timezone.now())
+    for seller_id, count in unread:
+        add_unread(seller_id, -count)
+    return closed
+
+
+def mark_seen(seller, offer_ids):
+    """Mark the seller's listed offers as seen; return how many were unread."""
+    count = Offer.objects.filter(
+        seller=seller, pk__in=offer_ids, status='pending', seen_at=None,
+    ).update(seen_at=timezone.now())
+    add_unread(seller.pk, -count)
+    return count
+
+
+def inbox_page(seller, cursor=None, limit=OFFERS_PER_PAGE):
+    """Return (offers, next_cursor): one page of the seller's pending offers, newest first."""
+    offers = Offer.objects.filter(seller=seller, status='pending').select_related('buyer', 'item')
+    return keyset_page(offers, 'created_at', True, cursor, limit)
@@ -0,0 +1,166 @@
+"""
+Transactional outbox for the items application.
+Views publish events in the same transaction as the change they describe,
+so an event exists if and only if the change committed. The run_outbox
+command claims events in batches and runs the registered handlers,
+retrying failures with exponential backoff. Delivery is at least once,
+so handlers must be idempotent. Claims and status updates are retried
+while SQLite is locked by another writer.
+"""
+
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+# topic -> [(handler, atomic)]
+HANDLERS = {}
+
+DEFAULT_CONFIG = {
+    'batch_size': 100,
+    'max_attempts': 10,
+    'base_delay': 1.0,
+    'max_delay': 600.0,
+    'lease': 300,
+}
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'OUTBOX', {})}
+
+
+def handler(*topics, atomic=True):
+    """
+    Register a function as the handler of topics; it receives the payload.
+
+    Pass atomic=False for long-running handlers that must not hold the
+    database write lock; they run outside the event's transaction and open
+    their own short ones.
+    """
+    def register(func):
+        for topic in topics:
+            HANDLERS.setdefault(topic, []).append((func, atomic))
+        return func
+    return register
+
+
+def publish(topic, **payload):
+    """Record an event; call inside the transaction making the change."""
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def publish_many(topic, payloads):
+    """Record one event per payload in a single INSERT; call inside the transaction."""
+    return OutboxEvent.objects.bulk_create(OutboxEvent(topic=topic, payload=payload) for payload in payloads)
+
+
+def retry_delay(attempts, base_delay, max_delay):
+    """Seconds before retrying an event that failed attempts times."""
+    delay = min(max_delay, base_delay * (2 ** (attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+@retry_on_locked
+def claim_batch(batch_size=None, lease=None):
+    """
+    Claim up to batch_size due events for this worker and return them.
+
+    The claim is one conditional UPDATE stamping a fresh token, so two
+    workers never get the same event; an event whose worker died is
+    claimable again once its lease expires. Attempts are counted at claim
+    time so an event that crashes its worker still runs out of retries.
+    """
+    config = get_config()
+    batch_size = batch_size or config['batch_size']
+    lease = lease or config['lease']
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = OutboxEvent.objects.filter(
+        status__in=[OutboxEvent.STATUS_PENDING, OutboxEvent.STATUS_PROCESSING], available_at__lte=now,
+    )
+    due.filter(status=OutboxEvent.STATUS_PROCESSING, attempts__gte=config['max_attempts']).update(
+        status=OutboxEvent.STATUS_FAILED, last_error='Lease expired on the last attempt.',
+    )
+    ids = list(due.order_by('available_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    due.filter(pk__in=ids).update(
+        status=OutboxEvent.STATUS_PROCESSING,
+        available_at=now + timedelta(seconds=lease),
+        claim_token=token,
+        attempts=F('attempts') + 1,
+    )
+    return list(OutboxEvent.objects.filter(claim_token=token, status=OutboxEvent.STATUS_PROCESSING))
+
+
+def process_batch(events):
+    """
+    Run the handlers of claimed events; return (done, failed) counts.
+
+    Atomic handlers of one event run in a single transaction, then the
+    event's non-atomic handlers run outside it.
+    """
+    config = get_config()
+    done, failed = [], 0
+    for event in events:
+        handlers = HANDLERS.get(event.topic, [])
+        try:
+            with transaction.atomic():
+                for func, atomic in handlers:
+                    if atomic:
+                        func(event.payload)
+            for func, atomic in handlers:
+                if not atomic:
+                    func(event.payload)
+        except Exception:
+            failed += 1
+            logger.warning('Outbox event %s (%s) failed', event.pk, event.topic, exc_info=True)
+            mark_failed(event, traceback.format_exc(), config)
+        else:
+            done.append(event.pk)
+
+    if done:
+        mark_done(done, events[0].claim_token)
+    return len(done), failed
+
+
+@retry_on_locked
+def mark_done(pks, claim_token):
+    """Mark the claimed events as processed."""
+    OutboxEvent.objects.filter(pk__in=pks, claim_token=claim_token).update(
+        status=OutboxEvent.STATUS_DONE, processed_at=timezone.now(), last_error='',
+    )
+
+
+@retry_on_locked
+def mark_failed(event, error, config):
+    """Schedule a retry with backoff, or give up after max_attempts."""
+    attempts = event.attempts
+    if attempts >= config['max_attempts']:
+        status, available_at = OutboxEvent.STATUS_FAILED, timezone.now()
+    else:
+        delay = retry_delay(attempts, config['base_delay'], config['max_delay'])
+        status, available_at = OutboxEvent.STATUS_PENDING, timezone.now() + timedelta(seconds=delay)
+    OutboxEvent.objects.filter(pk=event.pk, claim_token=event.claim_token).update(
+        status=status, available_at=available_at, last_error=error[-4000:],
+    )
+
+
+@retry_on_locked
+def prune_done(older_than_days):
+    """Delete events processed more than older_than_days ago; return how many."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    count, _ = OutboxEvent.objects.filter(status=OutboxEvent.STATUS_DONE, processed_at__lt=cutoff).delete()
+    return count
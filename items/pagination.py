@@ -0,0 +1,83 @@
+"""
+Keyset (cursor) pagination helpers.
+Pages are selected with an indexed range condition on the sort key and
+primary key instead of OFFSET, so every page costs the same.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor that cannot be decoded."""
+
+
+def encode_cursor(*values):
+    """Encode the sort values of the last row of a page as an opaque cursor."""
+    def plain(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+    payload = json.dumps([plain(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, count):
+    """Decode a cursor produced by encode_cursor into count raw values."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Malformed cursor.')
+    if not isinstance(values, list) or len(values) != count:
+        raise InvalidCursor('Malformed cursor.')
+    return values
+
+
+def keyset_filter(model, field_name, descending, cursor):
+    """
+    Return the Q object selecting rows after the cursor.
+
+    Rows are ordered by (field_name, pk), both descending or both
+    ascending; the cursor holds the values of the last row seen.
+    """
+    raw_value, raw_pk = decode_cursor(cursor, 2)
+    try:
+        value = model._meta.get_field(field_name).to_python(raw_value)
+        pk = model._meta.pk.to_python(raw_pk)
+    except Exception:
+        raise InvalidCursor('Malformed cursor.')
+    if value is None or pk is None:
+        raise InvalidCursor('Malformed cursor.')
+    if isinstance(value, datetime) and value.tzinfo is None:
+        raise InvalidCursor('Malformed cursor.')
+    op = 'lt' if descending else 'gt'
+    return Q(**{f'{field_name}__{op}': value}) | Q(**{field_name: value, f'pk__{op}': pk})
+
+
+def keyset_ordering(field_name, descending):
+    """Return the order_by() arguments matching keyset_filter."""
+    prefix = '-' if descending else ''
+    return [f'{prefix}{field_name}', f'{prefix}pk']
+
+
+def keyset_page(queryset, field_name, descending, cursor=None, limit=24):
+    """
+    Return (rows, next_cursor) for one page of queryset.
+
+    Fetches one row more than limit to learn whether another page follows;
+    next_cursor is None on the last page. Raises InvalidCursor.
+    """
+    if cursor:
+        queryset = queryset.filter(keyset_filter(queryset.model, field_name, descending, cursor))
+    rows = list(queryset.order_by(*keyset_ordering(field_name, descending))[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], field_name), rows[-1].pk)
@@ -0,0 +1,22 @@
+"""
+Process pools for management commands.
+Workers are spawned fresh and set up Django before running any task, so
+they can use the ORM and settings like the parent process.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+def make_pool(processes):
+    """Return a process pool of workers with Django set up, or None for processes=0."""
+    if not processes:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        # Referenced directly: importing this module would need the app registry.
+        initializer=django.setup,
+    )
@@ -0,0 +1,131 @@
+"""
+Per-client rate limiting for write endpoints.
+Requests are counted in the cache with atomic increments over a sliding
+window (the previous fixed window weighted by how much of it still
+overlaps). With a shared cache backend such as Redis every worker
+process draws from the same budget. Limits are configured per route in
+settings.RATE_LIMITS and checked before the view runs. Logged-in clients
+are counted by user, anonymous ones by address: a session cookie is
+dropped or replaced at will, so it never identifies a client.
+"""
+
+import math
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """Parse '10/m' or '100/15m' into (requests, period in seconds)."""
+    match = RATE_RE.match(rate.strip())
+    if not match:
+        raise ValueError(f'Invalid rate: {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * UNITS[unit]
+
+
+def client_id(request):
+    """Identify the client by its user when logged in, or by its address."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    return 'a' + request.META.get('REMOTE_ADDR', '')
+
+
+def window_keys(route, ident, period, now):
+    window = int(now // period)
+    prefix = f'ratelimit:{route}:{ident}:'
+    return prefix + str(window), prefix + str(window - 1)
+
+
+def retry_after(limit, period, now, current, previous):
+    """Seconds until the request is allowed, or 0 if it is allowed now."""
+    elapsed = (now % period) / period
+    if previous * (1 - elapsed) + current <= limit:
+        return 0
+    if current > limit or not previous:
+        wait = period - now % period
+    else:
+        wait = (1 - (limit - current) / previous - elapsed) * period
+    return max(1, math.ceil(wait))
+
+
+def hit(route, request, limit, period):
+    """Count a request against route; return seconds to wait (0 if allowed)."""
+    now = time.time()
+    current_key, previous_key = window_keys(route, client_id(request), period, now)
+    cache.add(current_key, 0, period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:  # expired between add and incr
+        cache.set(current_key, 1, period * 2)
+        current = 1
+    return retry_after(limit, period, now, current, cache.get(previous_key, 0))
+
+
+async def ahit(route, request, limit, period):
+    """Async version of hit()."""
+    # request.user loads from the session (a sync DB call); later accesses are free.
+    ident = await sync_to_async(client_id)(request)
+    now = time.time()
+    current_key, previous_key = window_keys(route, ident, period, now)
+    await cache.aadd(current_key, 0, period * 2)
+    try:
+        current = await cache.aincr(current_key)
+    except ValueError:
+        await cache.aset(current_key, 1, period * 2)
+        current = 1
+    return retry_after(limit, period, now, current, await cache.aget(previous_key, 0))
+
+
+def get_limit(route):
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(route)
+    if not rate or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return None
+    return parse_rate(rate)
+
+
+def too_many_requests(wait):
+    response = HttpResponse('Too many requests, please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def rate_limit(route, methods=None):
+    """
+    Limit a view to settings.RATE_LIMITS[route] requests per client.
+
+    Only requests whose method is in methods are counted (all if None).
+    Put it above login_required so anonymous requests are limited too.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                limit = get_limit(route)
+                if limit and (methods is None or request.method in methods):
+                    wait = await ahit(route, request, *limit)
+                    if wait:
+                        return too_many_requests(wait)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = get_limit(route)
+            if limit and (methods is None or request.method in methods):
+                wait = hit(route, request, *limit)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,147 @@
+"""
+Signals for items app.
+Keeps collection valuation snapshots in step with item value changes,
+queues similarity updates when an item's text changes, hashes newly
+set images for duplicate detection, appends price and sale changes to
+the item history, keeps sellers' unread offer counts current, takes
+deleted purchases out of the ledgers and removes the files of deleted
+collection archives.
+Item receivers only read _loaded_values, the values an item was loaded
+or last saved with; Item.save refreshes it after they have all run.
+"""
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .archive import remove_archive_file
+from .duplicates import dhash, hash_stored_image, store_hash_keys
+from .history import changed_values, record_change
+from .ledger import remove_purchase
+from .models import Collection, CollectionArchive, Item, Offer, Purchase
+from .offers import add_unread, is_unread
+from .outbox import publish
+from .valuation import is_tracking_paused, record_value_change, to_decimal
+
+
+@receiver(pre_save, sender=Item)
+def hash_item_image(sender, instance, raw=False, **kwargs):
+    """Compute the image hash when the image is new or replaced."""
+    if raw or 'image' in instance.get_deferred_fields():
+        return
+    image = instance.image
+    loaded = getattr(instance, '_loaded_values', None)
+    if not image:
+        instance.image_hash = None
+    elif not image._committed:
+        # A fresh upload, hashed before it is written to storage.
+        instance.image_hash = dhash(image)
+    elif loaded is None or loaded.get('image') != image.name:
+        instance.image_hash = hash_stored_image(image.name)
+
+
+@receiver(post_save, sender=Item)
+def index_item_image(sender, instance, created, raw=False, **kwargs):
+    """Keep the duplicate-detection keys in step with the image hash."""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created and instance.image_hash is not None or 'image_hash' in loaded and (
+        loaded['image_hash'] != instance.image_hash
+    ):
+        store_hash_keys(instance.pk, instance.image_hash)
+
+
+@receiver(post_save, sender=Item)
+def record_item_history(sender, instance, created, raw=False, **kwargs):
+    """Append the changed value, sale price, condition and sale flag to the history."""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    changes = changed_values(instance, loaded, created)
+    if changes:
+        record_change(instance.pk, changes)
+
+
+SIMILARITY_FIELDS = ('name', 'description', 'is_for_sale', 'collection_id')
+
+
+@receiver(post_save, sender=Item)
+def queue_similarity_update(sender, instance, created, raw=False, **kwargs):
+    """Publish item.text_changed when a for-sale item's similarity inputs change."""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if created:
+        changed = instance.is_for_sale
+    else:
+        changed = any(
+            field in loaded and loaded[field] != getattr(instance, field) for field in SIMILARITY_FIELDS
+        )
+    if changed:
+        publish('item.text_changed', item_id=instance.pk)
+
+
+@receiver(post_save, sender=Item)
+def record_item_value(sender, instance, created, raw=False, **kwargs):
+    """Record value changes of a saved item against its collection."""
+    if raw or is_tracking_paused():
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    new_value = to_decimal(instance.value)
+    old_collection_id = loaded.get('collection_id', instance.collection_id)
+    
+    if created:
+        record_value_change(instance.collection_id, new_value, 1)
+    elif 'value' in loaded:
+        old_value = to_decimal(loaded['value'])
+        if old_collection_id != instance.collection_id:
+            record_value_change(old_collection_id, -old_value, -1)
+            record_value_change(instance.collection_id, new_value, 1)
+        elif new_value != old_value:
+            record_value_change(instance.collection_id, new_value - old_value)
+
+
+@receiver(post_delete, sender=Item)
+def record_item_removal(sender, instance, origin=None, **kwargs):
+    """Remove a deleted item's value from its collection."""
+    # Cascades from a collection (or its owner) delete the history too.
+    deleted_directly = isinstance(origin, Item) or (
+        isinstance(origin, QuerySet) and origin.model is Item
+    )
+    if deleted_directly and not is_tracking_paused():
+        record_value_change(instance.collection_id, -to_decimal(instance.value), -1)
+
+
+@receiver(pre_save, sender=Offer)
+def set_offer_seller(sender, instance, raw=False, **kwargs):
+    """Copy the item's owner onto new offers for the seller inbox."""
+    if not raw and instance.seller_id is None:
+        instance.seller_id = Collection.all_objects.filter(items=instance.item_id).values_list(
+            'owner_id', flat=True
+        ).get()
+
+
+@receiver(post_save, sender=Offer)
+def count_new_offer(sender, instance, created, raw=False, **kwargs):
+    """A new pending offer is unread by its seller."""
+    if created and not raw and is_unread(instance):
+        add_unread(instance.seller_id, 1)
+
+
+@receiver(post_delete, sender=Offer)
+def uncount_deleted_offer(sender, instance, **kwargs):
+    """Deleting an unread offer (e.g. with its item) takes it off the count."""
+    if is_unread(instance):
+        add_unread(instance.seller_id, -1)
+
+
+@receiver(post_delete, sender=Purchase)
+def uncount_deleted_purchase(sender, instance, **kwargs):
+    """Deleting a purchase (directly, with its item or in a purge) updates the ledgers."""
+    remove_purchase(instance)
+
+
+@receiver(post_delete, sender=CollectionArchive)
+def delete_archive_file(sender, instance, **kwargs):
+    """Remove the zip of a deleted (replaced or purged) archive."""
+    remove_archive_file(instance)
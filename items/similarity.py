@@ -0,0 +1,249 @@
+"""
+"Similar items" recommendations.
+For-sale items are turned into TF-IDF vectors over their name,
+description and collection name, stored as a sparse matrix. The top
+neighbours of every item are computed offline in row blocks and saved in
+SimilarItem, so item_detail only reads them back through an index. When
+an item's text changes, its neighbours and the lists it now belongs to
+are updated from the saved index with one sparse matrix-vector product;
+an item taken off sale leaves every list and the saved index.
+"""
+
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from scipy import sparse
+
+from .models import Item, SimilarItem
+
+
+TOKEN_RE = re.compile(r'[^\W\d_]{2,}')
+# Repetitions of each field's tokens: names say more than descriptions.
+FIELD_WEIGHTS = (('name', 2), ('description', 1), ('collection__name', 1))
+TEXT_FIELDS = ('pk',) + tuple(field for field, weight in FIELD_WEIGHTS)
+
+DEFAULT_CONFIG = {
+    'k': 8,
+    'min_score': 0.1,
+    'index_path': None,
+}
+
+
+def get_config():
+    config = {**DEFAULT_CONFIG, **getattr(settings, 'SIMILAR_ITEMS', {})}
+    config['index_path'] = str(config['index_path'] or os.path.join(settings.BASE_DIR, 'var', 'similar_items.npz'))
+    return config
+
+
+def tokens(row):
+    """Return the weighted tokens of an item row (a dict of TEXT_FIELDS)."""
+    result = []
+    for field, weight in FIELD_WEIGHTS:
+        result += TOKEN_RE.findall((row.get(field) or '').lower()) * weight
+    return result
+
+
+class TextIndex:
+    """Row-normalized TF-IDF vectors of items with the fitted vocabulary."""
+
+    def __init__(self, item_ids, vocabulary, idf, matrix):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix.tocsr()
+
+    @classmethod
+    def fit(cls, rows):
+        """Build the index from item rows."""
+        documents = [Counter(tokens(row)) for row in rows]
+        vocabulary = {term: i for i, term in enumerate(sorted(set().union(*documents)))}
+        counts = cls._counts(documents, vocabulary)
+        df = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = np.log((1 + len(documents)) / (1 + df)) + 1
+        return cls([row['pk'] for row in rows], vocabulary, idf, cls._weigh(counts, idf))
+
+    @staticmethod
+    def _counts(documents, vocabulary):
+        indptr, indices, data = [0], [], []
+        for document in documents:
+            for term, count in document.items():
+                column = vocabulary.get(term)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(documents), len(vocabulary)),
+        )
+
+    @staticmethod
+    def _weigh(counts, idf):
+        """Sublinear term frequency times IDF, then L2-normalize each row."""
+        weighted = counts.copy()
+        weighted.data = (1 + np.log(weighted.data)) * idf[weighted.indices]
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms) @ weighted
+
+    def transform(self, rows):
+        """Vectorize item rows with the fitted vocabulary (unknown words are dropped)."""
+        counts = self._counts([Counter(tokens(row)) for row in rows], self.vocabulary)
+        return self._weigh(counts, self.idf).astype(np.float32)
+
+    def top_neighbours(self, vectors, k, min_score, exclude=None):
+        """
+        Yield [(item_id, score), ...] best first for each row of vectors.
+
+        exclude gives, per row, an item id that must not be its own
+        neighbour.
+        """
+        scores = (vectors @ self.matrix.T).toarray()
+        for row, row_scores in enumerate(scores):
+            if exclude is not None:
+                row_scores[self.item_ids == exclude[row]] = 0
+            count = min(k, row_scores.size)
+            if not count:
+                yield []
+                continue
+            best = np.argpartition(-row_scores, count - 1)[:count]
+            best = best[np.argsort(-row_scores[best], kind='stable')]
+            yield [
+                (int(self.item_ids[i]), float(row_scores[i]))
+                for i in best if row_scores[i] >= min_score
+            ]
+
+    def without(self, item_ids):
+        """Return a copy of the index without the rows of item_ids."""
+        keep = ~np.isin(self.item_ids, item_ids)
+        return TextIndex(self.item_ids[keep], self.vocabulary, self.idf, self.matrix[keep])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        temporary = path + '.tmp.npz'
+        np.savez_compressed(
+            temporary,
+            item_ids=self.item_ids,
+            terms=np.asarray(terms, dtype=str),
+            idf=self.idf,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=np.asarray(self.matrix.shape),
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            matrix = sparse.csr_matrix(
+                (saved['data'], saved['indices'], saved['indptr']), shape=tuple(saved['shape'])
+            )
+            vocabulary = {term: i for i, term in enumerate(saved['terms'].tolist())}
+            return cls(saved['item_ids'], vocabulary, saved['idf'], matrix)
+
+
+_index_lock = threading.Lock()
+_index_cache = {}
+
+
+def get_index():
+    """Return the saved index, reloaded when the file changes; None if not built."""
+    path = get_config()['index_path']
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, TextIndex.load(path))
+            _index_cache[path] = cached
+        return cached[1]
+
+
+def build_similar_items(k=None, min_score=None, block_size=512):
+    """
+    Recompute the neighbours of every for-sale item; return how many rows.
+
+    Similarities are computed block by block, so memory stays at
+    block_size x items scores however large the marketplace is.
+    """
+    config = get_config()
+    k = k or config['k']
+    min_score = config['min_score'] if min_score is None else min_score
+    rows = list(Item.objects.filter(is_for_sale=True).order_by('pk').values(*TEXT_FIELDS))
+    index = TextIndex.fit(rows)
+
+    neighbours = []
+    for start in range(0, len(rows), block_size):
+        block = index.matrix[start:start + block_size]
+        own_ids = index.item_ids[start:start + block_size]
+        for item_id, found in zip(own_ids, index.top_neighbours(block, k, min_score, exclude=own_ids)):
+            neighbours += [
+                SimilarItem(item_id=int(item_id), similar_id=similar_id, score=score)
+                for similar_id, score in found
+            ]
+
+    with transaction.atomic():
+        SimilarItem.objects.all().delete()
+        SimilarItem.objects.bulk_create(neighbours, batch_size=1000)
+    index.save(config['index_path'])
+    return len(neighbours)
+
+
+@transaction.atomic
+def update_item_similarity(item_id):
+    """
+    Refresh one item's neighbours and the lists it belongs to.
+
+    The item is taken out of every list, then added back to those it now
+    belongs to; an item no longer for sale is also dropped from the saved
+    index. Uses the index saved by the last build; items listed since
+    then are only found through this reverse update until the next build.
+    Returns the number of neighbours stored for the item, or None without
+    index.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    config = get_config()
+    k, min_score = config['k'], config['min_score']
+    row = Item.objects.filter(pk=item_id, is_for_sale=True).values(*TEXT_FIELDS).first()
+    SimilarItem.objects.filter(Q(item_id=item_id) | Q(similar_id=item_id)).delete()
+    if row is None:
+        if item_id in index.item_ids:
+            index.without([item_id]).save(config['index_path'])
+        return 0
+    found = next(index.top_neighbours(index.transform([row]), k, min_score, exclude=[item_id]))
+    SimilarItem.objects.bulk_create(
+        SimilarItem(item_id=item_id, similar_id=similar_id, score=score) for similar_id, score in found
+    )
+
+    # Add the item to each neighbour's list if it beats that list's weakest entry.
+    scores = dict(found)
+    lists = {}
+    for neighbour_id, similar_id, score in SimilarItem.objects.filter(item_id__in=scores).values_list(
+        'item_id', 'similar_id', 'score'
+    ):
+        lists.setdefault(neighbour_id, []).append((score, similar_id))
+    stale, added = [], []
+    for neighbour_id, score in scores.items():
+        current = lists.get(neighbour_id, [])
+        if len(current) >= k:
+            weakest = min(current)
+            if weakest[0] >= score:
+                continue
+            stale.append((neighbour_id, weakest[1]))
+        added.append(SimilarItem(item_id=neighbour_id, similar_id=item_id, score=score))
+    for neighbour_id, similar_id in stale:
+        SimilarItem.objects.filter(item_id=neighbour_id, similar_id=similar_id).delete()
+    SimilarItem.objects.bulk_create(added)
+    return len(found)
@@ -1,10 +1,61 @@
 """
-Tests for items app models.
+Tests for items app models and views.
 """
 
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.test import LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase
 from django.contrib.auth.models import User
-from items.models import Collection, Item
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from config.metrics import MetricsMiddleware, collect, registry as metrics_registry, render as render_metrics
+from config.sampling_profiler import SamplingProfilerMiddleware, prune
+from config.staticfiles import CompressedManifestStaticFilesStorage, StaticFilesMiddleware
+from config.traffic import TrafficCaptureMiddleware, capture_handler, load_entries, replay, summarize
+from config.template_profiler import TemplateProfilerMiddleware, registry as profile_registry
+from config.warmup import warm_up, warm_up_if_enabled
+from items.analytics import MarketSnapshot, clear_snapshot, market_range
+from items.archive import archive_chunks
+from items.batch import batch_delete
+from items.bidding import BidError, place_bid, set_proxy_bid
+from items.cleanup import find_orphan_media, purge_collection, purge_deleted_collections, soft_delete_collection
+from items.db import retry_on_locked
+from items.duplicates import MAX_DISTANCE, band_keys, dhash, distance, duplicate_pairs, find_duplicates
+from items.facets import compute_facets, facet_counts
+from items.history import batched_changes, compact_history, decode, encode, item_history
+from items.ledger import rebuild_ledgers
+from items.outbox import HANDLERS, claim_batch, process_batch, publish
+from items.ratelimit import parse_rate, retry_after
+from items.similarity import build_similar_items, get_index, update_item_similarity
+from items.models import (
+    Auction, Bid, Cart, Collection, CollectionArchive, CollectionValueRollup, CollectionValueSnapshot, ImageHashKey, Item, ItemChange,
+    Offer, OfferInbox, OutboxEvent, ProxyBid, Purchase, SimilarItem, UserLedger, UserLedgerMonth,
+)
+from items.valuation import value_series
 
 
 class CollectionModelTest(TestCase):
@@ -83,3 +134,2158 @@ class ItemModelTest(TestCase):
     def test_item_str(self):
         """Test string representation."""
         self.assertEqual(str(self.item), 'Test Item')
+
+
+class RetryOnLockedTest(TestCase):
+    """Test cases for the locked-database retry helper."""
+    
+    def test_retries_until_success_outside_transaction(self):
+        """Test a locked write is retried and then succeeds."""
+        calls = []
+        
+        @retry_on_locked(attempts=3, base_delay=0, max_delay=0)
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+        
+        with mock.patch('items.db.connections') as conns:
+            conns.__getitem__.return_value.in_atomic_block = False
+            self.assertEqual(write(), 'ok')
+        self.assertEqual(len(calls), 3)
+    
+    def test_gives_up_after_attempts(self):
+        """Test the error is raised once attempts are exhausted."""
+        @retry_on_locked(attempts=2, base_delay=0, max_delay=0)
+        def write():
+            raise OperationalError('database is locked')
+        
+        with mock.patch('items.db.connections') as conns:
+            conns.__getitem__.return_value.in_atomic_block = False
+            with self.assertRaises(OperationalError):
+                write()
+    
+    def test_other_errors_not_retried(self):
+        """Test only lock errors are retried."""
+        calls = []
+        
+        @retry_on_locked(attempts=5, base_delay=0, max_delay=0)
+        def write():
+            calls.append(1)
+            raise OperationalError('no such table: foo')
+        
+        with mock.patch('items.db.connections') as conns:
+            conns.__getitem__.return_value.in_atomic_block = False
+            with self.assertRaises(OperationalError):
+                write()
+        self.assertEqual(len(calls), 1)
+
+
+class ProductionSQLiteBackendTest(SimpleTestCase):
+    """Test cases for the production SQLite backend."""
+    
+    def test_pragmas_applied_on_connect(self):
+        """Test WAL and tuned PRAGMAs are set on new connections."""
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ConnectionHandler({
+                'default': {
+                    'ENGINE': 'config.sqlite',
+                    'NAME': os.path.join(tmp, 'db.sqlite3'),
+                    'OPTIONS': {'pragmas': {'synchronous': 'FULL'}},
+                },
+            })
+            conn = handler['default']
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 2)
+                    cursor.execute('PRAGMA temp_store')
+                    self.assertEqual(cursor.fetchone()[0], 2)
+            finally:
+                conn.close()
+
+
+class AsyncViewsTest(TestCase):
+    """Test cases for the async marketplace, auction and purchase views."""
+    
+    def setUp(self):
+        """Create a seller with a listed item and a logged-in buyer."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.seller, name='Coins')
+        self.item = Item.objects.create(
+            collection=self.collection,
+            name='Gold Coin',
+            value=100.00,
+            is_for_sale=True,
+            sale_price=120.00
+        )
+        self.client.login(username='buyer', password='testpass123')
+    
+    def test_anonymous_redirected_to_login(self):
+        """Test async views still require login."""
+        self.client.logout()
+        response = self.client.get(reverse('marketplace'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+    
+    def test_marketplace_lists_items_with_offer_count(self):
+        """Test marketplace search and offer count annotation."""
+        Offer.objects.create(item=self.item, buyer=self.buyer, amount=90)
+        response = self.client.get(reverse('marketplace'), {'q': 'coin'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['items'], [self.item])
+        self.assertEqual(response.context['items'][0].offer_count, 1)
+    
+    def test_item_detail_get_and_offer_post(self):
+        """Test item detail renders and offers still post synchronously."""
+        response = self.client.get(reverse('item_detail', args=[self.item.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['user_offer'])
+        
+        response = self.client.post(reverse('item_detail', args=[self.item.pk]), {
+            'submit_offer': '1',
+            'offer_amount': '95',
+        })
+        self.assertRedirects(response, reverse('item_detail', args=[self.item.pk]))
+        response = self.client.get(reverse('item_detail', args=[self.item.pk]))
+        self.assertEqual(response.context['user_offer'].amount, 95)
+    
+    def test_item_detail_not_for_sale_404(self):
+        """Test items not for sale are not found."""
+        self.item.is_for_sale = False
+        self.item.save()
+        response = self.client.get(reverse('item_detail', args=[self.item.pk]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_purchase_history_and_auction_list(self):
+        """Test purchase history and auction list render."""
+        Purchase.objects.create(item=self.item, buyer=self.buyer, price_paid=120, status='completed')
+        Auction.objects.create(
+            item=self.item,
+            seller=self.seller,
+            starting_price=10,
+            current_price=10,
+            end_date=timezone.now() + timedelta(days=1)
+        )
+        response = self.client.get(reverse('purchase_history'))
+        self.assertEqual(len(response.context['purchases']), 1)
+        response = self.client.get(reverse('auction_list'))
+        self.assertEqual(len(response.context['auctions']), 1)
+
+
+class AuctionListingTest(TestCase):
+    """Test cases for live auction listing and keyset pagination."""
+    
+    def setUp(self):
+        """Create a seller with live, expired and closed auctions."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.seller, name='Coins')
+        now = timezone.now()
+        self.live = []
+        for i in range(5):
+            item = Item.objects.create(collection=self.collection, name=f'Coin {i}', value=10)
+            self.live.append(Auction.objects.create(
+                item=item, seller=self.seller, starting_price=1, current_price=1,
+                end_date=now + timedelta(hours=5 - i),
+            ))
+        item = Item.objects.create(collection=self.collection, name='Old coin', value=10)
+        self.expired = Auction.objects.create(
+            item=item, seller=self.seller, starting_price=1, current_price=1, end_date=now - timedelta(hours=1)
+        )
+        self.sold = Auction.objects.create(
+            item=item, seller=self.seller, starting_price=1, current_price=1,
+            end_date=now + timedelta(days=1), status='sold',
+        )
+        self.client.login(username='seller', password='testpass123')
+    
+    def collect_pages(self, url, **params):
+        auctions, cursor = [], None
+        while True:
+            response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+            auctions += response.context['auctions']
+            cursor = response.context['next_cursor']
+            if not cursor:
+                return auctions
+    
+    def test_live_excludes_expired_and_closed(self):
+        """Test only auctions still open for bids are live."""
+        self.assertEqual(set(Auction.objects.live()), set(self.live))
+    
+    def test_sorts_and_pages(self):
+        """Test both sorts walk every live auction exactly once."""
+        with mock.patch('items.views.AUCTIONS_PER_PAGE', 2):
+            newest = self.collect_pages(reverse('auction_list'))
+            ending = self.collect_pages(reverse('auction_list'), sort='ending')
+        self.assertEqual(newest, self.live[::-1])
+        self.assertEqual(ending, self.live[::-1])
+        self.assertEqual([a.end_date for a in ending], sorted(a.end_date for a in self.live))
+    
+    def test_invalid_cursor_restarts(self):
+        """Test a bad cursor sends the user back to the first page."""
+        response = self.client.get(reverse('auction_list'), {'sort': 'ending', 'cursor': 'nope'})
+        self.assertRedirects(response, reverse('auction_list') + '?sort=ending')
+    
+    def test_my_auctions_constant_queries(self):
+        """Test my auctions renders every page with the same number of queries."""
+        with mock.patch('items.views.AUCTIONS_PER_PAGE', 3):
+            self.assertEqual(len(self.collect_pages(reverse('my_auctions'))), 7)
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(reverse('my_auctions'))
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse('my_auctions'))
+        self.assertEqual(len(small), len(large))
+
+class BidPlacementTest(TestCase):
+    """Test cases for bid statistics and paginated bid history."""
+    
+    def setUp(self):
+        """Create a live auction and two bidders."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Coins')
+        item = Item.objects.create(collection=collection, name='Gold Coin', value=10)
+        self.auction = Auction.objects.create(
+            item=item, seller=self.seller, starting_price=10, current_price=10,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+    
+    def test_stats_updated_with_each_bid(self):
+        """Test counts, leader and last bid time follow every accepted bid."""
+        place_bid(self.auction, self.alice, '11')
+        place_bid(self.auction, self.bob, '12.50')
+        bid = place_bid(self.auction, self.alice, '13')
+        self.auction.refresh_from_db()
+        self.assertEqual(self.auction.bid_count, 3)
+        self.assertEqual(self.auction.unique_bidder_count, 2)
+        self.assertEqual(self.auction.current_price, Decimal('13.00'))
+        self.assertEqual(self.auction.highest_bidder, self.alice)
+        self.assertAlmostEqual(self.auction.last_bid_at, bid.bid_date, delta=timedelta(seconds=1))
+    
+    def test_rejected_bids_change_nothing(self):
+        """Test low, invalid, own and late bids are refused."""
+        place_bid(self.auction, self.alice, '11')
+        for bidder, amount in [(self.bob, '11'), (self.bob, 'abc'), (self.bob, '-5'), (self.seller, '20')]:
+            with self.assertRaises(BidError):
+                place_bid(self.auction, bidder, amount)
+        Auction.objects.filter(pk=self.auction.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        self.auction.refresh_from_db()
+        with self.assertRaises(BidError):
+            place_bid(self.auction, self.bob, '50')
+        self.auction.refresh_from_db()
+        self.assertEqual((self.auction.bid_count, self.auction.unique_bidder_count), (1, 1))
+        self.assertEqual(Bid.objects.count(), 1)
+    
+    def test_detail_pages_bid_history(self):
+        """Test the detail page shows a bounded page of bids at constant cost."""
+        self.client.login(username='bob', password='testpass123')
+        response = self.client.post(reverse('auction_detail', args=[self.auction.pk]), {'bid_amount': '15'})
+        self.assertRedirects(response, reverse('auction_detail', args=[self.auction.pk]))
+        for i in range(4):
+            place_bid(self.auction, [self.alice, self.bob][i % 2], 20 + i)
+        with mock.patch('items.views.BIDS_PER_PAGE', 2):
+            with CaptureQueriesContext(connection) as first_page:
+                response = self.client.get(reverse('auction_detail', args=[self.auction.pk]))
+            self.assertEqual([bid.amount for bid in response.context['bids']], [Decimal('23'), Decimal('22')])
+            amounts = []
+            while True:
+                amounts += [bid.amount for bid in response.context['bids']]
+                if not response.context['next_cursor']:
+                    break
+                response = self.client.get(
+                    reverse('auction_detail', args=[self.auction.pk]), {'cursor': response.context['next_cursor']}
+                )
+        self.assertEqual(amounts, sorted(amounts, reverse=True))
+        self.assertEqual(len(amounts), 5)
+        place_bid(self.auction, self.alice, 30)
+        with mock.patch('items.views.BIDS_PER_PAGE', 2):
+            with CaptureQueriesContext(connection) as later:
+                self.client.get(reverse('auction_detail', args=[self.auction.pk]))
+        self.assertEqual(len(first_page), len(later))
+        self.assertContains(self.client.get(reverse('auction_detail', args=[self.auction.pk])), 'from <strong>2</strong> bidders')
+
+class ProxyBiddingTest(TestCase):
+    """Test cases for automatic bidding up to a maximum."""
+    
+    def setUp(self):
+        """Create a live auction and three bidders."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        self.carol = User.objects.create_user(username='carol', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Coins')
+        item = Item.objects.create(collection=collection, name='Gold Coin', value=10)
+        self.auction = Auction.objects.create(
+            item=item, seller=self.seller, starting_price=10, current_price=10,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+    
+    def state(self):
+        self.auction.refresh_from_db()
+        return self.auction.highest_bidder, self.auction.current_price
+    
+    def test_single_proxy_bids_one_increment(self):
+        """Test a lone proxy only bids what it takes to lead."""
+        bids = set_proxy_bid(self.auction, self.alice, '50')
+        self.assertEqual([(b.bidder, b.amount) for b in bids], [(self.alice, Decimal('11.00'))])
+        self.assertEqual(self.state(), (self.alice, Decimal('11.00')))
+        self.assertEqual(set_proxy_bid(self.auction, self.alice, '80'), [])
+    
+    def test_competing_proxies_resolved_at_once(self):
+        """Test two proxies settle at one increment above the lower maximum."""
+        set_proxy_bid(self.auction, self.alice, '50')
+        bids = set_proxy_bid(self.auction, self.bob, '30')
+        self.assertEqual([(b.bidder, b.amount) for b in bids], [(self.bob, Decimal('30.00')), (self.alice, Decimal('31.00'))])
+        bids = set_proxy_bid(self.auction, self.carol, '75.50')
+        self.assertEqual([(b.bidder, b.amount) for b in bids], [(self.alice, Decimal('50.00')), (self.carol, Decimal('51.00'))])
+        self.assertEqual(self.state(), (self.carol, Decimal('51.00')))
+        self.auction.refresh_from_db()
+        self.assertEqual((self.auction.bid_count, self.auction.unique_bidder_count), (5, 3))
+    
+    def test_tie_goes_to_earlier_maximum(self):
+        """Test the earlier of two equal maximums wins at that amount."""
+        set_proxy_bid(self.auction, self.alice, '40')
+        set_proxy_bid(self.auction, self.bob, '40')
+        self.assertEqual(self.state(), (self.alice, Decimal('40.00')))
+    
+    def test_manual_bids_answered_by_proxy(self):
+        """Test a manual bid is outbid by a higher proxy and wins over a lower one."""
+        set_proxy_bid(self.auction, self.alice, '50')
+        place_bid(self.auction, self.bob, '45')
+        self.assertEqual(self.state(), (self.alice, Decimal('46.00')))
+        place_bid(self.auction, self.bob, '55')
+        self.assertEqual(self.state(), (self.bob, Decimal('55.00')))
+        with self.assertRaises(BidError):
+            set_proxy_bid(self.auction, self.alice, '55')
+    
+    def test_resolution_reads_two_proxies(self):
+        """Test resolution cost does not depend on the number of proxies."""
+        for i in range(20):
+            user = User.objects.create_user(username=f'proxy{i}', password='testpass123')
+            ProxyBid.objects.create(auction=self.auction, bidder=user, max_amount=20 + i)
+        with CaptureQueriesContext(connection) as queries:
+            set_proxy_bid(self.auction, self.alice, '100')
+        self.assertEqual(self.state(), (self.alice, Decimal('40.00')))
+        ranked = [q['sql'] for q in queries if 'FROM "items_proxybid"' in q['sql'] and 'ORDER BY' in q['sql']]
+        self.assertEqual(len(ranked), 1)
+        self.assertIn('LIMIT 2', ranked[0])
+    
+    def test_detail_view_sets_maximum(self):
+        """Test the auction page accepts and shows a maximum."""
+        self.client.login(username='bob', password='testpass123')
+        url = reverse('auction_detail', args=[self.auction.pk])
+        self.client.post(url, {'max_amount': '25'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['proxy_max'], Decimal('25.00'))
+        self.assertContains(response, 'value="25.00"')
+        self.assertEqual(self.state(), (self.bob, Decimal('11.00')))
+
+class CollectionValuationTest(TestCase):
+    """Test cases for incremental collection value snapshots."""
+    
+    def setUp(self):
+        """Create a collection with one item."""
+        self.user = User.objects.create_user(username='collector', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.user, name='Stamps')
+        self.item = Item.objects.create(collection=self.collection, name='Penny Black', value=100)
+    
+    def snapshot(self):
+        return CollectionValueSnapshot.objects.get(collection=self.collection, date=timezone.localdate())
+    
+    def test_snapshot_follows_item_changes(self):
+        """Test create, update and delete adjust today's snapshot."""
+        self.assertEqual(self.snapshot().total_value, Decimal('100.00'))
+        
+        item = Item.objects.get(pk=self.item.pk)
+        item.value = Decimal('150.00')
+        item.save()
+        Item.objects.create(collection=self.collection, name='Blue Mauritius', value=20)
+        self.assertEqual(self.snapshot().total_value, Decimal('170.00'))
+        self.assertEqual(self.snapshot().item_count, 2)
+        
+        item.delete()
+        self.assertEqual(self.snapshot().total_value, Decimal('20.00'))
+        self.assertEqual(self.snapshot().item_count, 1)
+        self.assertEqual(self.snapshot().total_value, self.collection.get_total_value())
+    
+    def test_rollups_track_open_close_min_max(self):
+        """Test weekly and monthly rollups are maintained."""
+        item = Item.objects.get(pk=self.item.pk)
+        item.value = Decimal('40.00')
+        item.save()
+        item.value = Decimal('60.00')
+        item.save()
+        rollup = CollectionValueRollup.objects.get(collection=self.collection, period='month')
+        self.assertEqual(rollup.open_value, Decimal('0.00'))
+        self.assertEqual(rollup.close_value, Decimal('60.00'))
+        self.assertEqual(rollup.min_value, Decimal('0.00'))
+        self.assertEqual(rollup.max_value, Decimal('100.00'))
+        self.assertTrue(CollectionValueRollup.objects.filter(collection=self.collection, period='week').exists())
+    
+    def test_collection_delete_cascades(self):
+        """Test deleting a collection removes its history without errors."""
+        self.collection.delete()
+        self.assertFalse(CollectionValueSnapshot.objects.exists())
+    
+    def test_value_series_resolution(self):
+        """Test long ranges are served from rollups."""
+        today = timezone.localdate()
+        daily = value_series(self.collection.pk, today - timedelta(days=30), today)
+        self.assertEqual(daily['resolution'], 'day')
+        self.assertEqual(daily['points'][-1]['value'], '100.00')
+        yearly = value_series(self.collection.pk, today - timedelta(days=3650), today, max_points=200)
+        self.assertEqual(yearly['resolution'], 'month')
+        self.assertEqual(yearly['points'][-1]['value'], '100.00')
+    
+    def test_value_series_view(self):
+        """Test the JSON endpoint is owner-only and validates input."""
+        self.client.login(username='collector', password='testpass123')
+        url = reverse('collection_value_series', args=[self.collection.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['points'][-1]['value'], '100.00')
+        self.assertEqual(self.client.get(url, {'start': 'nope'}).status_code, 400)
+        
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class MarketAnalyticsTest(TestCase):
+    """Test cases for vectorized marketplace price analytics."""
+    
+    def setUp(self):
+        """Create listings and a completed sale."""
+        clear_snapshot()
+        self.addCleanup(clear_snapshot)
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Watches')
+        for price in (10, 20, 30, 40):
+            Item.objects.create(
+                collection=collection, name=f'Vintage watch {price}', condition='good',
+                is_for_sale=True, sale_price=price
+            )
+        Item.objects.create(
+            collection=collection, name='Pocket clock', condition='poor', is_for_sale=True, sale_price=5
+        )
+        sold = Item.objects.create(collection=collection, name='Vintage watch sold', condition='good')
+        Purchase.objects.create(item=sold, buyer=self.buyer, price_paid=25, status='completed')
+        Purchase.objects.create(item=sold, buyer=self.buyer, price_paid=99, status='cancelled')
+    
+    def test_loads_in_one_query(self):
+        """Test listings and sales are fetched together."""
+        with self.assertNumQueries(1):
+            snapshot = MarketSnapshot.load()
+        self.assertEqual(len(snapshot.listings), 5)
+        self.assertEqual(len(snapshot.sales), 1)
+    
+    def test_condition_distribution(self):
+        """Test percentiles and histogram per condition."""
+        market = market_range('good', 'Vintage watch')
+        self.assertEqual(market['listings']['count'], 4)
+        self.assertEqual(market['listings']['median'], 25.0)
+        self.assertEqual(market['listings']['p25'], 17.5)
+        self.assertEqual(sum(market['listings']['histogram']['counts']), 4)
+        self.assertEqual(market['sales']['median'], 25.0)
+        poor = next(row for row in market['by_condition'] if row['condition'] == 'poor')
+        self.assertEqual(poor['listings']['count'], 1)
+        self.assertIsNone(poor['sales'])
+    
+    def test_keyword_distribution(self):
+        """Test the most common keyword in the text is summarized."""
+        market = market_range('good', 'Rare vintage piece')
+        self.assertEqual(market['keyword']['keyword'], 'vintage')
+        self.assertEqual(market['keyword']['listings']['count'], 4)
+        self.assertEqual(market['keyword']['sales']['count'], 1)
+    
+    def test_cached_until_ttl(self):
+        """Test the snapshot is reused without querying again."""
+        market_range('good')
+        with self.assertNumQueries(0):
+            market_range('good', 'watch')
+    
+    def test_item_detail_shows_market_range(self):
+        """Test the panel renders on item detail."""
+        item = Item.objects.filter(condition='good', is_for_sale=True).first()
+        self.client.login(username='buyer', password='testpass123')
+        response = self.client.get(reverse('item_detail', args=[item.pk]))
+        self.assertContains(response, 'Market Range')
+        
+        self.client.login(username='seller', password='testpass123')
+        response = self.client.get(reverse('item_create', args=[item.collection_id]))
+        self.assertContains(response, 'Market Range')
+
+
+class MarketplaceFacetsTest(TestCase):
+    """Test cases for marketplace facet counts."""
+    
+    def setUp(self):
+        """Create listings across conditions and prices."""
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Paper goods')
+        self.cheap = Item.objects.create(
+            collection=collection, name='Common card', condition='good', is_for_sale=True, sale_price=5
+        )
+        Item.objects.create(
+            collection=collection, name='Rare card', condition='excellent', is_for_sale=True,
+            sale_price=250, image='items/rare.jpg'
+        )
+        Item.objects.create(
+            collection=collection, name='Old poster', condition='good', is_for_sale=True, sale_price=50
+        )
+        Item.objects.create(collection=collection, name='Private card', condition='good')
+        Offer.objects.create(item=self.cheap, buyer=self.buyer, amount=4)
+    
+    def counts(self, facets, name):
+        return {facet['value']: facet['count'] for facet in facets[name]}
+    
+    def test_counts_in_one_query(self):
+        """Test all facets come from one grouped query."""
+        with self.assertNumQueries(1):
+            facets = compute_facets('')
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(self.counts(facets, 'condition'), {'excellent': 1, 'good': 2, 'fair': 0, 'poor': 0})
+        self.assertEqual(self.counts(facets, 'price'), {'0-25': 1, '25-100': 1, '100-500': 1, '500+': 0})
+        self.assertEqual(facets['has_image'], 1)
+        self.assertEqual(facets['has_offers'], 1)
+    
+    def test_counts_respect_search_and_are_cached(self):
+        """Test the search narrows counts and equivalent queries share a cache entry."""
+        facets = facet_counts('  CARD ')
+        self.assertEqual(facets['total'], 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(facet_counts('card'), facets)
+    
+    def test_marketplace_filters(self):
+        """Test the marketplace applies the facet filters."""
+        self.client.login(username='buyer', password='testpass123')
+        response = self.client.get(reverse('marketplace'), {'price': '0-25', 'has_offers': '1'})
+        self.assertEqual(response.context['items'], [self.cheap])
+        self.assertEqual(response.context['facets']['total'], 3)
+        self.assertContains(response, 'Good (2)')
+
+
+class MarketplaceApiTest(TestCase):
+    """Test cases for the marketplace JSON API."""
+    
+    def setUp(self):
+        """Create a page and a half of listings."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Vinyl')
+        for i in range(5):
+            Item.objects.create(
+                collection=collection, name=f'Record {i}', is_for_sale=True, sale_price=10 + i
+            )
+        Item.objects.create(collection=collection, name='Not listed', sale_price=1)
+        self.client.login(username='seller', password='testpass123')
+        self.url = reverse('marketplace_api')
+    
+    def test_cursor_pagination_with_sparse_fields(self):
+        """Test pages follow the cursor and only include requested fields."""
+        response = self.client.get(self.url, {'fields': 'id,name,sale_price', 'limit': 2, 'sort': 'sale_price'})
+        data = response.json()
+        self.assertEqual(list(data['results'][0]), ['id', 'name', 'sale_price'])
+        names = [row['name'] for row in data['results']]
+        while data['next_cursor']:
+            data = self.client.get(self.url, {
+                'fields': 'name', 'limit': 2, 'sort': 'sale_price', 'cursor': data['next_cursor'],
+            }).json()
+            names += [row['name'] for row in data['results']]
+        self.assertEqual(names, [f'Record {i}' for i in range(5)])
+    
+    def test_default_fields_and_thumb(self):
+        """Test default fields and null thumbnails."""
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'sale_price', 'condition', 'thumb'})
+        self.assertIsNone(data['results'][0]['thumb'])
+    
+    def test_invalid_parameters(self):
+        """Test bad fields, sorts and cursors are rejected."""
+        self.assertEqual(self.client.get(self.url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'sort': 'collection__owner__password'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 400)
+    
+    def test_gzip(self):
+        """Test responses are compressed when the client accepts it."""
+        Item.objects.filter(is_for_sale=True).update(description='x' * 500)
+        response = self.client.get(self.url, {'fields': 'description'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class CollectionBatchTest(TestCase):
+    """Test cases for batch item operations."""
+    
+    def setUp(self):
+        """Create a collection with three items."""
+        self.user = User.objects.create_user(username='collector', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.user, name='Comics')
+        self.items = [
+            Item.objects.create(collection=self.collection, name=f'Issue {i}', value=10, sale_price=20)
+            for i in range(3)
+        ]
+        self.client.login(username='collector', password='testpass123')
+        self.url = reverse('collection_batch', args=[self.collection.pk])
+    
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+    
+    def test_preview_does_not_write(self):
+        """Test previews only count."""
+        response = self.post({'action': 'delete', 'item_ids': 'all', 'preview': True})
+        self.assertEqual(response.json(), {'action': 'delete', 'preview': True, 'count': 3})
+        self.assertEqual(Item.objects.count(), 3)
+    
+    def test_bulk_update_and_reprice(self):
+        """Test field edits and percentage repricing."""
+        ids = [self.items[0].pk, self.items[1].pk]
+        response = self.post({'action': 'update', 'item_ids': ids, 'fields': {'condition': 'fair', 'is_for_sale': True}})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(Item.objects.filter(condition='fair', is_for_sale=True).count(), 2)
+        
+        response = self.post({'action': 'reprice', 'item_ids': 'all', 'percent': -12.5})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(Item.objects.get(pk=self.items[2].pk).sale_price, Decimal('17.50'))
+    
+    def test_listing_changes_publish_similarity_events(self):
+        """Test bulk listing and created for-sale items queue similarity updates like single saves."""
+        OutboxEvent.objects.all().delete()
+        ids = [self.items[0].pk, self.items[1].pk]
+        self.post({'action': 'update', 'item_ids': ids, 'fields': {'is_for_sale': True}})
+        self.post({'action': 'update', 'item_ids': 'all', 'fields': {'is_for_sale': True, 'condition': 'fair'}})
+        self.post({'action': 'create', 'items': [{'name': 'Annual', 'is_for_sale': True}, {'name': 'Special'}]})
+        payloads = OutboxEvent.objects.filter(topic='item.text_changed').values_list('payload', flat=True)
+        annual = Item.objects.get(name='Annual')
+        self.assertEqual(
+            sorted(payload['item_id'] for payload in payloads), sorted(ids) + [self.items[2].pk, annual.pk]
+        )
+    
+    def test_invalid_requests(self):
+        """Test invalid fields and values are rejected."""
+        self.assertEqual(self.post({'action': 'update', 'item_ids': 'all', 'fields': {'value': 1}}).status_code, 400)
+        self.assertEqual(self.post({'action': 'update', 'item_ids': 'all', 'fields': {'condition': 'mint'}}).status_code, 400)
+        self.assertEqual(self.post({'action': 'explode'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+    
+    def test_bulk_create_and_delete_track_value(self):
+        """Test creates and deletes keep the valuation snapshot in step."""
+        response = self.post({'action': 'create', 'items': [{'name': 'Annual', 'value': '5'}, {'name': 'Special'}]})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(self.collection.get_item_count(), 5)
+        
+        response = self.post({'action': 'delete', 'item_ids': [self.items[0].pk, self.items[1].pk]})
+        self.assertEqual(response.json()['count'], 2)
+        snapshot = CollectionValueSnapshot.objects.get(collection=self.collection, date=timezone.localdate())
+        self.assertEqual(snapshot.total_value, Decimal('15.00'))
+        self.assertEqual(snapshot.item_count, 3)
+        self.assertEqual(snapshot.total_value, self.collection.get_total_value())
+    
+    def test_other_users_items_untouched(self):
+        """Test ownership is enforced and ids outside the collection are ignored."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        foreign = Item.objects.create(
+            collection=Collection.objects.create(owner=other, name='Other'), name='Theirs'
+        )
+        response = self.post({'action': 'delete', 'item_ids': [foreign.pk]})
+        self.assertEqual(response.json()['count'], 0)
+        self.assertTrue(Item.objects.filter(pk=foreign.pk).exists())
+        
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.post({'action': 'delete', 'item_ids': 'all'}).status_code, 404)
+
+
+class CollectionPurgeTest(TestCase):
+    """Test cases for soft deletion and chunked purging of collections."""
+    
+    def setUp(self):
+        """Create a collection with items, offers and an auction."""
+        self.user = User.objects.create_user(username='collector', password='testpass123')
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.user, name='Minerals')
+        for i in range(5):
+            item = Item.objects.create(
+                collection=self.collection, name=f'Quartz {i}', is_for_sale=True, sale_price=10
+            )
+            Offer.objects.create(item=item, buyer=self.buyer, amount=5)
+        auction = Auction.objects.create(
+            item=item, seller=self.user, starting_price=1, current_price=2,
+            end_date=timezone.now() + timedelta(days=1)
+        )
+        Bid.objects.create(auction=auction, bidder=self.buyer, amount=2)
+    
+    def test_delete_view_soft_deletes(self):
+        """Test deleting hides the collection and its listings immediately."""
+        self.client.login(username='collector', password='testpass123')
+        response = self.client.post(reverse('collection_delete', args=[self.collection.pk]))
+        self.assertRedirects(response, reverse('collection_list'))
+        self.assertFalse(Collection.objects.filter(pk=self.collection.pk).exists())
+        self.assertTrue(Collection.all_objects.filter(pk=self.collection.pk).exists())
+        self.assertFalse(Item.objects.filter(is_for_sale=True).exists())
+        self.assertEqual(Auction.objects.get().status, 'cancelled')
+    
+    def test_purge_in_chunks(self):
+        """Test the purge removes everything in bounded transactions."""
+        CollectionValueSnapshot.objects.update_or_create(
+            collection=self.collection, date=timezone.localdate(), defaults={'total_value': 10}
+        )
+        CollectionValueRollup.objects.update_or_create(
+            collection=self.collection, period='month', period_start=timezone.localdate().replace(day=1),
+            defaults={'open_value': 10, 'close_value': 10, 'min_value': 10, 'max_value': 10},
+        )
+        soft_delete_collection(self.collection)
+        with CaptureQueriesContext(connection) as queries:
+            purge_collection(self.collection.pk, chunk_size=2, pause=0)
+        self.assertFalse(Collection.all_objects.exists())
+        self.assertFalse(Item.objects.exists())
+        self.assertFalse(Offer.objects.exists())
+        self.assertFalse(Bid.objects.exists())
+        self.assertFalse(CollectionValueSnapshot.objects.exists())
+        self.assertFalse(CollectionValueRollup.objects.exists())
+        item_deletes = [q for q in queries.captured_queries if q['sql'].startswith('DELETE FROM "items_item"')]
+        self.assertEqual(len(item_deletes), 3)
+    
+    def test_purge_skips_live_collections(self):
+        """Test live collections are never purged."""
+        self.assertIsNone(purge_collection(self.collection.pk))
+        self.assertEqual(purge_deleted_collections(), 0)
+        self.assertEqual(Item.objects.count(), 5)
+
+
+class OrphanMediaTest(TestCase):
+    """Test cases for the streaming orphan media collector."""
+    
+    def test_finds_unreferenced_files(self):
+        """Test only files without a referencing row are reported."""
+        user = User.objects.create_user(username='collector', password='testpass123')
+        collection = Collection.objects.create(owner=user, name='Art')
+        Item.objects.create(collection=collection, name='Kept', image='items/kept.jpg')
+        Item.objects.create(collection=collection, name='Nested', image='items/2024/a.jpg')
+        user.profile.avatar = 'avatars/me.png'
+        user.profile.save()
+        
+        with tempfile.TemporaryDirectory() as root:
+            for name in ['items/kept.jpg', 'items/2024/a.jpg', 'items/2024/b.jpg', 'items/2024-old.jpg',
+                         'items/orphan.jpg', 'avatars/me.png', 'avatars/old.png', 'other/skip.txt']:
+                path = os.path.join(root, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'wb').close()
+            orphans = [name for name, path in find_orphan_media(root, min_age=0)]
+            self.assertEqual(orphans, ['avatars/old.png', 'items/2024-old.jpg', 'items/2024/b.jpg', 'items/orphan.jpg'])
+            self.assertEqual(list(find_orphan_media(root, min_age=3600)), [])
+
+
+class StaticFilesTest(SimpleTestCase):
+    """Test cases for precompressed static file collection and serving."""
+    
+    def setUp(self):
+        """Collect a hashed, compressed stylesheet into a scratch STATIC_ROOT."""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'css'))
+        with open(os.path.join(self.root, 'css', 'site.css'), 'w') as f:
+            f.write('body { color: black; }\n' * 100)
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        self.collected = list(storage.post_process({'css/site.css': (storage, 'css/site.css')}))
+        self.hashed = storage.stored_name('css/site.css')
+    
+    def get(self, name, **headers):
+        with self.settings(STATIC_SERVE=True, STATIC_ROOT=self.root):
+            return self.client.get('/static/' + name, **headers)
+    
+    def test_post_process_writes_variants(self):
+        """Test hashed names get gzip and brotli variants."""
+        self.assertNotEqual(self.hashed, 'css/site.css')
+        self.assertTrue(os.path.exists(os.path.join(self.root, self.hashed + '.gz')))
+        self.assertTrue(os.path.exists(os.path.join(self.root, self.hashed + '.br')))
+    
+    def test_negotiates_encoding(self):
+        """Test the best accepted encoding is served."""
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'color: black', gzip.decompress(b''.join(response.streaming_content)))
+        response = self.get(self.hashed)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+    
+    def test_cache_headers(self):
+        """Test hashed names are immutable and revalidation returns 304."""
+        response = self.get(self.hashed)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertFalse(response.has_header('Content-Disposition'))
+        self.assertNotIn('immutable', self.get('css/site.css')['Cache-Control'])
+        response = self.get(self.hashed, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_missing_and_traversal_fall_through(self):
+        """Test unknown paths are left to the rest of the stack."""
+        self.assertEqual(self.get('css/missing.css').status_code, 404)
+        self.assertEqual(self.get('../config/settings.py').status_code, 404)
+    
+    async def test_async_stack(self):
+        """Test the middleware runs natively under ASGI and falls through to async views."""
+        async def view(request):
+            return HttpResponse('app')
+        middleware = StaticFilesMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        threads = []
+        serve = middleware.serve
+        
+        def serve_off_loop(*args):
+            threads.append(threading.get_ident())
+            return serve(*args)
+        
+        middleware.serve = serve_off_loop
+        with self.settings(STATIC_SERVE=True, STATIC_ROOT=self.root):
+            response = await middleware(RequestFactory().get('/static/' + self.hashed))
+            self.assertIn('immutable', response['Cache-Control'])
+            response = await middleware(RequestFactory().get('/static/css/missing.css'))
+        self.assertEqual(response.content, b'app')
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class TemplateProfilerTest(TestCase):
+    """Test cases for per-request template profiling."""
+    
+    def setUp(self):
+        """Create a staff user with an item and reset the profile registry."""
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.collection = Collection.objects.create(owner=self.staff, name='Coins')
+        self.item = Item.objects.create(collection=self.collection, name='Gold Coin', value=100, is_for_sale=True)
+        profile_registry.reset()
+        self.client.login(username='staff', password='testpass123')
+    
+    def test_disabled_by_default(self):
+        """Test nothing is recorded when profiling is off."""
+        response = self.client.get(reverse('item_detail', args=[self.item.pk]))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(profile_registry.report(10)['requests'], 0)
+    
+    def test_records_templates_blocks_and_includes(self):
+        """Test a profiled request reports its slowest nodes."""
+        with self.settings(TEMPLATE_PROFILING=True):
+            response = self.client.get(reverse('item_detail', args=[self.item.pk]))
+        self.assertIn('dur=', response['Server-Timing'])
+        report = self.client.get(reverse('template_profile_report')).json()
+        self.assertEqual(report['requests'], 1)
+        kinds = {(node['kind'], node['name']) for node in report['nodes']}
+        self.assertIn(('template', 'items/item_detail.html'), kinds)
+        self.assertIn(('template', 'base.html'), kinds)
+        self.assertIn(('block', 'content'), kinds)
+        self.assertIn(('url', 'marketplace'), kinds)
+        self.assertIn(('include', 'items/_market_range.html'), kinds)
+        for node in report['nodes']:
+            self.assertLessEqual(node['self_ms'], node['total_ms'])
+    
+    async def test_async_stack(self):
+        """Test the middleware runs natively under ASGI and times templates rendered in threads."""
+        template = engines['django'].from_string('{% url "marketplace" %}')
+        
+        async def view(request):
+            return HttpResponse(await sync_to_async(template.render)())
+        middleware = TemplateProfilerMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = self.staff
+        with self.settings(TEMPLATE_PROFILING=True):
+            response = await middleware(request)
+        self.assertIn('url;desc="marketplace"', response['Server-Timing'])
+        self.assertEqual(profile_registry.report(10)['requests'], 1)
+    
+    def test_report_requires_staff(self):
+        """Test the profile report is hidden from other users."""
+        User.objects.create_user(username='plain', password='testpass123')
+        self.client.login(username='plain', password='testpass123')
+        response = self.client.get(reverse('template_profile_report'))
+        self.assertEqual(response.status_code, 302)
+
+
+class WarmUpTest(SimpleTestCase):
+    """Test cases for the worker warm-up hook."""
+    
+    def test_compiles_project_templates_and_resolves_urls(self):
+        """Test warm-up fills the cached loader and URL tables."""
+        results = warm_up(steps=['urls', 'templates'])
+        self.assertEqual(set(results), {'urls', 'templates'})
+        self.assertGreater(results['urls'][0], 0)
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIn('base.html', loader.get_template_cache)
+        self.assertIn('items/item_detail.html', loader.get_template_cache)
+        self.assertFalse(any(name.startswith('admin/') for name in loader.get_template_cache))
+    
+    def test_skips_non_persistent_connections(self):
+        """Test connections closed at each request are not opened early."""
+        results = warm_up(steps=['connections'])
+        self.assertEqual(results['connections'][0], 0)
+    
+    def test_import_time_warm_up_leaves_connections(self):
+        """Test the warm-up run at import never opens database connections."""
+        with self.settings(WARMUP_ON_START=True):
+            results = warm_up_if_enabled()
+        self.assertEqual(set(results), {'urls', 'templates', 'translations'})
+
+
+class OutboxTest(TestCase):
+    """Test cases for the transactional outbox and its worker."""
+    
+    def setUp(self):
+        """Register recording handlers for test topics."""
+        self.seen = []
+        handlers = {
+            'test.ok': [(lambda payload: self.seen.append(payload['n']), True)],
+            'test.fail': [(self.fail_handler, True)],
+        }
+        patcher = mock.patch.dict(HANDLERS, handlers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def fail_handler(self, payload):
+        raise RuntimeError('boom')
+    
+    def test_event_only_exists_if_change_commits(self):
+        """Test events published in a rolled back transaction disappear."""
+        try:
+            with transaction.atomic():
+                publish('test.ok', n=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        publish('test.ok', n=2)
+        self.assertEqual(list(OutboxEvent.objects.values_list('payload', flat=True)), [{'n': 2}])
+    
+    def test_claim_and_process(self):
+        """Test events are claimed once and marked done after their handlers run."""
+        for n in range(3):
+            publish('test.ok', n=n)
+        events = claim_batch(batch_size=2)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(len(claim_batch(batch_size=2)), 1)
+        self.assertEqual(claim_batch(), [])
+        self.assertEqual(process_batch(events), (2, 0))
+        self.assertEqual(self.seen, [0, 1])
+        self.assertEqual(OutboxEvent.objects.filter(status=OutboxEvent.STATUS_DONE).count(), 2)
+    
+    def test_failures_back_off_then_give_up(self):
+        """Test a failing event is retried later and fails after max attempts."""
+        event = publish('test.fail')
+        with self.settings(OUTBOX={'max_attempts': 2, 'base_delay': 10}), self.assertLogs('items.outbox'):
+            self.assertEqual(process_batch(claim_batch()), (0, 1))
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_PENDING, 1))
+            self.assertGreater(event.available_at, timezone.now() + timedelta(seconds=4))
+            self.assertIn('boom', event.last_error)
+            self.assertEqual(claim_batch(), [])
+            OutboxEvent.objects.update(available_at=timezone.now())
+            process_batch(claim_batch())
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_FAILED, 2))
+    
+    def test_expired_lease_is_reclaimed(self):
+        """Test events of a worker that died are picked up again."""
+        publish('test.ok', n=1)
+        claim_batch(lease=60)
+        self.assertEqual(claim_batch(), [])
+        OutboxEvent.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+        events = claim_batch()
+        self.assertEqual(events[0].attempts, 2)
+    
+    def test_worker_prunes_while_running(self):
+        """Test the worker deletes old processed events again after prune_interval."""
+        old = timezone.now() - timedelta(days=30)
+        publish('test.ok', n=1)
+        OutboxEvent.objects.update(status=OutboxEvent.STATUS_DONE, processed_at=old)
+        sleeps = []
+        
+        def sleep(seconds):
+            if sleeps:
+                raise KeyboardInterrupt
+            sleeps.append(seconds)
+            publish('test.ok', n=2)
+            OutboxEvent.objects.filter(status=OutboxEvent.STATUS_PENDING).update(
+                status=OutboxEvent.STATUS_DONE, processed_at=old,
+            )
+        
+        with mock.patch('items.management.commands.run_outbox.time.sleep', sleep):
+            call_command('run_outbox', '--prune-interval', '0', stdout=io.StringIO())
+        self.assertFalse(OutboxEvent.objects.exists())
+    
+    def test_worker_backs_off_while_locked(self):
+        """Test a locked database makes the worker wait and retry instead of crashing."""
+        publish('test.ok', n=1)
+        errors = [OperationalError('database is locked')]
+        
+        def claim(batch_size=None):
+            if errors:
+                raise errors.pop()
+            return claim_batch(batch_size)
+        
+        err = io.StringIO()
+        with mock.patch('items.management.commands.run_outbox.claim_batch', claim):
+            with mock.patch('items.management.commands.run_outbox.time.sleep') as sleep:
+                call_command('run_outbox', '--once', stdout=io.StringIO(), stderr=err)
+        self.assertEqual(self.seen, [1])
+        sleep.assert_called_once_with(1.0)
+        self.assertIn('locked', err.getvalue())
+    
+    def test_purchase_publishes_events(self):
+        """Test buying an item records its event and the worker refreshes facets."""
+        seller = User.objects.create_user(username='seller', password='testpass123')
+        User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=seller, name='Coins')
+        item = Item.objects.create(collection=collection, name='Coin', value=5, is_for_sale=True, sale_price=8)
+        self.client.login(username='buyer', password='testpass123')
+        cache.clear()
+        self.assertEqual(facet_counts('')['total'], 1)
+        self.client.post(reverse('item_detail', args=[item.pk]), {'buy_now': '1'})
+        event = OutboxEvent.objects.get(topic='purchase.completed')
+        self.assertEqual(event.payload['item_id'], item.pk)
+        self.assertEqual(event.payload['price'], '8.00')
+        self.assertEqual(facet_counts('')['total'], 1)
+        call_command('run_outbox', '--once', stdout=io.StringIO())
+        self.assertEqual(facet_counts('')['total'], 0)
+
+
+class RateLimitTest(TestCase):
+    """Test cases for per-client rate limits on write endpoints."""
+    
+    def setUp(self):
+        """Create a listed item, a live auction and a logged-in buyer."""
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Coins')
+        self.item = Item.objects.create(collection=collection, name='Coin', value=5, is_for_sale=True, sale_price=8)
+        self.auction = Auction.objects.create(
+            item=self.item, seller=self.seller, starting_price=1, current_price=1,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+        self.client.login(username='buyer', password='testpass123')
+    
+    def test_parse_rate(self):
+        """Test rate strings with and without a period multiple."""
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        self.assertEqual(parse_rate('100/15m'), (100, 900))
+        with self.assertRaises(ValueError):
+            parse_rate('10 per minute')
+    
+    def test_sliding_window_weighs_previous_window(self):
+        """Test the previous window counts in proportion to its overlap."""
+        self.assertEqual(retry_after(10, 60, 30.0, 5, 10), 0)
+        self.assertGreater(retry_after(10, 60, 30.0, 6, 10), 0)
+        self.assertEqual(retry_after(10, 60, 59.0, 9, 10), 0)
+    
+    def test_bids_limited_before_view(self):
+        """Test the limit answers 429 after loading the user only."""
+        url = reverse('auction_detail', args=[self.auction.pk])
+        with self.settings(RATE_LIMITS={'bid': '2/m'}):
+            for amount in ('2', '3'):
+                self.assertEqual(self.client.post(url, {'bid_amount': amount}).status_code, 302)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {'bid_amount': '4'})
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            self.assertEqual(
+                [query['sql'].split('FROM ')[1].split()[0] for query in queries],
+                ['"django_session"', '"auth_user"'],
+            )
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.auction.refresh_from_db()
+        self.assertEqual(self.auction.bid_count, 2)
+    
+    def test_new_session_keeps_budget(self):
+        """Test logging in again or dropping the session cookie does not reset the count."""
+        url = reverse('auction_detail', args=[self.auction.pk])
+        with self.settings(RATE_LIMITS={'bid': '1/m'}):
+            self.assertEqual(self.client.post(url, {'bid_amount': '2'}).status_code, 302)
+            self.client.logout()
+            self.client.login(username='buyer', password='testpass123')
+            self.assertEqual(self.client.post(url, {'bid_amount': '3'}).status_code, 429)
+            self.client.logout()
+            self.assertEqual(self.client.post(url, {'bid_amount': '3'}).status_code, 302)
+            self.client.cookies['sessionid'] = 'forged'
+            self.assertEqual(self.client.post(url, {'bid_amount': '3'}).status_code, 429)
+    
+    def test_async_view_and_routes_limited_separately(self):
+        """Test item posts (async view) and cart adds have their own budgets."""
+        with self.settings(RATE_LIMITS={'item_post': '1/m', 'add_to_cart': '1/m'}):
+            url = reverse('item_detail', args=[self.item.pk])
+            data = {'submit_offer': '1', 'offer_amount': '5'}
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+            self.assertEqual(self.client.post(url, data).status_code, 429)
+            cart_url = reverse('add_to_cart', args=[self.item.pk])
+            self.assertEqual(self.client.get(cart_url).status_code, 302)
+            self.assertEqual(self.client.get(cart_url).status_code, 429)
+            self.client.logout()
+            self.client.login(username='seller', password='testpass123')
+            self.assertEqual(self.client.get(cart_url).status_code, 302)
+
+
+class SimilarItemsTest(TestCase):
+    """Test cases for precomputed "similar items" recommendations."""
+    
+    def setUp(self):
+        """Create for-sale items in two themes and a temporary index path."""
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.settings_override = self.settings(SIMILAR_ITEMS={
+            'k': 2, 'min_score': 0.05, 'index_path': os.path.join(self.tempdir, 'index.npz'),
+        })
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        owner = User.objects.create_user(username='owner', password='testpass123')
+        User.objects.create_user(username='buyer', password='testpass123')
+        self.coins = Collection.objects.create(owner=owner, name='Roman coins')
+        stamps = Collection.objects.create(owner=owner, name='Stamps')
+        self.denarius = self.listed(self.coins, 'Silver denarius', 'Roman silver coin of Trajan')
+        self.aureus = self.listed(self.coins, 'Gold aureus', 'Roman gold coin of Hadrian')
+        self.sestertius = self.listed(self.coins, 'Bronze sestertius', 'Roman bronze coin')
+        self.penny_black = self.listed(stamps, 'Penny black', 'First adhesive postage stamp')
+        self.penny_red = self.listed(stamps, 'Penny red', 'Postage stamp, plate 77')
+        self.private = Item.objects.create(collection=self.coins, name='Roman silver coin', value=1)
+    
+    def listed(self, collection, name, description):
+        return Item.objects.create(
+            collection=collection, name=name, description=description, value=1, is_for_sale=True, sale_price=10,
+        )
+    
+    def neighbours(self, item):
+        return list(SimilarItem.objects.filter(item=item).order_by('-score').values_list('similar_id', flat=True))
+    
+    def test_build_ranks_same_theme_first(self):
+        """Test each item's top neighbours share its words, never itself or unlisted items."""
+        build_similar_items()
+        self.assertEqual(self.neighbours(self.penny_black), [self.penny_red.pk])
+        coin_ids = {self.aureus.pk, self.sestertius.pk}
+        self.assertEqual(set(self.neighbours(self.denarius)), coin_ids)
+        self.assertFalse(SimilarItem.objects.filter(similar=self.private).exists())
+        self.assertFalse(SimilarItem.objects.filter(item=self.private).exists())
+        self.assertLessEqual(SimilarItem.objects.filter(item=self.aureus).count(), 2)
+        self.assertFalse(SimilarItem.objects.filter(item=F('similar')).exists())
+    
+    def test_edit_updates_item_and_neighbours(self):
+        """Test an edit queues an event whose handler refreshes both directions."""
+        build_similar_items()
+        OutboxEvent.objects.all().delete()
+        self.penny_red.name = 'Silver denarius of Nerva'
+        self.penny_red.description = 'Roman silver coin'
+        self.penny_red.collection = self.coins
+        self.penny_red.save()
+        event = OutboxEvent.objects.get(topic='item.text_changed')
+        self.assertEqual(event.payload, {'item_id': self.penny_red.pk})
+        process_batch(claim_batch())
+        self.assertEqual(self.neighbours(self.penny_red)[0], self.denarius.pk)
+        self.assertEqual(self.neighbours(self.denarius)[0], self.penny_red.pk)
+        self.assertEqual(len(self.neighbours(self.denarius)), 2)
+    
+    def test_unrelated_saves_do_not_queue_updates(self):
+        """Test price and value changes leave the similarity lists alone."""
+        OutboxEvent.objects.all().delete()
+        self.aureus.sale_price = 12
+        self.aureus.value = 3
+        self.aureus.save()
+        self.assertFalse(OutboxEvent.objects.filter(topic='item.text_changed').exists())
+        self.aureus.is_for_sale = False
+        self.aureus.save()
+        self.assertTrue(OutboxEvent.objects.filter(topic='item.text_changed').exists())
+    
+    def test_delisting_leaves_every_list_and_the_index(self):
+        """Test a delisted item is dropped from its neighbours' lists and from the saved index."""
+        build_similar_items()
+        self.assertIn(self.aureus.pk, self.neighbours(self.denarius))
+        self.client.login(username='owner', password='testpass123')
+        response = self.client.post(
+            reverse('collection_batch', args=[self.coins.pk]),
+            json.dumps({'action': 'update', 'item_ids': [self.aureus.pk], 'fields': {'is_for_sale': False}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['count'], 1)
+        process_batch(claim_batch())
+        self.assertFalse(SimilarItem.objects.filter(Q(item=self.aureus) | Q(similar=self.aureus)).exists())
+        self.assertNotIn(self.aureus.pk, get_index().item_ids)
+        
+        self.penny_red.name = 'Gold aureus of Nerva'
+        self.penny_red.description = 'Roman gold coin'
+        self.penny_red.save()
+        process_batch(claim_batch())
+        self.assertNotIn(self.aureus.pk, self.neighbours(self.penny_red))
+    
+    def test_update_without_index(self):
+        """Test incremental updates wait for the first build."""
+        self.assertIsNone(update_item_similarity(self.aureus.pk))
+        build_similar_items()
+        Item.objects.filter(pk=self.aureus.pk).update(is_for_sale=False)
+        self.assertEqual(update_item_similarity(self.aureus.pk), 0)
+        self.assertFalse(SimilarItem.objects.filter(item=self.aureus).exists())
+    
+    def test_item_page_shows_similar_items(self):
+        """Test the item page lists neighbours still for sale in one query."""
+        build_similar_items()
+        Item.objects.filter(pk=self.sestertius.pk).update(is_for_sale=False)
+        self.client.login(username='buyer', password='testpass123')
+        response = self.client.get(reverse('item_detail', args=[self.denarius.pk]))
+        self.assertContains(response, 'Similar Items')
+        self.assertContains(response, 'Gold aureus')
+        self.assertNotContains(response, 'Bronze sestertius')
+        self.assertEqual([n.similar_id for n in response.context['similar_items']], [self.aureus.pk])
+    
+    def test_command(self):
+        """Test build_similar_items reports how many neighbours it stored."""
+        out = io.StringIO()
+        call_command('build_similar_items', '--k', '1', stdout=out)
+        self.assertIn('Stored 5 neighbour(s)', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir, 'index.npz')))
+
+
+def photo(seed, size=(240, 200), quality=90):
+    """Return JPEG bytes of a smooth random picture; the same seed gives the same scene."""
+    import numpy as np
+    from PIL import Image
+    cells = np.random.default_rng(seed).integers(0, 256, (6, 6, 3), dtype=np.uint8)
+    image = Image.fromarray(cells).resize(size, Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class DuplicateImageTest(TestCase):
+    """Test cases for perceptual-hash duplicate image detection."""
+    
+    def setUp(self):
+        """Create two sellers' collections and a scratch MEDIA_ROOT."""
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.coins = Collection.objects.create(owner=self.seller, name='Coins')
+        self.relisted = Collection.objects.create(owner=other, name='Bargains')
+    
+    def upload(self, item, data, name='photo.jpg'):
+        self.client.force_login(item.collection.owner)
+        response = self.client.post(
+            reverse('upload_item_image', args=[item.pk]),
+            {'image': SimpleUploadedFile(name, data, content_type='image/jpeg')},
+        )
+        self.assertEqual(response.status_code, 302)
+        return Item.objects.get(pk=item.pk)
+    
+    def test_hash_survives_reencoding(self):
+        """Test resized, recompressed copies stay close and other scenes do not."""
+        original = dhash(io.BytesIO(photo(1)))
+        copy = dhash(io.BytesIO(photo(1, size=(480, 400), quality=40)))
+        self.assertLessEqual(distance(original, copy), MAX_DISTANCE)
+        self.assertGreater(distance(original, dhash(io.BytesIO(photo(2)))), MAX_DISTANCE)
+        self.assertIsNone(dhash(io.BytesIO(b'not an image')))
+    
+    def test_band_keys_catch_every_near_hash(self):
+        """Test any hash within MAX_DISTANCE bits shares a key with the original."""
+        base = 0x0123456789ABCDEF
+        for bits in ([0, 13, 26, 39], [60, 61, 62, 63], [5, 18, 31, 44]):
+            near = base
+            for bit in bits:
+                near ^= 1 << bit
+            self.assertEqual(distance(base, near), len(bits))
+            self.assertTrue(set(band_keys(base)) & set(band_keys(near)))
+    
+    def test_upload_hashes_and_finds_relisted_photo(self):
+        """Test uploads are hashed on save and matched across sellers in one query."""
+        original = self.upload(Item.objects.create(collection=self.coins, name='Denarius'), photo(7))
+        copy = self.upload(
+            Item.objects.create(collection=self.relisted, name='Old coin'), photo(7, size=(320, 260), quality=50)
+        )
+        unrelated = self.upload(Item.objects.create(collection=self.relisted, name='Stamp'), photo(8))
+        self.assertIsNotNone(original.image_hash)
+        self.assertEqual(ImageHashKey.objects.filter(item=copy).count(), MAX_DISTANCE + 1)
+        with self.assertNumQueries(1):
+            matches = find_duplicates(copy.image_hash, exclude=copy.pk)
+        self.assertEqual([item_id for item_id, bits in matches], [original.pk])
+        pairs = duplicate_pairs()
+        self.assertEqual([pair[:2] for pair in pairs], [(original.pk, copy.pk)])
+        self.assertNotIn(unrelated.pk, {item_id for pair in pairs for item_id in pair[:2]})
+        
+        copy.image = None
+        copy.save()
+        self.assertIsNone(copy.image_hash)
+        self.assertFalse(ImageHashKey.objects.filter(item=copy).exists())
+        self.assertEqual(duplicate_pairs(), [])
+    
+    def test_duplicates_api_is_staff_only(self):
+        """Test the JSON listing of duplicates requires staff."""
+        first = self.upload(Item.objects.create(collection=self.coins, name='Denarius'), photo(3))
+        second = self.upload(Item.objects.create(collection=self.relisted, name='Old coin'), photo(3, quality=60))
+        url = reverse('duplicate_images')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        data = self.client.get(url).json()['duplicates']
+        self.assertEqual([(row['item']['id'], row['duplicate']['id']) for row in data], [(first.pk, second.pk)])
+        self.assertEqual(data[0]['duplicate']['collection'], 'Bargains')
+        data = self.client.get(url, {'item': second.pk}).json()['duplicates']
+        self.assertEqual(data[0]['duplicate']['id'], first.pk)
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code, 400)
+    
+    def test_backfill_command(self):
+        """Test items saved without hashing are hashed and indexed by the backfill."""
+        names = []
+        for seed in (4, 4, 5):
+            name = f'items/backfill-{len(names)}.jpg'
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(photo(seed, quality=70 + len(names)))
+            names.append(name)
+        items = [Item.objects.create(collection=self.coins, name=name, image=name) for name in names]
+        missing = Item.objects.create(collection=self.coins, name='Missing', image='items/missing.jpg')
+        Item.objects.update(image_hash=None)
+        ImageHashKey.objects.all().delete()
+        
+        out = io.StringIO()
+        call_command('backfill_image_hashes', '--batch-size', '2', stdout=out)
+        self.assertIn('Hashed 3 of 4 image(s)', out.getvalue())
+        self.assertEqual([pair[:2] for pair in duplicate_pairs()], [(items[0].pk, items[1].pk)])
+        missing.refresh_from_db()
+        self.assertIsNone(missing.image_hash)
+
+
+class LedgerTest(TestCase):
+    """Test cases for materialized buyer and seller ledgers."""
+    
+    def setUp(self):
+        """Create a seller with four listed items and a logged-in buyer."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Coins')
+        self.items = [
+            Item.objects.create(collection=collection, name=f'Coin {i}', value=1, is_for_sale=True, sale_price=10 + i)
+            for i in range(4)
+        ]
+        self.client.login(username='buyer', password='testpass123')
+    
+    def totals(self, user):
+        ledger = UserLedger.objects.get(user=user)
+        return ledger.spent, ledger.purchase_count, ledger.earned, ledger.sale_count
+    
+    def trade_every_way(self):
+        self.client.post(reverse('item_detail', args=[self.items[0].pk]), {'buy_now': '1'})
+        offer = Offer.objects.create(item=self.items[1], buyer=self.buyer, amount=5)
+        cart = Cart.objects.create(user=self.buyer)
+        cart.items.add(self.items[2])
+        self.client.post(reverse('checkout'))
+        auction = Auction.objects.create(
+            item=self.items[3], seller=self.seller, starting_price=1, current_price=7, highest_bidder=self.buyer,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+        self.client.force_login(self.seller)
+        self.client.get(reverse('accept_offer', args=[offer.pk]))
+        self.client.post(reverse('end_auction', args=[auction.pk]))
+    
+    def test_purchases_update_both_ledgers(self):
+        """Test buy-now, accepted offers, checkout and auctions all reach the ledgers."""
+        self.trade_every_way()
+        self.assertEqual(Purchase.objects.count(), 4)
+        self.assertEqual(self.totals(self.buyer), (Decimal('34.00'), 4, Decimal('0.00'), 0))
+        self.assertEqual(self.totals(self.seller), (Decimal('0.00'), 0, Decimal('34.00'), 4))
+        month = UserLedgerMonth.objects.get(user=self.seller)
+        self.assertEqual(month.month, timezone.localdate().replace(day=1))
+        self.assertEqual((month.earned, month.sale_count), (Decimal('34.00'), 4))
+    
+    def test_rebuild_matches_incremental(self):
+        """Test the rebuild command reproduces the incrementally kept ledgers."""
+        self.trade_every_way()
+        expected = sorted(UserLedgerMonth.objects.values_list('user', 'month', 'spent', 'earned', 'purchase_count'))
+        UserLedger.objects.all().delete()
+        UserLedgerMonth.objects.update(spent=0)
+        out = io.StringIO()
+        call_command('rebuild_ledgers', stdout=out)
+        self.assertIn('Rebuilt the ledgers of 2 user(s)', out.getvalue())
+        self.assertEqual(self.totals(self.buyer), (Decimal('34.00'), 4, Decimal('0.00'), 0))
+        self.assertEqual(
+            sorted(UserLedgerMonth.objects.values_list('user', 'month', 'spent', 'earned', 'purchase_count')), expected
+        )
+        self.assertEqual(rebuild_ledgers(), 2)
+    
+    def test_rebuild_agrees_after_owner_change_and_purge(self):
+        """Test sales stay with their seller and purged purchases leave both paths alike."""
+        self.trade_every_way()
+        other = User.objects.create_user(username='heir', password='testpass123')
+        Collection.objects.update(owner=other)
+        self.assertEqual(set(Purchase.objects.values_list('seller', flat=True)), {self.seller.pk})
+        
+        def snapshot():
+            return sorted(UserLedgerMonth.objects.values_list('user', 'month', 'spent', 'earned', 'sale_count'))
+        
+        expected = snapshot()
+        rebuild_ledgers()
+        self.assertEqual(snapshot(), expected)
+        soft_delete_collection(Collection.objects.get())
+        purge_collection(Collection.all_objects.get().pk, pause=0)
+        self.assertEqual(self.totals(self.seller), (Decimal('0.00'), 0, Decimal('0.00'), 0))
+        self.assertEqual(self.totals(self.buyer), (Decimal('0.00'), 0, Decimal('0.00'), 0))
+        expected = snapshot()
+        rebuild_ledgers()
+        self.assertEqual(snapshot(), [row for row in expected if any(row[2:])])
+    
+    def test_deleting_sold_items_updates_ledgers(self):
+        """Test purchases deleted with their item, singly or in a batch, leave the ledgers rebuilt-equal."""
+        self.trade_every_way()
+        self.client.force_login(self.seller)
+        self.client.post(reverse('item_delete', args=[self.items[0].pk]))
+        batch_delete(self.items[0].collection, [self.items[1].pk, self.items[2].pk])
+        self.assertEqual(self.totals(self.seller), (Decimal('0.00'), 0, Decimal('7.00'), 1))
+        self.assertEqual(self.totals(self.buyer), (Decimal('7.00'), 1, Decimal('0.00'), 0))
+        
+        def snapshot():
+            return sorted(UserLedgerMonth.objects.values_list('user', 'month', 'spent', 'earned', 'sale_count'))
+        
+        expected = snapshot()
+        rebuild_ledgers()
+        self.assertEqual(snapshot(), expected)
+    
+    def test_profile_reads_ledger_rows(self):
+        """Test profile and dashboard stats do not depend on purchase history size."""
+        self.client.post(reverse('item_detail', args=[self.items[0].pk]), {'buy_now': '1'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'Spent €10,00 on 1 purchase')
+        self.assertFalse([q for q in queries if 'items_purchase' in q['sql']])
+        self.assertContains(self.client.get(reverse('home')), 'Spent on 1 purchase')
+        self.client.force_login(self.seller)
+        self.assertContains(self.client.get(reverse('profile')), 'Earned €10,00 from 1 sale')
+
+
+class OfferInboxTest(TestCase):
+    """Test cases for the seller offer inbox and its unread counts."""
+    
+    def setUp(self):
+        """Create a seller with listed items in two collections and three buyers."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.buyers = [User.objects.create_user(username=f'buyer{i}', password='testpass123') for i in range(3)]
+        self.items = []
+        for name in ('Coins', 'Stamps'):
+            collection = Collection.objects.create(owner=self.seller, name=name)
+            self.items += [
+                Item.objects.create(collection=collection, name=f'{name} {i}', value=1, is_for_sale=True, sale_price=20)
+                for i in range(2)
+            ]
+    
+    def offer(self, buyer, item, amount):
+        self.client.force_login(buyer)
+        self.client.post(reverse('item_detail', args=[item.pk]), {'submit_offer': '1', 'offer_amount': amount})
+    
+    def unread(self):
+        return OfferInbox.objects.get(seller=self.seller).unread_count
+    
+    def test_inbox_lists_pending_offers_in_one_query(self):
+        """Test offers on every item are listed with buyer and item in a single query."""
+        for i, buyer in enumerate(self.buyers):
+            for item in self.items:
+                self.offer(buyer, item, 5 + i)
+        self.assertEqual(Offer.objects.filter(seller=self.seller).count(), 12)
+        self.client.force_login(self.seller)
+        url = reverse('offer_inbox_api')
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'limit': 5}).json()
+        offer_queries = [q['sql'] for q in queries if 'FROM "items_offer"' in q['sql']]
+        self.assertEqual(len(offer_queries), 1)
+        self.assertIn('auth_user', offer_queries[0])
+        self.assertEqual(data['unread_count'], 12)
+        self.assertEqual(len(data['results']), 5)
+        seen = [row['id'] for row in data['results']]
+        while data['next_cursor']:
+            data = self.client.get(url, {'limit': 5, 'cursor': data['next_cursor']}).json()
+            seen += [row['id'] for row in data['results']]
+        self.assertEqual(seen, list(Offer.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+        self.assertEqual(self.client.get(url, {'cursor': 'bogus'}).status_code, 400)
+    
+    def test_unread_count_follows_offer_lifecycle(self):
+        """Test arrivals, views, updates and closing offers adjust the unread count."""
+        self.offer(self.buyers[0], self.items[0], 5)
+        self.offer(self.buyers[1], self.items[0], 6)
+        self.offer(self.buyers[2], self.items[1], 7)
+        self.assertEqual(self.unread(), 3)
+        
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('offer_inbox'))
+        self.assertContains(response, '3 new')
+        self.assertEqual(self.unread(), 0)
+        self.assertNotContains(self.client.get(reverse('offer_inbox')), 'New</span>')
+        
+        self.offer(self.buyers[2], self.items[1], 8)
+        self.assertEqual(self.unread(), 1)
+        self.offer(self.buyers[2], self.items[1], 9)
+        self.assertEqual(self.unread(), 1)
+        
+        self.client.force_login(self.seller)
+        offer = Offer.objects.get(buyer=self.buyers[0])
+        self.client.get(reverse('accept_offer', args=[offer.pk]))
+        self.assertEqual(Offer.objects.get(buyer=self.buyers[1]).status, 'rejected')
+        self.assertEqual(self.unread(), 1)
+        
+        self.offer(self.buyers[0], self.items[2], 5)
+        self.assertEqual(self.unread(), 2)
+        self.client.force_login(self.buyers[1])
+        self.client.post(reverse('item_detail', args=[self.items[2].pk]), {'buy_now': '1'})
+        self.assertEqual(Offer.objects.get(item=self.items[2]).status, 'withdrawn')
+        self.assertEqual(self.unread(), 1)
+        
+        Item.objects.filter(pk=self.items[1].pk).delete()
+        self.assertEqual(self.unread(), 0)
+    
+    def test_mark_seen_through_api(self):
+        """Test the API marks only the seller's own offers as seen."""
+        self.offer(self.buyers[0], self.items[0], 5)
+        self.offer(self.buyers[1], self.items[3], 6)
+        other_seller_offer = Offer.objects.create(
+            item=Item.objects.create(
+                collection=Collection.objects.create(owner=self.buyers[2], name='Other'), name='Other item',
+            ),
+            buyer=self.buyers[0], amount=3,
+        )
+        self.assertEqual(other_seller_offer.seller, self.buyers[2])
+        self.client.force_login(self.seller)
+        ids = list(Offer.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            reverse('offer_inbox_api'), json.dumps({'seen': ids}), content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'marked': 2, 'unread_count': 0})
+        self.assertEqual(OfferInbox.objects.get(seller=self.buyers[2]).unread_count, 1)
+        self.assertEqual(
+            self.client.post(reverse('offer_inbox_api'), '[]', content_type='application/json').status_code, 400
+        )
+
+
+class MetricsTest(TestCase):
+    """Test cases for the Prometheus metrics endpoint."""
+    
+    def setUp(self):
+        """Create a live auction, a logged-in bidder and an empty registry."""
+        self.seller = User.objects.create_user(username='seller', password='testpass123')
+        self.bidder = User.objects.create_user(username='bidder', password='testpass123')
+        collection = Collection.objects.create(owner=self.seller, name='Coins')
+        self.item = Item.objects.create(collection=collection, name='Coin', value=5, is_for_sale=True, sale_price=8)
+        self.auction = Auction.objects.create(
+            item=self.item, seller=self.seller, starting_price=1, current_price=1,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+        cache.clear()
+        metrics_registry.reset()
+        self.settings_override = self.settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client.login(username='bidder', password='testpass123')
+    
+    def scrape(self, **extra):
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+    
+    def test_route_counts_latency_and_queries(self):
+        """Test responses are counted and timed per URL name with their queries."""
+        self.client.get(reverse('marketplace'))
+        self.client.get(reverse('marketplace'))
+        self.client.get('/no-such-page/')
+        text = self.scrape()
+        self.assertIn('http_requests_total{route="marketplace",method="GET",status="200"} 2', text)
+        self.assertIn('http_requests_total{route="<unmatched>",method="GET",status="404"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="marketplace",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{route="marketplace"} 2', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        counters, _ = collect()
+        self.assertGreater(counters['db_queries_total', ('marketplace',)], 0)
+    
+    def test_business_and_cache_counters(self):
+        """Test committed bids and purchases and cache lookups are counted."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('auction_detail', args=[self.auction.pk]), {'bid_amount': '5'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('item_detail', args=[self.item.pk]), {'buy_now': '1'})
+        cache.get('metrics-test')
+        cache.set('metrics-test', 1)
+        cache.get('metrics-test')
+        text = self.scrape()
+        self.assertIn('marketplace_bids_total 1', text)
+        self.assertIn('marketplace_purchases_total 1', text)
+        self.assertIn('marketplace_purchase_value_total 8.0', text)
+        counters, _ = collect()
+        self.assertGreaterEqual(counters['cache_requests_total', ('hit',)], 1)
+        self.assertGreaterEqual(counters['cache_requests_total', ('miss',)], 1)
+    
+    async def test_async_stack(self):
+        """Test the middleware runs natively under ASGI and still counts the request."""
+        async def view(request):
+            return HttpResponse('app', status=201)
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        threads = []
+        with self.settings(METRICS_FLUSH_INTERVAL=0):
+            with mock.patch.object(metrics_registry, 'flush', lambda: threads.append(threading.get_ident())):
+                response = await middleware(RequestFactory().post('/no-such-page/'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+        counters, histograms = collect()
+        self.assertEqual(counters['http_requests_total', ('<unmatched>', 'POST', 201)], 1)
+        self.assertEqual(histograms['http_request_duration_seconds', ('<unmatched>',)][-1], 1)
+    
+    def test_sums_snapshots_of_other_processes(self):
+        """Test snapshots flushed by other workers are added to this one's."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('marketplace'))
+            metrics_registry.flush()
+            self.assertTrue(os.path.exists(os.path.join(directory, metrics_registry.file_name())))
+            self.assertTrue(metrics_registry.file_name().startswith(f'{os.getpid()}-'))
+            other = {
+                'counters': [['http_requests_total', ['marketplace', 'GET', 200], 3]],
+                'histograms': [['http_request_duration_seconds', ['marketplace'], [1] + [0] * 11 + [0.004, 1]]],
+            }
+            for name in ('999999-1.json', '999999-2.json'):  # A pid reused by a later worker.
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump(other, f)
+            with open(os.path.join(directory, '999998.json'), 'w') as f:
+                f.write('{"coun')
+            text = self.scrape()
+        self.assertIn('http_requests_total{route="marketplace",method="GET",status="200"} 7', text)
+        self.assertIn('http_request_duration_seconds_count{route="marketplace"} 3', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="marketplace",le="0.005"} 2', text)
+    
+    def test_access_control(self):
+        """Test only allowed addresses or the bearer token can scrape, and no address by default."""
+        forbidden = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.7')
+        self.assertEqual(forbidden.status_code, 403)
+        self.settings_override.disable()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.settings_override.enable()
+        with self.settings(METRICS_TOKEN='s3cret'):
+            self.scrape(REMOTE_ADDR='10.0.0.7', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(
+                self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.7', HTTP_AUTHORIZATION='Bearer x').status_code,
+                403,
+            )
+    
+    def test_label_values_are_escaped(self):
+        """Test quotes, backslashes and newlines in labels are escaped."""
+        text = render_metrics({('http_requests_total', ('a"b\\c\nd', 'GET', 200)): 1}, {})
+        self.assertIn('route="a\\"b\\\\c\\nd"', text)
+
+
+class SamplingProfilerTest(TestCase):
+    """Test cases for the on-demand sampling profiler."""
+    
+    def setUp(self):
+        """Create a staff user, a collection and a temporary profile directory."""
+        self.staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.collection = Collection.objects.create(owner=self.staff, name='Coins')
+        Item.objects.create(collection=self.collection, name='Gold Coin', value=100, is_for_sale=True)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings_override = self.settings(SAMPLING_PROFILER={'dir': self.directory, 'interval': 0.0005})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client.login(username='staff', password='testpass123')
+    
+    def test_staff_request_writes_collapsed_stacks_and_sql_timeline(self):
+        """Test a flagged staff request stores its stacks and queries."""
+        response = self.client.get(reverse('collection_detail', args=[self.collection.pk]), HTTP_X_PROFILE='1')
+        name = response['X-Profile-Id']
+        with open(os.path.join(self.directory, 'requests', f'{name}.json')) as f:
+            meta = json.load(f)
+        self.assertEqual(meta['view'], 'collection_detail')
+        self.assertEqual(meta['status'], 200)
+        self.assertTrue(any('items_item' in query['sql'] for query in meta['queries']))
+        starts = [query['start_ms'] for query in meta['queries']]
+        self.assertEqual(starts, sorted(starts))
+        with open(os.path.join(self.directory, 'requests', f'{name}.collapsed')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in lines), meta['samples'])
+        for line in lines:
+            self.assertRegex(line, r'^[^;]+( \(.+:\d+\))(;[^;]+)* \d+$')
+        
+        listing = self.client.get(reverse('sampled_profiles')).json()['profiles']
+        self.assertEqual([(p['id'], p['kind']) for p in listing], [(name, 'requests')])
+        self.assertNotIn('queries', listing[0])
+        download = self.client.get(reverse('sampled_profile_file', args=['requests', name, 'collapsed']))
+        self.assertEqual(download.status_code, 200)
+    
+    async def test_async_stack_records_sql_timeline(self):
+        """Test async requests are profiled without a stack sampler on the event loop."""
+        async def view(request):
+            await Item.objects.acount()
+            return HttpResponse('app')
+        middleware = SamplingProfilerMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/', HTTP_X_PROFILE='1')
+        request.user = self.staff
+        with mock.patch('config.sampling_profiler.StackSampler') as sampler:
+            response = await middleware(request)
+        sampler.assert_not_called()
+        name = response['X-Profile-Id']
+        with open(os.path.join(self.directory, 'requests', f'{name}.json')) as f:
+            meta = json.load(f)
+        self.assertEqual(meta['samples'], 0)
+        self.assertTrue(any('items_item' in query['sql'] for query in meta['queries']))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'requests', f'{name}.collapsed')))
+    
+    def test_flag_is_ignored_for_other_users(self):
+        """Test the profile flag does nothing for non-staff users."""
+        User.objects.create_user(username='plain', password='testpass123')
+        self.client.login(username='plain', password='testpass123')
+        response = self.client.get(reverse('marketplace') + '?_profile=1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'requests')))
+        self.assertEqual(self.client.get(reverse('sampled_profiles')).status_code, 302)
+    
+    def test_fleet_mode_samples_one_in_n_and_caps_directory(self):
+        """Test fleet sampling profiles every Nth request and keeps the newest."""
+        options = {'dir': self.directory, 'interval': 0.0005, 'sample_rate': 2, 'max_files': 2}
+        with self.settings(SAMPLING_PROFILER=options):
+            for _ in range(8):
+                response = self.client.get(reverse('marketplace'))
+                self.assertFalse(response.has_header('X-Profile-Id'))
+        files = os.listdir(os.path.join(self.directory, 'fleet'))
+        self.assertEqual(len({name.rsplit('.', 1)[0] for name in files}), 2)
+        self.assertEqual(len(files), 4)
+    
+    def test_prune_by_size_removes_oldest(self):
+        """Test the byte cap drops whole profiles, oldest first."""
+        for name in ('20260101T000000-a', '20260102T000000-b', '20260103T000000-c'):
+            for extension in ('collapsed', 'json'):
+                with open(os.path.join(self.directory, f'{name}.{extension}'), 'w') as f:
+                    f.write('x' * 100)
+        prune(self.directory, max_files=10, max_bytes=450)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['20260102T000000-b.collapsed', '20260102T000000-b.json', '20260103T000000-c.collapsed',
+             '20260103T000000-c.json'],
+        )
+
+
+class TrafficCaptureTest(TestCase):
+    """Test cases for recording sanitized traffic."""
+    
+    def setUp(self):
+        """Create a user, an item for sale and a capture directory."""
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        collection = Collection.objects.create(owner=self.user, name='Coins')
+        self.item = Item.objects.create(collection=collection, name='Coin', value=5, is_for_sale=True, sale_price=8)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+    
+    def capture(self, **options):
+        options = {'enabled': True, 'dir': self.directory, **options}
+        self.addCleanup(lambda: capture_handler(
+            self.directory, options.get('max_bytes', 10 * 1024 * 1024), options.get('backup_count', 5),
+        ).close())
+        return self.settings(TRAFFIC_CAPTURE=options)
+    
+    def test_records_sanitized_requests(self):
+        """Test requests are logged with secrets redacted and excluded paths skipped."""
+        with self.capture():
+            self.client.post(reverse('login'), {'username': 'buyer', 'password': 'testpass123'})
+            self.client.get(reverse('marketplace'), {'q': 'coin', 'api_key': 'abc'})
+            self.client.get(reverse('metrics'))
+        entries = load_entries([self.directory])
+        self.assertEqual([entry['route'] for entry in entries], ['login', 'marketplace'])
+        login, search = entries
+        self.assertEqual(login['method'], 'POST')
+        self.assertEqual(login['form'], {'username': ['buyer'], 'password': ['[redacted]']})
+        self.assertEqual(login['user_id'], self.user.pk)
+        self.assertEqual(login['status'], 302)
+        self.assertEqual(search['query'], {'q': ['coin'], 'api_key': ['[redacted]']})
+        self.assertEqual(search['user_id'], self.user.pk)
+        self.assertGreater(search['duration_ms'], 0)
+    
+    async def test_async_stack(self):
+        """Test the middleware runs natively under ASGI and records the request."""
+        async def view(request):
+            return HttpResponse('app')
+        middleware = TrafficCaptureMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().post('/cart/', {'note': 'gift', 'token': 'abc'})
+        request.user = self.user
+        with self.capture():
+            response = await middleware(request)
+        self.assertEqual(response.content, b'app')
+        [entry] = load_entries([self.directory])
+        self.assertEqual(entry['form'], {'note': ['gift'], 'token': ['[redacted]']})
+        self.assertEqual(entry['user_id'], self.user.pk)
+    
+    def test_disabled_by_default(self):
+        """Test nothing is written unless capture is enabled."""
+        with self.settings(TRAFFIC_CAPTURE={'dir': self.directory}):
+            self.client.get(reverse('marketplace'))
+        self.assertEqual(os.listdir(self.directory), [])
+    
+    def test_files_rotate(self):
+        """Test the log rotates past max_bytes, keeping backup_count files."""
+        with self.capture(max_bytes=400, backup_count=2):
+            for _ in range(10):
+                self.client.get(reverse('marketplace'))
+        names = sorted(os.listdir(self.directory))
+        self.assertEqual(names, [f'traffic-{os.getpid()}.jsonl' + suffix for suffix in ('', '.1', '.2')])
+        self.assertLess(len(load_entries([self.directory])), 10)
+    
+    def test_summary_percentiles(self):
+        """Test the replay report counts errors and nearest-rank percentiles per route."""
+        results = [('marketplace', 200, ms / 1000, None) for ms in range(1, 101)]
+        results += [('item_detail', 500, 0.05, None), ('item_detail', None, 0.01, 'refused')]
+        results += [('item_detail', 404, 0.02, None)]
+        report = summarize(results, 2.0)
+        self.assertEqual(report['marketplace']['p50_ms'], 50)
+        self.assertEqual(report['marketplace']['p95_ms'], 95)
+        self.assertEqual(report['marketplace']['p99_ms'], 99)
+        self.assertEqual(report['item_detail']['errors'], 2)
+        self.assertEqual(report['item_detail']['client_errors'], 1)
+        self.assertEqual(report['ALL']['requests'], 103)
+        self.assertEqual(report['ALL']['rps'], 51.5)
+
+
+class ReplayTrafficTest(LiveServerTestCase):
+    """Test cases for replaying captured traffic against a live server."""
+    
+    def setUp(self):
+        """Create a buyer, an item for sale and a capture log that uses them."""
+        self.buyer = User.objects.create_user(username='buyer', password='testpass123')
+        seller = User.objects.create_user(username='seller', password='testpass123')
+        collection = Collection.objects.create(owner=seller, name='Coins')
+        self.item = Item.objects.create(collection=collection, name='Coin', value=5, is_for_sale=True, sale_price=8)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        entries = [
+            {'ts': 1.0, 'route': 'marketplace', 'method': 'GET', 'path': reverse('marketplace'),
+             'query': {'q': ['coin']}, 'user_id': None},
+            {'ts': 1.1, 'route': 'view_cart', 'method': 'GET', 'path': reverse('view_cart'),
+             'query': {}, 'user_id': self.buyer.pk},
+            {'ts': 1.2, 'route': 'add_to_cart', 'method': 'POST', 'path': reverse('add_to_cart', args=[self.item.pk]),
+             'query': {}, 'form': {'csrfmiddlewaretoken': ['[redacted]']}, 'user_id': self.buyer.pk},
+            {'ts': 1.3, 'route': 'view_cart', 'method': 'GET', 'path': reverse('view_cart'),
+             'query': {}, 'user_id': None},
+        ]
+        with open(os.path.join(self.directory, 'traffic-1.jsonl'), 'w') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in entries)
+    
+    def test_replays_as_captured_users(self):
+        """Test captured users get sessions and POSTs pass CSRF checks."""
+        out = io.StringIO()
+        call_command(
+            'replay_traffic', self.directory, base_url=self.live_server_url, concurrency=1, json=True, stdout=out,
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['ALL']['requests'], 4)
+        self.assertEqual(report['ALL']['errors'], 0)
+        self.assertEqual(report['ALL']['client_errors'], 0)
+        self.assertEqual(report['view_cart']['requests'], 2)
+        self.assertTrue(Cart.objects.get(user=self.buyer).items.filter(pk=self.item.pk).exists())
+        self.assertFalse(Session.objects.exists())
+    
+    def test_thread_pool_statuses(self):
+        """Test anonymous redirects are reported rather than followed, and POSTs need a CSRF token."""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results, seconds = replay(load_entries([self.directory]), self.live_server_url, executor)
+        self.assertEqual([status for _, status, _, _ in results], [302, 302, 403, 302])
+        self.assertGreater(seconds, 0)
+
+
+class ItemHistoryTest(TestCase):
+    """Test cases for the compact item change history."""
+    
+    def setUp(self):
+        """Create an owner with one item."""
+        self.user = User.objects.create_user(username='collector', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.user, name='Stamps')
+        self.item = Item.objects.create(collection=self.collection, name='Penny Black', value=100, condition='good')
+        self.client.login(username='collector', password='testpass123')
+    
+    def edit(self, **fields):
+        data = {
+            'name': 'Penny Black', 'description': '', 'value': '100.00', 'condition': 'good',
+            'is_for_sale': '', 'sale_price': '', **fields,
+        }
+        if not data['is_for_sale']:
+            del data['is_for_sale']
+        return self.client.post(reverse('item_update', args=[self.item.pk]), data)
+    
+    def test_encoding_round_trips(self):
+        """Test values survive the compact encoding, which stays small."""
+        values = {'value': Decimal('-12.34'), 'sale_price': None, 'condition': 'poor', 'is_for_sale': True}
+        self.assertEqual(decode(*encode(values)), values)
+        for price in (Decimal('0.00'), Decimal('19.99'), Decimal('-0.50'), Decimal('99999999.99')):
+            self.assertEqual(decode(*encode({'sale_price': price})), {'sale_price': price})
+        mask, data = encode({'sale_price': Decimal('19.99')})
+        self.assertEqual((mask, len(data)), (0b10, 2))
+    
+    def test_receivers_compare_with_values_before_save(self):
+        """Test every receiver sees the loaded values and the next save compares with this one."""
+        seen = []
+        post_save.connect(
+            lambda sender, instance, **kwargs: seen.append(dict(instance._loaded_values)),
+            sender=Item, weak=False, dispatch_uid='loaded_values_spy',
+        )
+        self.addCleanup(post_save.disconnect, sender=Item, dispatch_uid='loaded_values_spy')
+        item = Item.objects.get(pk=self.item.pk)
+        item.value = 150
+        item.is_for_sale = True
+        item.save()
+        self.assertEqual((seen[0]['value'], seen[0]['is_for_sale']), (Decimal('100.00'), False))
+        self.assertEqual((item._loaded_values['value'], item._loaded_values['is_for_sale']), (150, True))
+        item.condition = 'fair'
+        item.save(update_fields=['condition'])
+        self.assertEqual(item_history(item.pk)[-1]['changes'], {'condition': 'fair'})
+        self.assertEqual(CollectionValueSnapshot.objects.get().total_value, Decimal('150.00'))
+    
+    def test_edits_record_only_changed_fields(self):
+        """Test each edit appends the fields it changed and nothing else."""
+        self.edit(value='120.00')
+        self.edit(value='120.00', description='Now with a description')
+        self.edit(value='120.00', is_for_sale='on', sale_price='150')
+        history = item_history(self.item.pk)
+        self.assertEqual([entry['changes'] for entry in history], [
+            {'value': Decimal('100.00'), 'sale_price': None, 'condition': 'good', 'is_for_sale': False},
+            {'value': Decimal('120.00')},
+            {'sale_price': Decimal('150.00'), 'is_for_sale': True},
+        ])
+        self.assertEqual(history[-1]['state'], {
+            'value': Decimal('120.00'), 'sale_price': Decimal('150.00'), 'condition': 'good', 'is_for_sale': True,
+        })
+        response = self.client.get(reverse('item_update', args=[self.item.pk]))
+        self.assertContains(response, 'Change History')
+    
+    def test_limit_decodes_only_the_newest_entries(self):
+        """Test a limited history matches the tail of the full one, states included."""
+        for value in range(101, 106):
+            self.edit(value=str(value))
+        self.edit(value='105', condition='fair')
+        full = item_history(self.item.pk)
+        self.assertEqual(item_history(self.item.pk, limit=3), full[-3:])
+        self.assertEqual(item_history(self.item.pk, limit=50), full)
+        with CaptureQueriesContext(connection) as queries:
+            item_history(self.item.pk, limit=3)
+        self.assertEqual(len(queries), 2)
+    
+    def test_changes_are_inserted_once_per_transaction(self):
+        """Test saves inside batched_changes are written in one INSERT at the end."""
+        other = Item.objects.create(collection=self.collection, name='Inverted Jenny', value=50)
+        items = [Item.objects.get(pk=self.item.pk), Item.objects.get(pk=other.pk)]
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                with batched_changes():
+                    for item in items:
+                        item.sale_price = 10
+                        item.save()
+                    self.assertEqual(ItemChange.objects.filter(is_snapshot=False).count(), 2)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "items_itemchange"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ItemChange.objects.count(), 4)
+    
+    def test_rolled_back_savepoint_drops_its_changes(self):
+        """Test a change saved in a rolled-back savepoint leaves no history."""
+        with transaction.atomic():
+            with batched_changes():
+                try:
+                    with transaction.atomic():
+                        item = Item.objects.get(pk=self.item.pk)
+                        item.value = 1
+                        item.save()
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(len(item_history(self.item.pk)), 1)
+    
+    def test_batch_operations_record_changes(self):
+        """Test bulk edits, repricing and creation are recorded."""
+        other = Item.objects.create(collection=self.collection, name='Inverted Jenny', value=50, sale_price=40)
+        url = reverse('collection_batch', args=[self.collection.pk])
+        for payload in (
+            {'action': 'update', 'item_ids': 'all', 'fields': {'condition': 'fair'}},
+            {'action': 'reprice', 'item_ids': 'all', 'percent': 10},
+            {'action': 'create', 'items': [{'name': 'Blue Mauritius', 'value': '900'}]},
+        ):
+            self.client.post(url, json.dumps(payload), content_type='application/json')
+        self.assertEqual(
+            [entry['changes'] for entry in item_history(other.pk)][1:],
+            [{'condition': 'fair'}, {'sale_price': Decimal('44.00')}],
+        )
+        self.assertEqual([entry['changes'] for entry in item_history(self.item.pk)][1:], [{'condition': 'fair'}])
+        created = Item.objects.get(name='Blue Mauritius')
+        self.assertEqual(item_history(created.pk)[0]['state']['value'], Decimal('900.00'))
+    
+    def test_compaction_folds_old_months_into_snapshots(self):
+        """Test old changes become one snapshot per month with the same final state."""
+        item = Item.objects.get(pk=self.item.pk)
+        for price in (10, 11, 12):
+            item.sale_price = price
+            item.save()
+        old = timezone.now() - timedelta(days=200)
+        ItemChange.objects.filter(item=self.item).update(changed_at=old)
+        item.condition = 'fair'
+        item.save()
+        before = item_history(self.item.pk)
+        
+        removed = compact_history(timezone.now() - timedelta(days=90))
+        after = item_history(self.item.pk)
+        self.assertEqual(removed, 3)
+        self.assertEqual(len(after), 2)
+        self.assertTrue(after[0]['is_snapshot'])
+        self.assertEqual(after[0]['state'], before[3]['state'])
+        self.assertEqual(after[-1]['state'], before[-1]['state'])
+        self.assertEqual(after[-1]['changes'], {'condition': 'fair'})
+        self.assertEqual(compact_history(timezone.now() - timedelta(days=90)), 0)
+
+
+class CollectionArchiveTest(TestCase):
+    """Test cases for streamed and background collection exports."""
+    
+    def setUp(self):
+        """Create a collection with two photographed items and one without an image."""
+        self.media_root = tempfile.mkdtemp()
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        self.settings_override = self.settings(
+            MEDIA_ROOT=self.media_root, COLLECTION_ARCHIVE={'dir': self.archive_dir},
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username='collector', password='testpass123')
+        self.collection = Collection.objects.create(owner=self.user, name='Old Coins')
+        self.photos = {}
+        for seed, name in enumerate(('Denarius', 'Sestertius')):
+            item = Item.objects.create(
+                collection=self.collection, name=name, value=10 + seed,
+                image=SimpleUploadedFile(f'{name}.jpg', photo(seed, size=(400, 300)), content_type='image/jpeg'),
+            )
+            self.photos[item.pk] = photo(seed, size=(400, 300))
+        self.plain = Item.objects.create(collection=self.collection, name='Obol', value=3, description='Tiny, "silver"')
+        self.client.login(username='collector', password='testpass123')
+    
+    def read_zip(self, data):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        return archive
+    
+    def test_small_collection_is_streamed(self):
+        """Test the export streams images and both manifests, outside any transaction."""
+        url = reverse('collection_export', args=[self.collection.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql']])
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('old-coins.zip', response['Content-Disposition'])
+        archive = self.read_zip(b''.join(response.streaming_content))
+        images = sorted(name for name in archive.namelist() if name.startswith('images/'))
+        self.assertEqual(len(images), 2)
+        for name in images:
+            item_id = int(name.split('/')[1].split('-')[0])
+            self.assertEqual(archive.read(name), self.photos[item_id])
+        rows = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual([row['name'] for row in rows], ['Denarius', 'Sestertius', 'Obol'])
+        self.assertEqual(rows[2]['description'], 'Tiny, "silver"')
+        self.assertEqual(rows[2]['image'], '')
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual(manifest['collection']['name'], 'Old Coins')
+        self.assertEqual(sorted(item['image'] for item in manifest['items'] if item['image']), images)
+    
+    def test_chunks_stay_small_and_missing_images_are_skipped(self):
+        """Test no chunk is much larger than CHUNK_SIZE and lost files do not break the export."""
+        first = Item.objects.filter(collection=self.collection).order_by('pk').first()
+        os.remove(os.path.join(self.media_root, first.image.name))
+        with mock.patch('items.archive.CHUNK_SIZE', 4096):
+            chunks = list(archive_chunks(self.collection))
+        self.assertLess(max(len(chunk) for chunk in chunks), 4096 * 2 + 1024)
+        archive = self.read_zip(b''.join(chunks))
+        self.assertEqual(len([name for name in archive.namelist() if name.startswith('images/')]), 1)
+        rows = json.loads(archive.read('manifest.json'))['items']
+        self.assertEqual(rows[0]['image'], '')
+    
+    def test_large_collection_is_built_in_background(self):
+        """Test large exports are queued, built by the outbox worker and downloaded."""
+        with self.settings(COLLECTION_ARCHIVE={'dir': self.archive_dir, 'stream_max_bytes': 1000}):
+            response = self.client.post(reverse('collection_export', args=[self.collection.pk]))
+            self.client.post(reverse('collection_export', args=[self.collection.pk]))
+        self.assertRedirects(response, reverse('collection_detail', args=[self.collection.pk]))
+        archive = CollectionArchive.objects.get()
+        self.assertEqual(archive.status, CollectionArchive.STATUS_PENDING)
+        self.assertEqual(OutboxEvent.objects.filter(topic='collection.archive_requested').count(), 1)
+        self.assertContains(self.client.get(response.url), 'being prepared')
+        
+        self.assertEqual(process_batch(claim_batch()), (1, 0))
+        archive.refresh_from_db()
+        self.assertEqual(archive.status, CollectionArchive.STATUS_READY)
+        download = self.client.get(reverse('collection_archive_download', args=[archive.pk]))
+        data = b''.join(download.streaming_content)
+        self.assertEqual(len(data), archive.size)
+        self.assertIn('manifest.csv', self.read_zip(data).namelist())
+        
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(
+            self.client.get(reverse('collection_archive_download', args=[archive.pk])).status_code, 404
+        )
+    
+    def test_failed_build_is_marked_and_can_be_requested_again(self):
+        """Test a build error leaves no partial file and a stale request does not block a new one."""
+        archive = CollectionArchive.objects.create(collection=self.collection, requested_by=self.user)
+        publish('collection.archive_requested', archive_id=archive.pk)
+        with mock.patch('items.archive.file_chunks', side_effect=OSError('disk full')), self.assertLogs('items.archive'):
+            self.assertEqual(process_batch(claim_batch()), (1, 0))
+        archive.refresh_from_db()
+        self.assertEqual(archive.status, CollectionArchive.STATUS_FAILED)
+        self.assertEqual(os.listdir(self.archive_dir), [])
+        self.assertContains(
+            self.client.get(reverse('collection_detail', args=[self.collection.pk])), 'could not be prepared'
+        )
+        
+        stale = CollectionArchive.objects.create(collection=self.collection, requested_by=self.user)
+        CollectionArchive.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        with self.settings(COLLECTION_ARCHIVE={'dir': self.archive_dir, 'stream_max_bytes': 1000}):
+            self.client.post(reverse('collection_export', args=[self.collection.pk]))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, CollectionArchive.STATUS_FAILED)
+        self.assertEqual(CollectionArchive.objects.filter(status=CollectionArchive.STATUS_PENDING).count(), 1)
+    
+    def test_archive_is_written_outside_the_event_transaction(self):
+        """Test the worker holds no transaction of its own while writing the zip."""
+        archive = CollectionArchive.objects.create(collection=self.collection, requested_by=self.user)
+        publish('collection.archive_requested', archive_id=archive.pk)
+        outer = len(connection.atomic_blocks)
+        depths = []
+        
+        def chunks(name, chunk_size=None):
+            depths.append(len(connection.atomic_blocks))
+            yield b'data'
+        
+        with mock.patch('items.archive.file_chunks', chunks):
+            self.assertEqual(process_batch(claim_batch()), (1, 0))
+        self.assertEqual(set(depths), {outer})
+        archive.refresh_from_db()
+        self.assertEqual(archive.status, CollectionArchive.STATUS_READY)
+    
+    def test_new_archive_replaces_the_previous_one(self):
+        """Test building an archive deletes older ones and their files."""
+        old = CollectionArchive.objects.create(collection=self.collection, requested_by=self.user)
+        new = CollectionArchive.objects.create(collection=self.collection, requested_by=self.user)
+        for archive in (old, new):
+            publish('collection.archive_requested', archive_id=archive.pk)
+        old_path = os.path.join(self.archive_dir, f'collection-{self.collection.pk}-{old.pk}.zip')
+        process_batch(claim_batch())
+        self.assertEqual(list(CollectionArchive.objects.values_list('pk', flat=True)), [new.pk])
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(os.listdir(self.archive_dir), [f'collection-{self.collection.pk}-{new.pk}.zip'])
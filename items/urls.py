@@ -10,14 +10,22 @@ urlpatterns = [
     path('collections/<int:pk>/', views.CollectionDetailView.as_view(), name='collection_detail'),
     path('collections/<int:pk>/update/', views.CollectionUpdateView.as_view(), name='collection_update'),
     path('collections/<int:pk>/delete/', views.CollectionDeleteView.as_view(), name='collection_delete'),
+    path('collections/<int:pk>/export/', views.collection_export, name='collection_export'),
+    path('archives/<int:pk>/download/', views.collection_archive_download, name='collection_archive_download'),
+    path('collections/<int:pk>/value-series/', views.collection_value_series, name='collection_value_series'),
     path('collections/<int:collection_pk>/items/create/', views.ItemCreateView.as_view(), name='item_create'),
+    path('collections/<int:pk>/items/batch/', views.collection_batch, name='collection_batch'),
     path('items/<int:pk>/update/', views.ItemUpdateView.as_view(), name='item_update'),
     path('items/<int:pk>/delete/', views.ItemDeleteView.as_view(), name='item_delete'),
     
     # E-commerce URLs - Shopping Cart & Purchases
     path('marketplace/', views.marketplace, name='marketplace'),
+    path('marketplace/api/', views.marketplace_api, name='marketplace_api'),
     path('items/<int:pk>/', views.item_detail, name='item_detail'),
     path('items/<int:pk>/upload-image/', views.upload_item_image, name='upload_item_image'),
+    path('items/duplicates/', views.duplicate_images, name='duplicate_images'),
+    path('offers/inbox/', views.offer_inbox, name='offer_inbox'),
+    path('offers/inbox/api/', views.offer_inbox_api, name='offer_inbox_api'),
     path('offers/<int:offer_id>/accept/', views.accept_offer, name='accept_offer'),
     path('offers/<int:offer_id>/reject/', views.reject_offer, name='reject_offer'),
     path('cart/', views.view_cart, name='view_cart'),
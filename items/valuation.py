@@ -0,0 +1,197 @@
+"""
+Collection valuation history.
+Maintains daily value snapshots and weekly/monthly rollups incrementally,
+and serves downsampled series without scanning items.
+"""
+
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import CollectionValueRollup, CollectionValueSnapshot, Item
+
+
+_state = threading.local()
+
+
+@contextmanager
+def tracking_paused():
+    """
+    Stop item signals from recording value changes in this thread.
+
+    For bulk operations that record one aggregated change themselves
+    instead of one per item.
+    """
+    previous = getattr(_state, 'paused', False)
+    _state.paused = True
+    try:
+        yield
+    finally:
+        _state.paused = previous
+
+
+def is_tracking_paused():
+    return getattr(_state, 'paused', False)
+
+
+def to_decimal(value):
+    """Coerce a value (possibly an unsaved float) to a 2-place Decimal."""
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def period_start(day, period):
+    """Return the first day of the week (Monday) or month containing day."""
+    if period == CollectionValueRollup.PERIOD_WEEK:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def live_totals(collection_id):
+    """Sum the collection's items. Only used to seed the first snapshot."""
+    totals = Item.objects.filter(collection_id=collection_id).aggregate(
+        total=Sum('value'), count=Count('id')
+    )
+    return to_decimal(totals['total']), totals['count']
+
+
+@transaction.atomic
+def record_value_change(collection_id, value_delta, count_delta=0, day=None):
+    """
+    Apply a change in total value to today's snapshot and its rollups.
+
+    Must be called after the item row is written: when the collection has
+    no snapshot yet, the first one is seeded from the live totals, which
+    already include the change.
+    """
+    day = day or timezone.localdate()
+    value_delta = to_decimal(value_delta)
+    snapshot = (
+        CollectionValueSnapshot.objects.select_for_update()
+        .filter(collection_id=collection_id, date__lte=day)
+        .order_by('-date')
+        .first()
+    )
+    if snapshot is None:
+        new_total, new_count = live_totals(collection_id)
+        old_total = new_total - value_delta
+        snapshot = CollectionValueSnapshot(collection_id=collection_id, date=day)
+    else:
+        old_total = snapshot.total_value
+        new_total = old_total + value_delta
+        new_count = max(snapshot.item_count + count_delta, 0)
+        if snapshot.date != day:
+            snapshot = CollectionValueSnapshot(collection_id=collection_id, date=day)
+    snapshot.total_value = new_total
+    snapshot.item_count = new_count
+    snapshot.save()
+
+    for period in (CollectionValueRollup.PERIOD_WEEK, CollectionValueRollup.PERIOD_MONTH):
+        update_rollup(collection_id, period, period_start(day, period), old_total, new_total)
+    return snapshot
+
+
+def update_rollup(collection_id, period, start, old_total, new_total):
+    """Fold a value change into the rollup for one period."""
+    rollup, created = CollectionValueRollup.objects.get_or_create(
+        collection_id=collection_id,
+        period=period,
+        period_start=start,
+        defaults={
+            'open_value': old_total,
+            'close_value': new_total,
+            'min_value': min(old_total, new_total),
+            'max_value': max(old_total, new_total),
+        }
+    )
+    if not created:
+        rollup.close_value = new_total
+        rollup.min_value = min(rollup.min_value, new_total)
+        rollup.max_value = max(rollup.max_value, new_total)
+        rollup.save(update_fields=['close_value', 'min_value', 'max_value'])
+
+
+@transaction.atomic
+def rebuild_today(collection_id):
+    """Resync today's snapshot from the live totals (after bulk updates)."""
+    day = timezone.localdate()
+    total, count = live_totals(collection_id)
+    previous = (
+        CollectionValueSnapshot.objects.filter(collection_id=collection_id, date__lte=day)
+        .order_by('-date')
+        .first()
+    )
+    old_total = previous.total_value if previous else total
+    if previous is not None and previous.total_value == total and previous.item_count == count:
+        return previous
+    snapshot, _ = CollectionValueSnapshot.objects.update_or_create(
+        collection_id=collection_id, date=day,
+        defaults={'total_value': total, 'item_count': count}
+    )
+    for period in (CollectionValueRollup.PERIOD_WEEK, CollectionValueRollup.PERIOD_MONTH):
+        update_rollup(collection_id, period, period_start(day, period), old_total, total)
+    return snapshot
+
+
+def choose_resolution(start, end, max_points):
+    """Pick the finest resolution that fits the range in max_points."""
+    days = (end - start).days + 1
+    if days <= max_points:
+        return 'day'
+    if days / 7 <= max_points:
+        return CollectionValueRollup.PERIOD_WEEK
+    return CollectionValueRollup.PERIOD_MONTH
+
+
+def value_series(collection_id, start, end, max_points=200):
+    """
+    Return a downsampled value series for a collection between two dates.
+
+    Daily snapshots are used for short ranges and the precomputed rollups
+    for longer ones, so the cost depends on the number of points returned,
+    never on the number of items. Snapshots are sparse: a value holds until
+    the next point, starting from 'start_value'.
+    """
+    resolution = choose_resolution(start, end, max_points)
+    before = (
+        CollectionValueSnapshot.objects.filter(collection_id=collection_id, date__lt=start)
+        .order_by('-date')
+        .values_list('total_value', flat=True)
+        .first()
+    )
+
+    if resolution == 'day':
+        rows = CollectionValueSnapshot.objects.filter(
+            collection_id=collection_id, date__range=(start, end)
+        ).values_list('date', 'total_value', 'total_value', 'total_value')
+    else:
+        rows = CollectionValueRollup.objects.filter(
+            collection_id=collection_id,
+            period=resolution,
+            period_start__range=(period_start(start, resolution), end),
+        ).values_list('period_start', 'close_value', 'min_value', 'max_value')
+
+    points = [
+        {'date': day.isoformat(), 'value': str(value), 'min': str(low), 'max': str(high)}
+        for day, value, low, high in rows
+    ]
+    # Monthly rollups over very long ranges can still exceed max_points.
+    if len(points) > max_points:
+        step = -(-len(points) // max_points)
+        sampled = points[::step]
+        if sampled[-1] is not points[-1]:
+            sampled.append(points[-1])
+        points = sampled
+
+    return {
+        'collection': collection_id,
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'start_value': str(before) if before is not None else None,
+        'points': points,
+    }
@@ -3,16 +3,44 @@ Views for the items application.
 Handles displaying and managing collections and items.
 """
 
+import json
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.contrib import messages
 from django.utils import timezone
-from .models import Collection, Item, Purchase, Auction, Bid, Cart, Offer
+from django.utils.text import slugify
+from .models import Collection, CollectionArchive, Item, Purchase, Auction, ProxyBid, Cart, Offer, SimilarItem
 from .forms import CollectionForm, ItemForm
+from .archive import archive_chunks, archive_path, pending_archive, should_stream
+from .db import atomic_view
+from .history import item_history
+from .async_helpers import aget_object_or_404, arender, async_login_required
+from .valuation import value_series
+from .analytics import market_range
+from .facets import apply_filters, facet_counts, normalize_query, search_filter
+from .cleanup import soft_delete_collection
+from .duplicates import MAX_DISTANCE, duplicate_pairs, find_duplicates
+from .ledger import ledger_for, record_purchase
+from .offers import OFFERS_PER_PAGE, close_offers, inbox_page, make_offer, mark_seen, unread_count
+from .bidding import BidError, place_bid, set_proxy_bid
+from .outbox import publish
+from .ratelimit import rate_limit
+from .batch import BatchError, batch_create, batch_delete, batch_reprice, batch_update
+from .pagination import InvalidCursor, encode_cursor, keyset_filter, keyset_ordering, keyset_page
 
 
 class CollectionListView(LoginRequiredMixin, ListView):
@@ -34,6 +62,102 @@ class CollectionDetailView(LoginRequiredMixin, DetailView):
     
     def get_queryset(self):
         return Collection.objects.filter(owner=self.request.user)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['archives'] = self.object.archives.all()[:3]
+        return context
+
+
+@atomic_view
+def queue_collection_archive(request, collection):
+    """Request a background archive of the collection unless one is being built."""
+    if pending_archive(collection) is None:
+        archive = CollectionArchive.objects.create(collection=collection, requested_by=request.user)
+        publish('collection.archive_requested', archive_id=archive.pk)
+
+
+@login_required
+@require_POST
+def collection_export(request, pk):
+    """Stream a zip of the collection, or queue it when it is too large to stream."""
+    collection = get_object_or_404(Collection.objects.select_related('owner'), pk=pk, owner=request.user)
+    # Sizing reads every image's size: done outside any write transaction.
+    if should_stream(collection):
+        response = StreamingHttpResponse(archive_chunks(collection), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{slugify(collection.name) or "collection"}.zip"'
+        return response
+    queue_collection_archive(request, collection)
+    messages.info(request, 'This collection is large: its archive is being prepared and will be listed here.')
+    return redirect('collection_detail', pk=pk)
+
+
+@login_required
+def collection_archive_download(request, pk):
+    """Send a prepared collection archive."""
+    archive = get_object_or_404(
+        CollectionArchive, pk=pk, collection__owner=request.user, status=CollectionArchive.STATUS_READY,
+    )
+    try:
+        f = open(archive_path(archive), 'rb')
+    except FileNotFoundError:
+        raise Http404('Archive file not found.')
+    return FileResponse(
+        f, as_attachment=True, filename=f'{slugify(archive.collection.name) or "collection"}.zip',
+        content_type='application/zip',
+    )
+
+
+@login_required
+def collection_value_series(request, pk):
+    """Return a collection's value history as JSON for charts."""
+    collection = get_object_or_404(Collection, pk=pk, owner=request.user)
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=365)
+        max_points = min(max(int(request.GET.get('points', 200)), 2), 1000)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start, end or points parameter.'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end.'}, status=400)
+    return JsonResponse(value_series(collection.pk, start, end, max_points))
+
+
+BATCH_ACTIONS = ('create', 'update', 'reprice', 'delete')
+
+
+@login_required
+@require_POST
+@atomic_view
+def collection_batch(request, pk):
+    """
+    Create, update, reprice or delete many items of a collection at once.
+
+    Takes a JSON body with an 'action' and its arguments; with
+    "preview": true it only returns how many items would be affected.
+    """
+    collection = get_object_or_404(Collection, pk=pk, owner=request.user)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    if not isinstance(data, dict) or data.get('action') not in BATCH_ACTIONS:
+        return JsonResponse({'error': f"action must be one of: {', '.join(BATCH_ACTIONS)}."}, status=400)
+    
+    action = data['action']
+    preview = bool(data.get('preview'))
+    try:
+        if action == 'create':
+            count = batch_create(collection, data.get('items'), preview)
+        elif action == 'update':
+            count = batch_update(collection, data.get('item_ids'), data.get('fields'), preview)
+        elif action == 'reprice':
+            count = batch_reprice(collection, data.get('item_ids'), data.get('percent'), preview)
+        else:
+            count = batch_delete(collection, data.get('item_ids'), preview)
+    except BatchError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'action': action, 'preview': preview, 'count': count})
 
 
 class CollectionCreateView(LoginRequiredMixin, CreateView):
@@ -62,15 +186,20 @@ class CollectionUpdateView(LoginRequiredMixin, UpdateView):
 
 
 class CollectionDeleteView(LoginRequiredMixin, DeleteView):
-    """Delete a collection."""
+    """Delete a collection (its contents are purged in the background)."""
     model = Collection
     template_name = 'items/collection_confirm_delete.html'
     success_url = reverse_lazy('collection_list')
     
     def get_queryset(self):
         return Collection.objects.filter(owner=self.request.user)
+    
+    def form_valid(self, form):
+        soft_delete_collection(self.object)
+        return redirect(self.get_success_url())
 
 
+@method_decorator(atomic_view, name='post')
 class ItemCreateView(LoginRequiredMixin, CreateView):
     """Create a new item in a collection."""
     model = Item
@@ -95,9 +224,11 @@ class ItemCreateView(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['collection'] = self.collection
+        context['market'] = market_range()
         return context
 
 
+@method_decorator(atomic_view, name='post')
 class ItemUpdateView(LoginRequiredMixin, UpdateView):
     """Update an existing item."""
     model = Item
@@ -113,6 +244,8 @@ class ItemUpdateView(LoginRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['collection'] = self.object.collection
+        context['market'] = market_range(self.object.condition, self.object.name)
+        context['history'] = item_history(self.object.pk, limit=20)[::-1]
         return context
 
 
@@ -137,52 +270,187 @@ def home(request):
         'recent_collections': collections[:5],
         'total_items': sum(c.get_item_count() for c in collections),
         'total_value': sum(c.get_total_value() for c in collections),
+        'ledger': ledger_for(request.user),
     }
     return render(request, 'items/home.html', context)
 
 
 # E-commerce Views
 
-@login_required
-def marketplace(request):
+@async_login_required
+async def marketplace(request):
     """Display all items for sale from all users."""
-    items_for_sale = Item.objects.filter(is_for_sale=True).order_by('-updated_at')
+    items_for_sale = Item.objects.filter(is_for_sale=True).select_related('collection__owner')
     
     # Search functionality
     search_query = request.GET.get('q', '')
-    if search_query:
-        items_for_sale = items_for_sale.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query) |
-            Q(collection__name__icontains=search_query)
-        )
+    normalized_query = normalize_query(search_query)
+    if normalized_query:
+        items_for_sale = items_for_sale.filter(search_filter(normalized_query))
     
-    # Filter by condition
+    # Filter by condition, price range, image and offers
     condition_filter = request.GET.get('condition', '')
-    if condition_filter:
-        items_for_sale = items_for_sale.filter(condition=condition_filter)
+    items_for_sale = apply_filters(items_for_sale, request.GET)
     
     # Sort options
     sort_by = request.GET.get('sort', '-updated_at')
     items_for_sale = items_for_sale.order_by(sort_by)
     
     # Add offer count to each item
-    for item in items_for_sale:
-        item.offer_count = item.offers.filter(status__in=['pending', 'accepted']).count()
+    items_for_sale = items_for_sale.annotate(
+        offer_count=Count('offers', filter=Q(offers__status__in=['pending', 'accepted']))
+    )
     
     context = {
-        'items': items_for_sale,
+        'items': [item async for item in items_for_sale],
         'search_query': search_query,
         'condition_filter': condition_filter,
+        'price_filter': request.GET.get('price', ''),
+        'has_image_filter': request.GET.get('has_image') == '1',
+        'has_offers_filter': request.GET.get('has_offers') == '1',
         'sort_by': sort_by,
         'conditions': ['excellent', 'good', 'fair', 'poor'],
+        'facets': await sync_to_async(facet_counts)(normalized_query),
     }
-    return render(request, 'items/marketplace.html', context)
+    return await arender(request, 'items/marketplace.html', context)
+
+
+# Fields clients may request from marketplace_api, mapped to ORM lookups.
+MARKETPLACE_API_FIELDS = {
+    'id': 'pk',
+    'name': 'name',
+    'description': 'description',
+    'condition': 'condition',
+    'value': 'value',
+    'sale_price': 'sale_price',
+    'collection': 'collection__name',
+    'seller': 'collection__owner__username',
+    'updated_at': 'updated_at',
+    'thumb': 'image',
+}
+MARKETPLACE_API_DEFAULT_FIELDS = ['id', 'name', 'sale_price', 'condition', 'thumb']
+MARKETPLACE_API_SORTS = {
+    '-updated_at': ('updated_at', True),
+    'sale_price': ('sale_price', False),
+    '-sale_price': ('sale_price', True),
+    'name': ('name', False),
+}
 
 
 @login_required
-def item_detail(request, pk):
+@gzip_page
+def marketplace_api(request):
+    """
+    Return a page of marketplace listings as JSON for infinite scroll.
+
+    Accepts the marketplace filters plus ?fields= (sparse fieldset),
+    ?limit= and ?cursor= (the next_cursor of the previous page).
+    """
+    fields = [f for f in request.GET.get('fields', '').split(',') if f] or MARKETPLACE_API_DEFAULT_FIELDS
+    unknown = [f for f in fields if f not in MARKETPLACE_API_FIELDS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown field(s): {', '.join(unknown)}."}, status=400)
+    sort_by = request.GET.get('sort', '-updated_at')
+    if sort_by not in MARKETPLACE_API_SORTS:
+        return JsonResponse({'error': f'Unknown sort: {sort_by}.'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 24)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+    
+    sort_field, descending = MARKETPLACE_API_SORTS[sort_by]
+    listings = Item.objects.filter(is_for_sale=True, **{f'{sort_field}__isnull': False})
+    search_query = normalize_query(request.GET.get('q', ''))
+    if search_query:
+        listings = listings.filter(search_filter(search_query))
+    listings = apply_filters(listings, request.GET)
+    if request.GET.get('cursor'):
+        try:
+            listings = listings.filter(keyset_filter(Item, sort_field, descending, request.GET['cursor']))
+        except InvalidCursor as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+    
+    lookups = {MARKETPLACE_API_FIELDS[f] for f in fields} | {'pk', sort_field}
+    rows = list(
+        listings.order_by(*keyset_ordering(sort_field, descending)).values(*lookups)[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    results = []
+    for row in rows:
+        result = {f: row[MARKETPLACE_API_FIELDS[f]] for f in fields}
+        if 'thumb' in result:
+            result['thumb'] = default_storage.url(result['thumb']) if result['thumb'] else None
+        results.append(result)
+    
+    return JsonResponse({
+        'results': results,
+        'next_cursor': encode_cursor(rows[-1][sort_field], rows[-1]['pk']) if has_more else None,
+    })
+
+
+def complete_purchase(purchase):
+    """Add a completed purchase to the ledgers and the outbox, in the current transaction."""
+    record_purchase(purchase)
+    publish(
+        'purchase.completed', purchase_id=purchase.pk, item_id=purchase.item_id,
+        buyer_id=purchase.buyer_id, price=purchase.price_paid,
+    )
+
+
+def similar_items(item_id):
+    """
+    Return the item's precomputed neighbours still for sale, best first.
+
+    One range scan of the (item, -score) index joined to the neighbours;
+    the rows are built by items.similarity.
+    """
+    return (
+        SimilarItem.objects.filter(item_id=item_id, similar__is_for_sale=True)
+        .select_related('similar').order_by('-score')
+    )
+
+
+@rate_limit('item_post', methods=('POST',))
+@async_login_required
+async def item_detail(request, pk):
     """Display detailed view of an item with purchase and offer options."""
+    if request.method == 'POST':
+        return await sync_to_async(_item_detail_post)(request, pk)
+    
+    item = await aget_object_or_404(
+        Item.objects.select_related('collection__owner'), pk=pk, is_for_sale=True
+    )
+    offers = [
+        offer async for offer in
+        item.offers.select_related('buyer').order_by('-created_at')
+    ]
+    owner = item.collection.owner
+    user_offer = None
+    
+    # Get user's offer if exists
+    if request.user != owner:
+        user_offer = next(
+            (offer for offer in offers if offer.buyer_id == request.user.pk and offer.status == 'pending'),
+            None
+        )
+    
+    context = {
+        'item': item,
+        'offers': offers,
+        'user_offer': user_offer,
+        'owner': owner,
+        'is_owner': request.user == owner,
+        'market': await sync_to_async(market_range)(item.condition, item.name),
+        'similar_items': [neighbour async for neighbour in similar_items(pk)],
+    }
+    return await arender(request, 'items/item_detail.html', context)
+
+
+@atomic_view
+def _item_detail_post(request, pk):
+    """Handle buy-now and offer submissions for item_detail."""
     item = get_object_or_404(Item, pk=pk, is_for_sale=True)
     offers = item.offers.all().order_by('-created_at')
     user_offer = None
@@ -200,16 +468,18 @@ def item_detail(request, pk):
             purchase = Purchase.objects.create(
                 item=item,
                 buyer=request.user,
+                seller_id=item.collection.owner_id,
                 price_paid=item.sale_price,
                 status='completed'
             )
+            complete_purchase(purchase)
             
             # Mark item as not for sale
             item.is_for_sale = False
             item.save()
             
             # Reject all pending offers
-            item.offers.filter(status='pending').update(status='withdrawn')
+            close_offers(item.offers.all(), 'withdrawn')
             
             messages.success(request, f'Purchase successful! You bought {item.name} for ${item.sale_price}')
             return redirect('purchase_history')
@@ -227,23 +497,11 @@ def item_detail(request, pk):
                 if amount <= 0:
                     messages.error(request, 'Offer amount must be greater than 0.')
                 else:
-                    # Check if user already has pending offer
-                    existing_offer = item.offers.filter(buyer=request.user, status='pending').first()
-                    if existing_offer:
-                        # Update existing offer
-                        existing_offer.amount = amount
-                        existing_offer.message = message
-                        existing_offer.save()
-                        messages.success(request, 'Your offer has been updated!')
-                    else:
-                        # Create new offer
-                        Offer.objects.create(
-                            item=item,
-                            buyer=request.user,
-                            amount=amount,
-                            message=message
-                        )
+                    offer, created = make_offer(item, request.user, amount, message)
+                    if created:
                         messages.success(request, 'Your offer has been submitted!')
+                    else:
+                        messages.success(request, 'Your offer has been updated!')
                     return redirect('item_detail', pk=pk)
             except ValueError:
                 messages.error(request, 'Please enter a valid amount.')
@@ -254,11 +512,14 @@ def item_detail(request, pk):
         'user_offer': user_offer,
         'owner': item.collection.owner,
         'is_owner': request.user == item.collection.owner,
+        'market': market_range(item.condition, item.name),
+        'similar_items': list(similar_items(pk)),
     }
     return render(request, 'items/item_detail.html', context)
 
 
 @login_required
+@atomic_view(methods=('POST',))
 def upload_item_image(request, pk):
     """Upload or update image for an item."""
     item = get_object_or_404(Item, pk=pk, collection__owner=request.user)
@@ -273,7 +534,45 @@ def upload_item_image(request, pk):
     return render(request, 'items/upload_image.html', context)
 
 
+@staff_member_required
+def duplicate_images(request):
+    """
+    List items with near-duplicate images as JSON.
+
+    With ?item=<pk> only that item's duplicates are listed; max_distance
+    (at most MAX_DISTANCE bits) and limit narrow the result.
+    """
+    try:
+        max_distance = min(int(request.GET.get('max_distance', MAX_DISTANCE)), MAX_DISTANCE)
+        limit = int(request.GET.get('limit', 100))
+        item_id = int(request.GET['item']) if 'item' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameter.'}, status=400)
+    
+    if item_id is not None:
+        item = get_object_or_404(Item.objects.only('image_hash'), pk=item_id)
+        pairs = [
+            (item_id, other_id, bits)
+            for other_id, bits in find_duplicates(item.image_hash, max_distance, exclude=item_id)[:limit]
+        ]
+    else:
+        pairs = duplicate_pairs(max_distance, limit)
+    
+    ids = {item_id for pair in pairs for item_id in pair[:2]}
+    items = Item.objects.select_related('collection').in_bulk(ids)
+    
+    def describe(pk):
+        item = items[pk]
+        return {'id': pk, 'name': item.name, 'collection': item.collection.name, 'owner_id': item.collection.owner_id}
+    
+    return JsonResponse({'duplicates': [
+        {'item': describe(a), 'duplicate': describe(b), 'distance': bits}
+        for a, b, bits in pairs if a in items and b in items
+    ]})
+
+
 @login_required
+@atomic_view
 def accept_offer(request, offer_id):
     """Owner accepts an offer."""
     offer = get_object_or_404(Offer, id=offer_id)
@@ -284,19 +583,22 @@ def accept_offer(request, offer_id):
         return redirect('home')
     
     # Reject all other pending offers
-    offer.item.offers.filter(status='pending').exclude(id=offer_id).update(status='rejected')
+    close_offers(offer.item.offers.exclude(id=offer_id), 'rejected')
     
     # Accept this offer
+    close_offers(Offer.objects.filter(pk=offer.pk), 'accepted')
     offer.status = 'accepted'
-    offer.save()
     
     # Create a purchase record
-    Purchase.objects.create(
+    purchase = Purchase.objects.create(
         item=offer.item,
         buyer=offer.buyer,
+        seller_id=offer.item.collection.owner_id,
         price_paid=offer.amount,
         status='completed'
     )
+    publish('offer.accepted', offer_id=offer.pk, item_id=offer.item_id, buyer_id=offer.buyer_id, amount=offer.amount)
+    complete_purchase(purchase)
     
     # Mark item as not for sale
     offer.item.is_for_sale = False
@@ -307,6 +609,7 @@ def accept_offer(request, offer_id):
 
 
 @login_required
+@atomic_view
 def reject_offer(request, offer_id):
     """Owner rejects an offer."""
     offer = get_object_or_404(Offer, id=offer_id)
@@ -316,14 +619,78 @@ def reject_offer(request, offer_id):
         messages.error(request, 'You do not have permission to reject this offer.')
         return redirect('home')
     
-    offer.status = 'rejected'
-    offer.save()
+    close_offers(Offer.objects.filter(pk=offer.pk), 'rejected')
     
     messages.info(request, f'Offer from {offer.buyer.username} rejected.')
     return redirect('item_detail', pk=offer.item.pk)
 
 
+def offer_json(offer):
+    return {
+        'id': offer.pk,
+        'amount': offer.amount,
+        'message': offer.message,
+        'created_at': offer.created_at.isoformat(),
+        'unread': offer.seen_at is None,
+        'item': {'id': offer.item_id, 'name': offer.item.name, 'sale_price': offer.item.sale_price},
+        'buyer': {'id': offer.buyer_id, 'username': offer.buyer.username},
+    }
+
+
 @login_required
+@atomic_view
+def offer_inbox(request):
+    """Display a page of pending offers on all of the user's items, newest first."""
+    try:
+        offers, next_cursor = inbox_page(request.user, request.GET.get('cursor'))
+    except InvalidCursor:
+        return redirect('offer_inbox')
+    # Offers are seen once shown; the page still highlights the ones that were new.
+    new_ids = {offer.pk for offer in offers if offer.seen_at is None}
+    mark_seen(request.user, new_ids)
+    context = {
+        'offers': offers,
+        'new_ids': new_ids,
+        'unread_count': unread_count(request.user),
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+    }
+    return render(request, 'items/offer_inbox.html', context)
+
+
+@login_required
+@atomic_view(methods=('POST',))
+def offer_inbox_api(request):
+    """
+    Return a page of the user's pending offers as JSON, newest first.
+
+    Accepts ?cursor= and ?limit=. POST a JSON body {"seen": [offer ids]}
+    to mark offers as seen.
+    """
+    if request.method == 'POST':
+        try:
+            seen = json.loads(request.body).get('seen')
+            offer_ids = [int(offer_id) for offer_id in seen]
+        except (AttributeError, TypeError, ValueError):
+            return JsonResponse({'error': 'Body must be {"seen": [offer ids]}.'}, status=400)
+        marked = mark_seen(request.user, offer_ids)
+        return JsonResponse({'marked': marked, 'unread_count': unread_count(request.user)})
+    
+    try:
+        limit = max(1, min(int(request.GET.get('limit', OFFERS_PER_PAGE)), 100))
+        offers, next_cursor = inbox_page(request.user, request.GET.get('cursor'), limit)
+    except (InvalidCursor, ValueError):
+        return JsonResponse({'error': 'Invalid cursor or limit.'}, status=400)
+    return JsonResponse({
+        'unread_count': unread_count(request.user),
+        'results': [offer_json(offer) for offer in offers],
+        'next_cursor': next_cursor,
+    }, encoder=DjangoJSONEncoder)
+
+
+@rate_limit('add_to_cart')
+@login_required
+@atomic_view
 def add_to_cart(request, pk):
     """Add an item to the user's shopping cart."""
     item = get_object_or_404(Item, pk=pk, is_for_sale=True)
@@ -345,6 +712,7 @@ def view_cart(request):
 
 
 @login_required
+@atomic_view
 def remove_from_cart(request, pk):
     """Remove an item from the user's shopping cart."""
     cart = get_object_or_404(Cart, user=request.user)
@@ -354,20 +722,23 @@ def remove_from_cart(request, pk):
 
 
 @login_required
+@atomic_view(methods=('POST',))
 def checkout(request):
     """Process purchase of items in cart."""
     cart = get_object_or_404(Cart, user=request.user)
     
     if request.method == 'POST':
         # Create purchase records for each item
-        for item in cart.items.all():
+        for item in cart.items.select_related('collection'):
             if item.is_for_sale and item.sale_price:
-                Purchase.objects.create(
+                purchase = Purchase.objects.create(
                     item=item,
                     buyer=request.user,
+                    seller_id=item.collection.owner_id,
                     price_paid=item.sale_price,
                     status='completed'
                 )
+                complete_purchase(purchase)
         # Clear the cart
         cart.items.clear()
         return redirect('purchase_success')
@@ -389,19 +760,22 @@ def purchase_success(request):
     return render(request, 'items/purchase_success.html', context)
 
 
-@login_required
-def purchase_history(request):
+@async_login_required
+async def purchase_history(request):
     """Display user's purchase history."""
-    purchases = Purchase.objects.filter(buyer=request.user).order_by('-purchase_date')
+    purchases = Purchase.objects.filter(buyer=request.user).select_related(
+        'item__collection'
+    ).order_by('-purchase_date')
     context = {
-        'purchases': purchases,
+        'purchases': [purchase async for purchase in purchases],
     }
-    return render(request, 'items/purchase_history.html', context)
+    return await arender(request, 'items/purchase_history.html', context)
 
 
 # Auction Views
 
 @login_required
+@atomic_view(methods=('POST',))
 def create_auction(request, pk):
     """Create an auction for an item."""
     item = get_object_or_404(Item, pk=pk, collection__owner=request.user)
@@ -430,39 +804,71 @@ def create_auction(request, pk):
     return render(request, 'items/create_auction.html', context)
 
 
-@login_required
-def auction_list(request):
-    """Display list of active auctions."""
-    auctions = Auction.objects.filter(status='active').order_by('-start_date')
+# ?sort= values of the auction list: (keyset field, descending)
+AUCTION_SORTS = {
+    'newest': ('start_date', True),
+    'ending': ('end_date', False),
+}
+AUCTIONS_PER_PAGE = 24
+BIDS_PER_PAGE = 20
+
+
+@async_login_required
+async def auction_list(request):
+    """Display a page of live auctions, newest or ending soonest first."""
+    sort_by = request.GET.get('sort', 'newest')
+    if sort_by not in AUCTION_SORTS:
+        sort_by = 'newest'
+    sort_field, descending = AUCTION_SORTS[sort_by]
+    auctions = Auction.objects.live().select_related('item__collection', 'seller', 'highest_bidder')
+    try:
+        page, next_cursor = await sync_to_async(keyset_page)(
+            auctions, sort_field, descending, request.GET.get('cursor'), AUCTIONS_PER_PAGE
+        )
+    except InvalidCursor:
+        return redirect(f"{reverse('auction_list')}?sort={sort_by}")
     context = {
-        'auctions': auctions,
+        'auctions': page,
+        'sort': sort_by,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
-    return render(request, 'items/auction_list.html', context)
+    return await arender(request, 'items/auction_list.html', context)
 
 
+@rate_limit('bid', methods=('POST',))
 @login_required
+@atomic_view(methods=('POST',))
 def auction_detail(request, pk):
-    """Display details of a specific auction."""
-    auction = get_object_or_404(Auction, pk=pk)
+    """Display an auction with a page of its bid history and accept bids."""
+    auction = get_object_or_404(
+        Auction.objects.select_related('item__collection', 'seller', 'highest_bidder'), pk=pk
+    )
     
-    if request.method == 'POST' and auction.is_active():
-        bid_amount = request.POST.get('bid_amount')
-        
-        if float(bid_amount) > auction.current_price:
-            Bid.objects.create(
-                auction=auction,
-                bidder=request.user,
-                amount=bid_amount
-            )
-            auction.current_price = bid_amount
-            auction.highest_bidder = request.user
-            auction.save()
-            return redirect('auction_detail', pk=auction.pk)
+    if request.method == 'POST':
+        try:
+            if 'max_amount' in request.POST:
+                set_proxy_bid(auction, request.user, request.POST['max_amount'])
+                messages.success(request, 'We will bid for you up to your maximum.')
+            else:
+                place_bid(auction, request.user, request.POST.get('bid_amount'))
+        except BidError as exc:
+            messages.error(request, str(exc))
+        return redirect('auction_detail', pk=auction.pk)
     
-    bids = auction.bids.all().order_by('-bid_date')
+    try:
+        bids, next_cursor = keyset_page(
+            auction.bids.select_related('bidder'), 'bid_date', True, request.GET.get('cursor'), BIDS_PER_PAGE
+        )
+    except InvalidCursor:
+        return redirect('auction_detail', pk=auction.pk)
     context = {
         'auction': auction,
         'bids': bids,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'proxy_max': ProxyBid.objects.filter(auction=auction, bidder=request.user)
+        .values_list('max_amount', flat=True).first(),
         'is_seller': auction.seller == request.user,
         'can_bid': auction.is_active() and auction.seller != request.user,
     }
@@ -471,15 +877,22 @@ def auction_detail(request, pk):
 
 @login_required
 def my_auctions(request):
-    """Display user's auctions."""
-    auctions = Auction.objects.filter(seller=request.user).order_by('-start_date')
+    """Display a page of the user's auctions, newest first."""
+    auctions = Auction.objects.filter(seller=request.user).select_related('item__collection', 'highest_bidder')
+    try:
+        page, next_cursor = keyset_page(auctions, 'start_date', True, request.GET.get('cursor'), AUCTIONS_PER_PAGE)
+    except InvalidCursor:
+        return redirect('my_auctions')
     context = {
-        'auctions': auctions,
+        'auctions': page,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
     }
     return render(request, 'items/my_auctions.html', context)
 
 
 @login_required
+@atomic_view
 def end_auction(request, pk):
     """End an auction and mark as sold if there's a highest bidder."""
     auction = get_object_or_404(Auction, pk=pk, seller=request.user)
@@ -487,14 +900,20 @@ def end_auction(request, pk):
     if auction.highest_bidder:
         auction.status = 'sold'
         # Create purchase record for winning bidder
-        Purchase.objects.create(
+        purchase = Purchase.objects.create(
             item=auction.item,
             buyer=auction.highest_bidder,
+            seller_id=auction.seller_id,
             price_paid=auction.current_price,
             status='completed'
         )
+        complete_purchase(purchase)
     else:
         auction.status = 'ended'
     
     auction.save()
+    publish(
+        'auction.ended', auction_id=auction.pk, item_id=auction.item_id, status=auction.status,
+        winner_id=auction.highest_bidder_id, price=auction.current_price,
+    )
     return redirect('my_auctions')
@@ -11,6 +11,7 @@ from django.views.generic import CreateView
 from django.urls import reverse_lazy
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
+from items.ledger import ledger_for, recent_months
 from .forms import CustomUserCreationForm, UserProfileForm
 
 
@@ -47,7 +48,11 @@ def user_logout(request):
 @login_required
 def profile(request):
     """Display user profile."""
-    context = {'user': request.user}
+    context = {
+        'user': request.user,
+        'ledger': ledger_for(request.user),
+        'ledger_months': recent_months(request.user),
+    }
     return render(request, 'users/profile.html', context)
 
 